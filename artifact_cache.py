@@ -0,0 +1,165 @@
+# filename: artifact_cache.py
+#
+# Cache content-addressed untuk hasil antara pipeline BWA.
+#
+# Kunci cache diturunkan dari SHA-256 isi file EDF ditambah konfigurasi yang
+# memengaruhi hasil (mesin ICA). Rekaman yang diunggah ulang (mis. setelah
+# laporan gagal) memakai kembali file fitur dan hasil analisis (skor + data
+# gambar topoplot/ROC, lihat render_cache.py) tanpa menghitung ulang ICA maupun FFT.
+#
+# Struktur direktori:
+#   <root>/<PIPELINE_VERSION>/<kunci>/features.npy
+#   <root>/<PIPELINE_VERSION>/<kunci>/analysis.json
+#   <root>/<PIPELINE_VERSION>/<kunci>/artifacts/<nama file>
+#
+# PIPELINE_VERSION WAJIB dinaikkan setiap kali ada perubahan yang mengubah
+# fitur, skor, data gambar, atau format entri. Direktori versi lain dihapus saat cache dibuat
+# (startup API/worker), atau manual lewat: python artifact_cache.py --purge
+
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+PIPELINE_VERSION = "2026.10.4"
+
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+# Opsi ICA yang memengaruhi hasil fitur, beserta nilai default-nya (lihat ica_engine.fit_ica)
+_ICA_KEY_DEFAULTS = {'method': 'fastica', 'fit_decim': 1, 'fit_l_freq': None}
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 (hex) isi file, dibaca per blok."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_and_hash(source, destination: str) -> str:
+    """Menyalin file object ke destination sambil menghitung SHA-256 isinya (satu lintasan)."""
+    digest = hashlib.sha256()
+    with open(destination, 'wb') as f:
+        for block in iter(lambda: source.read(_HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def _json_default(value):
+    # Tipe NumPy (np.float64, np.int64, ...) -> tipe Python
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Tipe {type(value).__name__} tidak bisa disimpan ke cache.")
+
+
+class ArtifactCache:
+    def __init__(self, root: str, version: str = PIPELINE_VERSION):
+        self.root = root
+        self.version = version
+        self.version_dir = os.path.join(root, version)
+        os.makedirs(self.version_dir, exist_ok=True)
+        self.purge_other_versions()
+
+    def features_key(self, content_hash: str, ica_options=None) -> str:
+        """
+        Kunci cache untuk satu rekaman + konfigurasi ICA yang memengaruhi hasil.
+        Dengan warm start, hasil ICA juga bergantung pada matriks unmixing awal:
+        hash file unmixing saat ini ikut masuk kunci, sehingga fitur yang dihitung
+        dari inisialisasi lain (atau tanpa warm start) tidak dipakai ulang.
+        """
+        ica_options = ica_options or {}
+        ica_config = {name: ica_options.get(name, default) for name, default in _ICA_KEY_DEFAULTS.items()}
+        warm_start_key = ica_options.get('warm_start_key')
+        if warm_start_key is not None:
+            from ica_engine import ICA_CACHE_DIR, cached_unmixing_hash
+            ica_config['warm_start_key'] = warm_start_key
+            ica_config['warm_start_unmixing'] = cached_unmixing_hash(
+                warm_start_key, ica_options.get('cache_dir') or ICA_CACHE_DIR)
+        payload = json.dumps({'edf': content_hash, 'ica': ica_config}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.version_dir, key)
+
+    # --- Tahap 1: file fitur ---
+
+    def feature_path(self, key: str):
+        """Path file fitur .npy di cache, atau None jika belum ada."""
+        path = os.path.join(self._entry_dir(key), 'features.npy')
+        return path if os.path.exists(path) else None
+
+    def put_features(self, key: str, source_path: str) -> str:
+        """Menyalin file fitur ke cache (atomik: tulis sementara lalu os.replace)."""
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        target = os.path.join(entry_dir, 'features.npy')
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(source_path, tmp)
+        os.replace(tmp, target)
+        return target
+
+    # --- Tahap 2: hasil analisis (skor + data gambar) ---
+
+    def get_analysis(self, key: str):
+        """
+        Returns:
+            tuple | None: (payload dict, direktori artifacts) jika ada di cache.
+        """
+        entry_dir = self._entry_dir(key)
+        path = os.path.join(entry_dir, 'analysis.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f), os.path.join(entry_dir, 'artifacts')
+
+    def put_analysis(self, key: str, payload: dict, artifacts: dict):
+        """
+        Menyimpan hasil analisis beserta file pendukungnya (mis. data gambar).
+
+        Args:
+            payload (dict): Hasil analisis yang dapat diserialisasi ke JSON.
+            artifacts (dict): {path relatif di dalam artifacts/: path file sumber}.
+        """
+        entry_dir = self._entry_dir(key)
+        for relative, source in artifacts.items():
+            target = os.path.join(entry_dir, 'artifacts', relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+        # analysis.json ditulis terakhir: entri dianggap lengkap hanya jika file ini ada
+        target = os.path.join(entry_dir, 'analysis.json')
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(payload, f, default=_json_default)
+        os.replace(tmp, target)
+
+    # --- Invalidasi ---
+
+    def invalidate(self, key: str = None):
+        """Menghapus satu entri, atau seluruh entri versi ini jika key None."""
+        target = self._entry_dir(key) if key else self.version_dir
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(self.version_dir, exist_ok=True)
+
+    def purge_other_versions(self):
+        """Menghapus entri dari PIPELINE_VERSION lain (hasil pipeline lama tidak dipakai ulang)."""
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name != self.version and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Kelola cache artefak pipeline BWA")
+    parser.add_argument('--root', default="artifact_cache", help="Direktori cache (default: artifact_cache)")
+    parser.add_argument('--purge', action='store_true', help="Hapus seluruh entri cache, termasuk versi saat ini")
+    args = parser.parse_args()
+    cache = ArtifactCache(args.root)
+    if args.purge:
+        cache.invalidate()
+    print(f"Cache '{args.root}' versi {cache.version}: {len(os.listdir(cache.version_dir))} entri.")
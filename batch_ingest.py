@@ -0,0 +1,144 @@
+# filename: batch_ingest.py
+#
+# Utilitas untuk ingest batch multi-kandidat (satu sesi tes untuk satu kohort):
+# parsing manifest biodata (CSV/JSON) dan ekstraksi bundle EDF (zip atau
+# beberapa file .edf) ke upload store. Semua error validasi dilempar sebagai
+# ValueError agar endpoint bisa mengubahnya menjadi HTTP 400.
+
+import csv
+import io
+import json
+import os
+import shutil
+import uuid
+import zipfile
+from datetime import date
+
+MANIFEST_REQUIRED_FIELDS = [
+    'fullname', 'username', 'password', 'company', 'gender', 'age', 'address',
+    'test_date', 'test_location', 'operator_name', 'edf_filename',
+]
+MANIFEST_OPTIONAL_FIELDS = ['pekerjaan']
+
+
+def _read_manifest_rows(filename: str, content: bytes):
+    text = content.decode('utf-8-sig')
+    if filename.lower().endswith('.json'):
+        data = json.loads(text)
+        # Terima list kandidat langsung atau {"candidates": [...]}
+        rows = data.get('candidates') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("Manifest JSON harus berupa list objek kandidat atau {\"candidates\": [...]}.")
+        return rows
+    if filename.lower().endswith('.csv'):
+        return list(csv.DictReader(io.StringIO(text)))
+    raise ValueError("Manifest harus berupa file .csv atau .json.")
+
+
+def parse_manifest(filename: str, content: bytes):
+    """
+    Membaca dan memvalidasi manifest biodata kandidat.
+
+    Args:
+        filename (str): Nama file manifest (.csv atau .json).
+        content (bytes): Isi file manifest.
+
+    Returns:
+        list[dict]: Satu dict per kandidat dengan field MANIFEST_REQUIRED_FIELDS
+        (age sebagai int, test_date sebagai date) ditambah 'pekerjaan' (boleh None).
+    """
+    rows = _read_manifest_rows(filename, content)
+    if not rows:
+        raise ValueError("Manifest tidak berisi kandidat.")
+
+    candidates, errors = [], []
+    seen_usernames, seen_files = set(), set()
+    for line, row in enumerate(rows, start=1):
+        row = {str(key).strip(): (str(value).strip() if value is not None else '') for key, value in row.items()}
+        missing = [field for field in MANIFEST_REQUIRED_FIELDS if not row.get(field)]
+        if missing:
+            errors.append(f"Baris {line}: field wajib kosong/tidak ada: {missing}")
+            continue
+        try:
+            age = int(row['age'])
+            test_date = date.fromisoformat(row['test_date'])
+        except ValueError:
+            errors.append(f"Baris {line}: 'age' harus angka dan 'test_date' berformat YYYY-MM-DD.")
+            continue
+        edf_filename = os.path.basename(row['edf_filename'])
+        if not edf_filename.lower().endswith('.edf'):
+            errors.append(f"Baris {line}: edf_filename '{edf_filename}' bukan file .edf.")
+            continue
+        if row['username'] in seen_usernames:
+            errors.append(f"Baris {line}: username '{row['username']}' duplikat di manifest.")
+            continue
+        if edf_filename in seen_files:
+            errors.append(f"Baris {line}: edf_filename '{edf_filename}' dipakai lebih dari satu kandidat.")
+            continue
+        seen_usernames.add(row['username'])
+        seen_files.add(edf_filename)
+
+        candidate = {field: row[field] for field in MANIFEST_REQUIRED_FIELDS}
+        candidate.update(age=age, test_date=test_date, edf_filename=edf_filename,
+                         pekerjaan=row.get('pekerjaan') or None)
+        candidates.append(candidate)
+
+    if errors:
+        raise ValueError("Manifest tidak valid: " + "; ".join(errors))
+    return candidates
+
+
+def extract_bundle(uploads, wanted_filenames, dest_dir: str):
+    """
+    Menyalin file EDF yang dibutuhkan manifest dari bundle ke dest_dir.
+
+    Args:
+        uploads (list): Pasangan (nama file, file object) berisi .zip dan/atau .edf.
+        wanted_filenames (iterable): Nama file EDF (basename) yang disebut di manifest.
+        dest_dir (str): Direktori upload store.
+
+    Returns:
+        dict: {nama file EDF: path hasil salin}. Jika ada EDF yang tidak ditemukan,
+        file yang sudah tersalin dihapus dan ValueError dilempar.
+    """
+    wanted = set(wanted_filenames)
+    saved = {}
+
+    def _copy(name, source):
+        path = os.path.join(dest_dir, f"{uuid.uuid4()}_{name.replace(' ', '_')}")
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        saved[name] = path
+
+    try:
+        for upload_name, fileobj in uploads:
+            upload_name = os.path.basename(upload_name or '')
+            if upload_name.lower().endswith('.zip'):
+                with zipfile.ZipFile(fileobj) as archive:
+                    for member in archive.infolist():
+                        # Hanya basename yang dipakai; path di dalam zip diabaikan
+                        name = os.path.basename(member.filename)
+                        if member.is_dir() or name not in wanted or name in saved:
+                            continue
+                        with archive.open(member) as source:
+                            _copy(name, source)
+            elif upload_name in wanted and upload_name not in saved:
+                _copy(upload_name, fileobj)
+
+        missing = sorted(wanted - saved.keys())
+        if missing:
+            raise ValueError(f"File EDF berikut tidak ditemukan di bundle: {missing}")
+    except zipfile.BadZipFile as e:
+        remove_files(saved.values())
+        raise ValueError(f"File zip tidak valid: {e}")
+    except Exception:
+        remove_files(saved.values())
+        raise
+    return saved
+
+
+def remove_files(paths):
+    """Menghapus file-file sementara (abaikan yang sudah tidak ada)."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,419 @@
+# filename: benchmark.py
+#
+# Skrip benchmark untuk tahap-tahap berat pipeline BWA.
+# Jalankan: python benchmark.py transform ica pm roc analysis figures db
+
+import argparse
+import os
+import time
+
+import mne
+import numpy as np
+import pandas as pd
+from numpy.fft import fft
+
+import shutil
+import sqlite3
+import tempfile
+
+from ica_engine import resolve_ica_method
+from pm_engine import PmEngine
+from pow_tensor import POW_BANDS, POW_CHANNELS, PowTensor
+from tools import create_band_indices, eeg_fast_transform, make_transform_columns, preproc, EEG_CHANNELS as ICA_CHANNELS
+
+SFREQ = 256
+SESSION_SECONDS = 660
+BAND_FREQUENCIES = [[4, 8], [8, 12], [12, 30], [20, 30], [30, 50]]
+EEG_CHANNELS = ['EEG.AF3', 'EEG.T7', 'EEG.Pz', 'EEG.T8', 'EEG.AF4']
+
+
+def make_synthetic_session(seconds=SESSION_SECONDS, sfreq=SFREQ, n_channels=5, seed=0):
+    """Membuat data EEG sintetis (microvolt) dan timestamp untuk satu sesi penuh."""
+    rng = np.random.default_rng(seed)
+    n_samples = int(seconds * sfreq)
+    t = 1.7e9 + np.arange(n_samples) / sfreq
+    eeg_data = rng.normal(0, 10, size=(n_samples, n_channels))
+    return t, eeg_data
+
+
+def legacy_eeg_fast_transform(t, eeg_data, epoch_len, epoch_step, band_frequencies):
+    """Implementasi lama (np.dstack + fft dua sisi), dipakai sebagai pembanding."""
+    band_indices = create_band_indices(epoch_len, band_frequencies)
+    stop_range = t.shape[0] - epoch_len
+    eeg_3d = np.dstack([eeg_data[i:i+epoch_len] for i in range(0, stop_range, epoch_step)])
+    eeg_3d = eeg_3d - np.mean(eeg_3d, axis=0)
+    hanning_window = np.hanning(eeg_3d.shape[0]) * 2
+    eeg_fft_3d = (eeg_3d.T * hanning_window).T
+    fourier_transform = fft(eeg_fft_3d, axis=0)/eeg_fft_3d.shape[0]
+    eeg_fft_square_3d = np.absolute(fourier_transform)**2
+    trans = None
+    for band in band_indices:
+        band_power = np.sum(eeg_fft_square_3d[band, :, :], axis=0) / len(band)
+        trans = band_power.T if trans is None else np.concatenate((trans, band_power.T), axis=1)
+    return trans
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_transform(repeat=5):
+    t, eeg_data = make_synthetic_session()
+    columns = make_transform_columns(EEG_CHANNELS, BAND_FREQUENCIES)
+
+    legacy_time, legacy = _best_of(
+        lambda: legacy_eeg_fast_transform(t, eeg_data, 512, 256, BAND_FREQUENCIES), repeat)
+    new_time, df_new = _best_of(
+        lambda: eeg_fast_transform(t, eeg_data, 512, 256, EEG_CHANNELS, BAND_FREQUENCIES), repeat)
+
+    max_diff = np.max(np.abs(df_new[columns].values - legacy))
+    print(f"eeg_fast_transform ({SESSION_SECONDS} s, {SFREQ} Hz, {len(EEG_CHANNELS)} kanal)")
+    print(f"  lama (dstack + fft) : {legacy_time * 1000:8.1f} ms")
+    print(f"  baru (strided + rfft): {new_time * 1000:8.1f} ms")
+    print(f"  speedup             : {legacy_time / new_time:8.1f}x")
+    print(f"  selisih maksimum    : {max_diff:.3e}")
+
+
+def make_synthetic_eeg_with_blinks(seconds=SESSION_SECONDS, sfreq=SFREQ, seed=0, device_seed=0):
+    """
+    EEG sintetis 5 kanal (volt): ritme alpha/beta + noise, ditambah kedipan mata
+    yang dominan di AF3/AF4. Matriks mixing ditentukan device_seed (perangkat yang
+    sama -> mixing sama), sinyal sumber ditentukan seed.
+    Mengembalikan (data, time course kedipan).
+    """
+    mixing = np.random.default_rng(device_seed).normal(size=(len(ICA_CHANNELS), 4))
+    rng = np.random.default_rng(seed)
+    n_samples = int(seconds * sfreq)
+    t = np.arange(n_samples) / sfreq
+    sources = np.vstack([
+        np.sin(2 * np.pi * 10 * t + rng.uniform(0, 2 * np.pi)),
+        np.sin(2 * np.pi * 20 * t + rng.uniform(0, 2 * np.pi)),
+        rng.laplace(size=n_samples),
+        rng.laplace(size=n_samples),
+    ])
+    clean = (mixing @ sources + 0.3 * rng.normal(size=(len(ICA_CHANNELS), n_samples))) * 10e-6
+
+    blinks = np.zeros(n_samples)
+    width = int(0.3 * sfreq)
+    shape = np.hanning(width)
+    for onset in rng.integers(0, n_samples - width, size=int(seconds / 4)):
+        blinks[onset:onset + width] += shape
+    blink_weights = np.array([1.0, 0.15, 0.05, 0.15, 0.9])  # AF3, T7, Pz, T8, AF4
+    return clean + np.outer(blink_weights, blinks) * 150e-6, blinks
+
+
+def bench_ica(repeat=1):
+    mne.set_log_level('ERROR')
+    data, blinks = make_synthetic_eeg_with_blinks()
+    cache_dir = tempfile.mkdtemp(prefix="ica_bench_")
+    try:
+        # Isi cache warm start dari rekaman lain pada perangkat yang sama
+        other, _ = make_synthetic_eeg_with_blinks(seed=1)
+        preproc(other.copy(), ICA_CHANNELS, SFREQ, ica_options={'warm_start_key': 'bench', 'cache_dir': cache_dir})
+
+        variants = {
+            'fastica (jalur lama)': {},
+            'fastica + warm start': {'warm_start_key': 'bench', 'cache_dir': cache_dir},
+            'fastica decim=4': {'fit_decim': 4},
+            'fastica decim=4 + warm start': {'fit_decim': 4, 'warm_start_key': 'bench', 'cache_dir': cache_dir},
+            'infomax decim=4': {'method': 'infomax', 'fit_decim': 4},
+        }
+        if resolve_ica_method('picard') == 'picard':
+            variants['picard decim=4'] = {'method': 'picard', 'fit_decim': 4}
+
+        results = {}
+        for name, options in variants.items():
+            # preproc memfilter array input secara in-place (RawArray tanpa salinan)
+            results[name] = _best_of(lambda: preproc(data.copy(), ICA_CHANNELS, SFREQ, ica_options=options), repeat)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def blink_residual(cleaned):
+        # Korelasi absolut terbesar antara kanal frontal bersih dan time course kedipan
+        return max(abs(np.corrcoef(cleaned[:, ICA_CHANNELS.index(ch)], blinks)[0, 1]) for ch in ('AF3', 'AF4'))
+
+    baseline_time, baseline = results['fastica (jalur lama)']
+    print(f"\nICA pra-pemrosesan ({SESSION_SECONDS} s, {SFREQ} Hz, {len(ICA_CHANNELS)} kanal)")
+    print(f"  sisa kedipan sebelum ICA: {blink_residual(data.T):.3f}")
+    print(f"  {'varian':30s} {'waktu':>10s} {'speedup':>8s} {'korelasi':>9s} {'sisa kedipan':>13s}")
+    for name, (elapsed, cleaned) in results.items():
+        # Kesepakatan dengan jalur lama: korelasi rata-rata per kanal
+        corr = np.mean([np.corrcoef(baseline[:, i], cleaned[:, i])[0, 1] for i in range(baseline.shape[1])])
+        print(f"  {name:30s} {elapsed * 1000:8.1f} ms {baseline_time / elapsed:7.1f}x {corr:9.4f} {blink_residual(cleaned):13.3f}")
+
+
+def legacy_pm_metrics(df):
+    """Implementasi lama: mean per band lewat pandas lalu tujuh kolom diassign satu per satu."""
+    out = pd.DataFrame(index=df.index)
+    bands = {band: 10**(df[[c for c in df.columns if c.endswith(f".{band}")]].mean(axis=1) / 10) for band in POW_BANDS}
+    epsilon = 1e-9
+    out['PM.Attention'] = bands['Beta'] / (bands['Alpha'] + bands['Theta'] + epsilon)
+    out['PM.Engagement'] = bands['Beta'] / (bands['Alpha'] + bands['Theta'] + epsilon)
+    out['PM.Interest'] = (bands['Beta'] + bands['Gamma']) / (bands['Alpha'] + bands['Theta'] + epsilon)
+    out['PM.Excitement'] = (bands['Gamma'] + bands['BetaH']) / (bands['Alpha'] + epsilon)
+    out['PM.Focus'] = bands['Beta'] / (bands['Alpha'] + epsilon)
+    out['PM.Stress'] = bands['BetaH'] / (bands['Alpha'] + epsilon)
+    out['PM.Relaxation'] = (bands['Alpha'] + bands['Theta']) / (bands['Beta'] + epsilon)
+    return out
+
+
+def bench_pm(repeat=20, n_epochs=50000):
+    rng = np.random.default_rng(0)
+    channels = [ch.split('.')[1] for ch in EEG_CHANNELS]
+    pow_db = rng.normal(10, 3, size=(n_epochs, len(channels), len(POW_BANDS)))
+    df = pd.DataFrame({f"POW.{ch}.{band}": pow_db[:, i, j]
+                       for i, ch in enumerate(channels) for j, band in enumerate(POW_BANDS)})
+    engine = PmEngine(POW_BANDS)
+
+    legacy_time, legacy = _best_of(lambda: legacy_pm_metrics(df), repeat)
+    new_time, values = _best_of(lambda: engine.compute(pow_db.mean(axis=1)), repeat)
+
+    max_rel = np.max(np.abs(values - legacy[engine.columns].to_numpy()) / np.abs(legacy[engine.columns].to_numpy()))
+    print(f"\nMetrik PM ({n_epochs} epoch, {len(engine.columns)} kolom)")
+    print(f"  lama (pandas per kolom): {legacy_time * 1000:8.1f} ms")
+    print(f"  baru (tabel formula)   : {new_time * 1000:8.1f} ms")
+    print(f"  speedup                : {legacy_time / new_time:8.1f}x")
+    print(f"  selisih relatif maks.  : {max_rel:.3e} (output float32)")
+
+
+def legacy_roc_auc(baseline_scores, task_scores):
+    """Implementasi lama: sapuan 200 threshold dengan empat reduksi boolean, lalu np.trapz."""
+    y_scores = np.concatenate([baseline_scores, task_scores])
+    y_true = np.concatenate([np.zeros(len(baseline_scores)), np.ones(len(task_scores))])
+    min_score, max_score = np.min(y_scores), np.max(y_scores)
+    if min_score == max_score:
+        thresholds = np.array([min_score - 1e-6, min_score, min_score + 1e-6])
+    else:
+        thresholds = np.linspace(min_score, max_score, 200)
+    tpr_list, fpr_list = [], []
+    for thresh in sorted(thresholds, reverse=True):
+        y_pred = (y_scores >= thresh).astype(int)
+        tp = np.sum((y_true == 1) & (y_pred == 1))
+        fp = np.sum((y_true == 0) & (y_pred == 1))
+        tn = np.sum((y_true == 0) & (y_pred == 0))
+        fn = np.sum((y_true == 1) & (y_pred == 0))
+        tpr_list.append(tp / (tp + fn) if (tp + fn) > 0 else 0)
+        fpr_list.append(fp / (fp + tn) if (fp + tn) > 0 else 0)
+    return np.trapz(tpr_list, fpr_list)
+
+
+def bench_roc(repeat=3, epochs_per_session=120):
+    import logic
+
+    rng = np.random.default_rng(0)
+    n_columns = len(POW_CHANNELS) * 4  # channel x band (Theta, Alpha, Beta, Gamma)
+    baseline = rng.lognormal(1, 0.5, size=(epochs_per_session, n_columns))
+    tasks = [rng.lognormal(1 + 0.05 * i, 0.5, size=(epochs_per_session, n_columns)) for i in range(8)]
+
+    def legacy():
+        return np.array([[legacy_roc_auc(baseline[:, k], task[:, k]) for k in range(n_columns)] for task in tasks])
+
+    legacy_time, legacy_auc = _best_of(legacy, repeat)
+    new_time, (auc, _, _, _) = _best_of(lambda: logic.exact_roc(baseline, tasks), repeat)
+
+    # Referensi Mann-Whitney langsung (perbandingan semua pasangan)
+    exact = np.array([[np.mean((task[:, k, None] > baseline[None, :, k]) + 0.5 * (task[:, k, None] == baseline[None, :, k]))
+                       for k in range(n_columns)] for task in tasks])
+    print(f"\nROC AUC ({len(tasks)} sesi x {n_columns} channel x band, {epochs_per_session} epoch per sesi)")
+    print(f"  lama (200 threshold)   : {legacy_time * 1000:8.1f} ms, selisih maks. vs Mann-Whitney {np.max(np.abs(legacy_auc - exact)):.2e}")
+    print(f"  baru (rank, eksak)     : {new_time * 1000:8.1f} ms, selisih maks. vs Mann-Whitney {np.max(np.abs(auc - exact)):.2e}")
+    print(f"  speedup                : {legacy_time / new_time:8.1f}x")
+
+
+def bench_analysis():
+    import logic
+    import plotting
+
+    rng = np.random.default_rng(0)
+    n_epochs = SESSION_SECONDS  # satu epoch per detik (epoch_step 256 sampel pada 256 Hz)
+    pow_tensor = PowTensor(rng.lognormal(1, 0.5, size=(n_epochs, len(POW_CHANNELS), len(POW_BANDS))),
+                           np.arange(n_epochs, dtype=float), session_definitions=logic.SESSION_DEFINITIONS)
+
+    # Skor saja (jalur analisis, tanpa matplotlib) dibanding merender semua gambar di muka
+    score_time, roc_scores = _best_of(lambda: logic.score_roc_curves(pow_tensor), 5)
+    print("\nAnalisis kandidat")
+    print(f"  skor ROC/AUC saja    : {score_time * 1000:6.1f} ms")
+    output_dir = tempfile.mkdtemp(prefix="analysis_bench_")
+    try:
+        start = time.perf_counter()
+        files = plotting.render_analysis_figures(pow_tensor, roc_scores, "bench",
+                                                 topoplot_dir=output_dir, roc_dir=output_dir)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print(f"  render semua gambar  : {elapsed:6.2f} s, {len(files)} gambar (dihindari oleh render-on-demand)")
+
+
+def legacy_render_topoplot(plotting, info, session_name, session_means, output_file):
+    """Implementasi lama: figure pyplot baru per sesi, plot_topomap per band, lalu tight_layout."""
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, len(plotting.TOPOPLOT_BANDS), figsize=(5 * len(plotting.TOPOPLOT_BANDS), 6))
+    for i, (band_title, _) in enumerate(plotting.TOPOPLOT_BANDS):
+        values = session_means[:, i]
+        im, _ = mne.viz.plot_topomap(values, info, axes=axes[i], show=False, names=info.ch_names, cmap='jet')
+        im.set_clim(values.min(), values.max())
+        fig.colorbar(im, ax=axes[i], orientation='horizontal', pad=0.1, shrink=0.8).set_label('Power ($\\mu V^2$)')
+        axes[i].set_title(band_title, fontsize=12, fontweight='bold')
+    fig.suptitle(f'Topoplot Aktivitas Otak: {session_name}', fontsize=16, y=0.98, fontweight='bold')
+    plt.tight_layout(rect=[0, 0.05, 1, 0.95])
+    plt.savefig(output_file, dpi=150)
+    plt.close(fig)
+
+
+def legacy_render_roc(channel, band_key, curves, output_file):
+    """Implementasi lama: plt.figure baru per (channel, band) lewat state machine pyplot."""
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 8))
+    for session_name, auc, fpr, tpr in curves:
+        plt.plot(fpr, tpr, lw=2.5, label=f'{session_name} (AUC = {auc:.2f})', solid_joinstyle='round')
+    plt.plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--')
+    plt.xlim([0.0, 1.0])
+    plt.ylim([0.0, 1.05])
+    plt.xlabel('False Positive Rate', fontsize=12)
+    plt.ylabel('True Positive Rate', fontsize=12)
+    plt.title(f'ROC: {band_key} on {channel} (Baseline vs Tasks)', fontsize=14, fontweight='bold')
+    plt.legend(loc="lower right", fontsize='small')
+    plt.grid(alpha=0.4)
+    plt.savefig(output_file, dpi=120)
+    plt.close()
+
+
+def bench_figures(n_topoplots=8, n_roc=20):
+    import logic
+    import plotting
+
+    rng = np.random.default_rng(0)
+    n_epochs = SESSION_SECONDS
+    pow_tensor = PowTensor(rng.lognormal(1, 0.5, size=(n_epochs, len(POW_CHANNELS), len(POW_BANDS))),
+                           np.arange(n_epochs, dtype=float), session_definitions=logic.SESSION_DEFINITIONS)
+    roc_scores = logic.score_roc_curves(pow_tensor)
+    channel_order = [pow_tensor.channel_index(ch) for ch in plotting.TOPOPLOT_CHANNELS]
+    band_positions = [pow_tensor.band_index(band_code) for _, band_code in plotting.TOPOPLOT_BANDS]
+    sessions = [(name, pow_tensor.session_mean(name)[channel_order][:, band_positions])
+                for name in logic.TOPOPLOT_SESSIONS[:n_topoplots]]
+    columns = [(channel, band_key, roc_scores.curves(k)) for k, (channel, band_key) in enumerate(roc_scores.columns)][:n_roc]
+
+    output_dir = tempfile.mkdtemp(prefix="figure_bench_")
+    output_file = os.path.join(output_dir, "figure.png")
+    try:
+        # Info/montage, matriks interpolasi, dan figure dibangun sekali per proses (tidak ikut diukur)
+        start = time.perf_counter()
+        info = plotting.topoplot_info()
+        topoplot_figure, roc_figure = plotting.topoplot_figure(), plotting.roc_figure()
+        setup_time = time.perf_counter() - start
+        rows = [
+            ("topoplot", len(sessions),
+             lambda: [legacy_render_topoplot(plotting, info, name, means, output_file) for name, means in sessions],
+             lambda: [topoplot_figure.render(name, means, list(range(len(band_positions))), output_file)
+                      for name, means in sessions]),
+            ("ROC", len(columns),
+             lambda: [legacy_render_roc(channel, band_key, curves, output_file) for channel, band_key, curves in columns],
+             lambda: [roc_figure.render(channel, band_key, curves, output_file) for channel, band_key, curves in columns]),
+        ]
+        print(f"\nRender gambar (Agg, 1 proses; setup renderer sekali per proses {setup_time:.2f} s)")
+        for label, count, legacy, reused in rows:
+            legacy_time, _ = _best_of(legacy, 1)
+            new_time, _ = _best_of(reused, 1)
+            print(f"  {label:8s} lama (figure pyplot baru)  : {count / legacy_time:6.2f} gambar/s")
+            print(f"  {label:8s} baru (figure dipakai ulang): {count / new_time:6.2f} gambar/s, "
+                  f"speedup {legacy_time / new_time:4.1f}x")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def make_analysis_results(username, rng):
+    """Hasil run_full_analysis sintetis dengan jumlah baris seperti satu kandidat nyata."""
+    import logic
+
+    return {
+        "big_five": [{"PERSONALITY": name, "SCORE": rng.uniform(0, 100)} for name in logic.PERSONALITY_IDS],
+        "cognitive_function": [{"TEST": name, "SCORE": rng.uniform(0, 100)} for name in logic.TEST_IDS],
+        "response_during_test": [{"CATEGORY": name, **{k: rng.uniform(0, 1) for k in
+                                                        ('ENGAGEMENT', 'INTEREST', 'FOCUS', 'RELAXATION', 'ATTENTION')}}
+                                 for name in logic.STIMULATION_IDS],
+        "roc_results_db": [{"graph": f"v1/bwa/figures/{username}/roc/{k}.png", "note": "AUC 0.5"} for k in range(20)],
+    }
+
+
+def bench_db(n_candidates=200):
+    import logic
+
+    rng = np.random.default_rng(0)
+    candidates = [(user_id, f"user{user_id}", make_analysis_results(f"user{user_id}", rng))
+                  for user_id in range(1, n_candidates + 1)]
+
+    def legacy_save(connection, results, user_id, username):
+        # Implementasi lama: satu cursor.execute per baris, commit per kandidat
+        cursor = connection.cursor()
+        for table, values in logic.analysis_rows(results, user_id, username).items():
+            for value in values:
+                cursor.execute(logic.insert_statement(table, '?'), value)
+        connection.commit()
+        cursor.close()
+
+    def per_candidate(connection):
+        for user_id, username, results in candidates:
+            logic.write_analysis_rows(connection, logic.analysis_rows(results, user_id, username), '?')
+
+    def accumulated(connection):
+        row_buffer = logic.AnalysisRowBuffer()
+        for user_id, username, results in candidates:
+            row_buffer.add(results, user_id, username)
+        row_buffer.flush(connection, placeholder='?')
+
+    user_id, username, results = candidates[0]
+    rows_per_candidate = sum(len(values) for values in logic.analysis_rows(results, user_id, username).values())
+    runs = [
+        ("execute per baris", lambda c: [legacy_save(c, r, u, n) for u, n, r in candidates],
+         rows_per_candidate * n_candidates, n_candidates),
+        ("executemany per kandidat", per_candidate, len(logic.ANALYSIS_TABLES) * n_candidates, n_candidates),
+        ("akumulasi lintas kandidat", accumulated, len(logic.ANALYSIS_TABLES), 1),
+    ]
+
+    output_dir = tempfile.mkdtemp(prefix="db_bench_")
+    try:
+        print(f"\nSimpan hasil analisis ke SQLite ({n_candidates} kandidat, {rows_per_candidate} baris/kandidat)")
+        baseline_time = None
+        for i, (label, write, statements, transactions) in enumerate(runs):
+            # Setiap cara menulis ke file database baru
+            connection = sqlite3.connect(os.path.join(output_dir, f"bench_{i}.db"))
+            for table, columns in logic.ANALYSIS_TABLES.items():
+                connection.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+            start = time.perf_counter()
+            write(connection)
+            elapsed = time.perf_counter() - start
+            connection.close()
+            baseline_time = baseline_time or elapsed
+            print(f"  {label:26s}: {n_candidates / elapsed:8.0f} kandidat/s, {statements:5d} statement, "
+                  f"{transactions:4d} transaksi, speedup {baseline_time / elapsed:5.1f}x")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'transform': bench_transform,
+    'ica': bench_ica,
+    'pm': bench_pm,
+    'roc': bench_roc,
+    'analysis': bench_analysis,
+    'figures': bench_figures,
+    'db': bench_db,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline BWA")
+    parser.add_argument('names', nargs='*', help=f"Benchmark yang dijalankan: {', '.join(BENCHMARKS)} (default: semua)")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Benchmark tidak dikenal: {unknown}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,15 +1,21 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    # Untuk koneksi SQLAlchemy (database.py)
+    # Untuk koneksi SQLAlchemy (database.py), dipakai juga oleh logic.save_to_mysql
     DATABASE_URL: str
+    # Pool koneksi engine: dibagi semua request/task dalam satu proses
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_RECYCLE: int = 3600  # detik, di bawah wait_timeout MySQL
+    DB_POOL_PRE_PING: bool = True
 
-    # Untuk koneksi langsung (logic.py)
-    DB_HOST: str
-    DB_PORT: int
-    DB_USER: str
-    DB_PASSWORD: str
-    DB_NAME: str
+    # Koneksi langsung lama (logic.py); tidak dipakai lagi, tetap diterima agar .env lama valid
+    DB_HOST: Optional[str] = None
+    DB_PORT: Optional[int] = None
+    DB_USER: Optional[str] = None
+    DB_PASSWORD: Optional[str] = None
+    DB_NAME: Optional[str] = None
 
     # Untuk otentikasi (auth.py)
     SECRET_KEY: str
@@ -20,6 +26,40 @@ class Settings(BaseSettings):
     BASE_URL: str
     CORS_ORIGINS: str
 
+    # Untuk pipeline Celery (tasks.py)
+    CELERY_ROUTE_STAGES: bool = False
+    # Result backend Celery; dibutuhkan chord batch (hasil analisis semua kandidat ditulis sekaligus)
+    CELERY_RESULT_BACKEND: str = "redis://localhost:6379/1"
+
+    # Untuk mesin ICA pra-pemrosesan (ica_engine.py)
+    ICA_METHOD: str = "fastica"
+    ICA_FIT_DECIM: int = 1
+    ICA_FIT_L_FREQ: Optional[float] = None
+    ICA_WARM_START: bool = False
+    ICA_CACHE_DIR: str = "ica_cache"
+
+    # Untuk cache artefak content-addressed (artifact_cache.py)
+    ARTIFACT_CACHE_ENABLED: bool = True
+    ARTIFACT_CACHE_DIR: str = "artifact_cache"
+
+    # Untuk unggahan EDF bertahap/resumable (upload_store.py)
+    UPLOAD_CHUNK_MAX_BYTES: int = 8 * 1024 * 1024
+    UPLOAD_STALE_HOURS: int = 24
+
+    # Untuk render gambar on-demand + cache PNG LRU (render_cache.py)
+    RENDER_CACHE_DIR: str = "render_cache"
+    RENDER_CACHE_MAX_MB: int = 512
+    # Format topoplot di laporan PDF: "svg" (vektor, butuh svglib) atau "png"
+    REPORT_FIGURE_FORMAT: str = "svg"
+    # Semua topoplot dan ROC dirender di latar belakang (queue bwa.figures) setelah laporan selesai
+    PRERENDER_FIGURES: bool = True
+    # Jumlah task Celery paralel (group) untuk prerender satu kandidat; 1 = serial dalam satu task
+    PRERENDER_WORKERS: int = 1
+
+    # Untuk mode analisis realtime (realtime.py)
+    REALTIME_MAX_BLOCK_SECONDS: float = 10.0
+    REALTIME_STALE_MINUTES: int = 30
+
     class Config:
         env_file = ".env"
 
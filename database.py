@@ -1,16 +1,20 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
+from config import settings
 
-# Muat variabel dari file .env
-load_dotenv()
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-# Ambil URL dari environment variable
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "mysql+mysqlconnector://root:@localhost/brainwave_db")
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Satu engine ber-pool per proses untuk ORM (SessionLocal) dan penulisan hasil analisis
+# (logic.save_to_mysql lewat raw_connection), sehingga koneksi/handshake TLS dipakai ulang.
+# pre_ping membuang koneksi yang sudah diputus server, recycle mencegah wait_timeout MySQL.
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
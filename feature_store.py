@@ -0,0 +1,69 @@
+# filename: feature_store.py
+#
+# Format biner untuk tabel fitur hasil pra-pemrosesan (Timestamp, time, PM.*, POW.*)
+# yang diserahkan dari API ke Celery worker.
+#
+# Tabel disimpan sebagai satu file .npy berisi structured array: setiap kolom
+# adalah satu field dengan dtype-nya sendiri, dan nama field sekaligus menjadi
+# manifest kolom. File dibuka dengan memory-map sehingga worker hanya membaca
+# kolom yang benar-benar dipakai, tanpa parsing teks seperti pada CSV.
+
+import numpy as np
+import pandas as pd
+
+FEATURE_FILE_SUFFIX = ".npy"
+
+
+def save_feature_table(df: pd.DataFrame, path: str) -> str:
+    """
+    Menyimpan DataFrame fitur ke file biner kolumnar (.npy structured array).
+
+    Args:
+        df (pd.DataFrame): Tabel fitur dengan kolom numerik.
+        path (str): Path output, sebaiknya berakhiran .npy.
+
+    Returns:
+        str: Path file yang ditulis.
+    """
+    records = np.empty(len(df), dtype=[(col, df[col].dtype) for col in df.columns])
+    for col in df.columns:
+        records[col] = df[col].to_numpy()
+    # np.save akan menambahkan .npy jika belum ada; gunakan file handle agar path tetap persis
+    with open(path, "wb") as f:
+        np.save(f, records)
+    return path
+
+
+def open_feature_table(path: str) -> np.ndarray:
+    """Membuka file fitur sebagai structured array yang di-memory-map (read-only)."""
+    return np.load(path, mmap_mode="r")
+
+
+def load_feature_table(path: str, columns=None) -> pd.DataFrame:
+    """
+    Memuat tabel fitur menjadi DataFrame. File .csv lama tetap didukung.
+
+    Args:
+        path (str): Path file .npy (atau .csv).
+        columns (list, optional): Subset kolom yang dimuat. Default: semua kolom.
+
+    Returns:
+        pd.DataFrame: Tabel fitur.
+    """
+    if path.lower().endswith(".csv"):
+        df = pd.read_csv(path, header=0, low_memory=False)
+        df.columns = df.columns.str.strip()
+        return df[columns] if columns is not None else df
+
+    records = open_feature_table(path)
+    names = columns if columns is not None else records.dtype.names
+    missing = [name for name in names if name not in records.dtype.names]
+    if missing:
+        raise ValueError(f"Kolom berikut tidak ditemukan di {path}: {missing}")
+    return pd.DataFrame({name: np.asarray(records[name]) for name in names})
+
+
+def feature_table_to_csv(path: str, output_csv_path: str) -> str:
+    """Mengekspor file fitur biner ke CSV (hanya untuk keperluan unduhan)."""
+    load_feature_table(path).to_csv(output_csv_path, index=False)
+    return output_csv_path
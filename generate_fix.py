@@ -530,6 +530,19 @@ def draw_footer(c, page_num):
 
 def draw_centered_image(c, img_path, y_top, width_mm):
     try:
+        if img_path.lower().endswith('.svg'):
+            # Gambar vektor (topoplot SVG dari render cache): digambar langsung tanpa rasterisasi
+            from svglib.svglib import svg2rlg
+            from reportlab.graphics import renderPDF
+            drawing = svg2rlg(img_path)
+            width = width_mm * mm
+            scale = width / drawing.width
+            height = drawing.height * scale
+            drawing.scale(scale, scale)
+            x = (PAGE_WIDTH - width) / 2
+            y = y_top - height
+            renderPDF.draw(drawing, c, x, y)
+            return y
         image = ImageReader(img_path)
         iw, ih = image.getSize()
         width = width_mm * mm
@@ -0,0 +1,203 @@
+# filename: ica_engine.py
+#
+# Mesin ICA yang dapat dikonfigurasi untuk pra-pemrosesan EEG.
+#
+# - Metode: fastica (default, perilaku lama), infomax, atau picard
+#   (picard butuh paket opsional `python-picard`; jika tidak terpasang,
+#   otomatis kembali ke fastica).
+# - Fit dapat dilakukan pada salinan yang di-decimate dan/atau di-high-pass
+#   lebih tinggi; matriks unmixing hasilnya tetap diterapkan ke data laju penuh.
+# - Warm start: matriks unmixing ruang sensor disimpan per kunci
+#   (mis. perangkat/operator). Rekaman berikutnya dengan kunci yang sama memakai
+#   matriks tersebut sebagai inisialisasi solver sehingga konvergensi lebih cepat.
+
+import hashlib
+import os
+import re
+import importlib.util
+import uuid
+import zipfile
+
+import mne
+import numpy as np
+
+ICA_METHODS = ('fastica', 'infomax', 'picard')
+ICA_CACHE_DIR = "ica_cache"
+
+# Nama parameter inisialisasi unmixing untuk tiap solver (lihat fit_params MNE)
+_WARM_START_PARAM = {
+    'fastica': 'w_init',
+    'infomax': 'weights',
+    'picard': 'w_init',
+}
+
+
+def resolve_ica_method(method: str) -> str:
+    """Validasi nama metode; picard kembali ke fastica bila paketnya tidak tersedia."""
+    if method not in ICA_METHODS:
+        raise ValueError(f"Metode ICA tidak dikenal: '{method}'. Pilihan: {', '.join(ICA_METHODS)}")
+    if method == 'picard' and importlib.util.find_spec('picard') is None:
+        print("Paket 'picard' tidak terpasang, ICA memakai metode fastica.")
+        return 'fastica'
+    return method
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    safe_key = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(key)).strip('_') or 'default'
+    return os.path.join(cache_dir, f"ica_{safe_key}.npz")
+
+
+def load_cached_unmixing(key, ch_names, cache_dir=ICA_CACHE_DIR):
+    """
+    Memuat matriks unmixing ruang sensor untuk kunci tertentu.
+    Mengembalikan None jika tidak ada atau susunan kanalnya berbeda.
+    """
+    path = _cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as cached:
+            if list(cached['ch_names']) != list(ch_names):
+                return None
+            return cached['unmixing']
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile) as e:
+        print(f"Cache ICA '{path}' tidak dapat dibaca, diabaikan: {e}")
+        return None
+
+
+def cached_unmixing_hash(key, cache_dir=ICA_CACHE_DIR):
+    """SHA-256 file unmixing untuk kunci tertentu, atau None jika belum ada (ICA tanpa warm start)."""
+    path = _cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def save_cached_unmixing(key, ica, cache_dir=ICA_CACHE_DIR) -> str:
+    """Menyimpan matriks unmixing ruang sensor (terhadap data pre-whitened) dari ICA yang sudah di-fit."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(cache_dir, key)
+    sensor_unmixing = ica.unmixing_matrix_ @ ica.pca_components_[:ica.n_components_]
+    # Ditulis ke file sementara lalu diganti atomik: worker lain yang membaca kunci yang sama
+    # tidak pernah melihat file setengah jadi
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            np.savez(f, unmixing=sensor_unmixing, ch_names=np.array(ica.ch_names))
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def _warm_start_matrix(data, sensor_unmixing):
+    """
+    Memproyeksikan unmixing ruang sensor ke ruang whitened rekaman baru,
+    meniru langkah standardisasi + PCA-whitening yang dilakukan MNE sebelum solver:
+        z = D^-1/2 P x'   ->   W0 = A P^T D^1/2
+    Hanya dipakai sebagai inisialisasi; hasil akhir tetap ditentukan solver.
+    """
+    x = data - data.mean(axis=1, keepdims=True)
+    x /= np.std(data)
+    cov = (x @ x.T) / (x.shape[1] - 1)
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    order = np.argsort(eigvals)[::-1][:sensor_unmixing.shape[0]]
+    components = eigvecs[:, order].T
+    scales = np.sqrt(np.maximum(eigvals[order], np.finfo(float).tiny))
+    return (sensor_unmixing @ components.T) * scales[np.newaxis, :]
+
+
+def fit_ica(raw, n_components, method='fastica', fit_decim=1, fit_l_freq=None,
+            random_state=97, picks=None, warm_start_key=None, cache_dir=ICA_CACHE_DIR):
+    """
+    Fit ICA pada raw (atau salinan high-pass-nya) dan kembalikan objek ICA.
+    Raw tidak diubah; panggil ica.apply(raw) untuk membersihkan data laju penuh.
+
+    Args:
+        raw (mne.io.BaseRaw): Data yang sudah difilter (preload).
+        n_components (int): Jumlah komponen ICA.
+        method (str): 'fastica', 'infomax', atau 'picard'.
+        fit_decim (int): Faktor decimasi sampel saat fit (1 = semua sampel).
+        fit_l_freq (float, optional): High-pass tambahan untuk salinan fit.
+        random_state (int): Seed solver.
+        picks (list, optional): Kanal yang dipakai ICA (default: semua kanal data).
+        warm_start_key (str, optional): Kunci cache unmixing (mis. perangkat/operator).
+        cache_dir (str): Direktori cache unmixing.
+
+    Returns:
+        mne.preprocessing.ICA: Objek ICA yang sudah di-fit.
+    """
+    method = resolve_ica_method(method)
+    fit_decim = max(int(fit_decim or 1), 1)
+
+    if picks is None:
+        picks = mne.pick_types(raw.info, eeg=True, exclude='bads')
+    raw_fit = raw
+    if fit_l_freq is not None and fit_l_freq > (raw.info['highpass'] or 0):
+        # Hanya kanal ICA yang disalin; raw asli tetap pada filter semula
+        raw_fit = raw.copy().pick(picks)
+        raw_fit.filter(l_freq=fit_l_freq, h_freq=None, verbose=False)
+        picks = np.arange(len(raw_fit.ch_names))
+    fit_ch_names = [raw_fit.ch_names[i] for i in picks]
+
+    fit_params = None
+    if warm_start_key is not None:
+        sensor_unmixing = load_cached_unmixing(warm_start_key, fit_ch_names, cache_dir)
+        if sensor_unmixing is not None and sensor_unmixing.shape[0] == n_components:
+            data = raw_fit.get_data(picks=picks)[:, ::fit_decim]
+            fit_params = {_WARM_START_PARAM[method]: _warm_start_matrix(data, sensor_unmixing)}
+            print(f"ICA warm start dari cache '{warm_start_key}'.")
+
+    ica = mne.preprocessing.ICA(n_components=n_components, method=method, random_state=random_state,
+                                max_iter='auto', fit_params=fit_params)
+    ica.fit(raw_fit, picks=picks, decim=fit_decim if fit_decim > 1 else None)
+
+    if warm_start_key is not None:
+        save_cached_unmixing(warm_start_key, ica, cache_dir)
+    return ica
+
+
+def filter_and_apply_ica(raw, n_components, picks=None, l_freq=1., h_freq=40., random_state=97,
+                         eog_ch_names=None, eog_threshold=1.5, ica_options=None, verbose=None):
+    """
+    Tahap filter + ICA bersama untuk preproc (pipeline analisis) dan tool EDF -> CSV ber-ICA.
+    Bekerja in-place hanya pada kanal picks; kanal lain di raw tidak disentuh.
+
+    Args:
+        raw (mne.io.BaseRaw): Data yang sudah di-load (preload).
+        n_components (int): Jumlah komponen ICA.
+        picks (list, optional): Kanal yang difilter dan dibersihkan (default: semua kanal EEG).
+        l_freq, h_freq (float): Batas bandpass sebelum ICA.
+        random_state (int): Seed solver ICA.
+        eog_ch_names (list, optional): Kanal proxy EOG untuk find_bads_eog. Jika None,
+            tidak ada komponen yang dibuang (ICA hanya merekonstruksi sinyal).
+        eog_threshold (float): Ambang z-score find_bads_eog.
+        ica_options (dict, optional): Argumen tambahan untuk fit_ica.
+
+    Returns:
+        mne.preprocessing.ICA: Objek ICA yang sudah di-fit (exclude sudah terisi).
+    """
+    if picks is None:
+        picks = mne.pick_types(raw.info, eeg=True, exclude='bads')
+
+    # ICA bekerja lebih baik pada data yang sudah di-bandpass filter
+    raw.filter(l_freq=l_freq, h_freq=h_freq, picks=picks, fir_design='firwin', verbose=verbose)
+
+    # Fit bisa dilakukan pada salinan decimated/high-pass; hasilnya diterapkan ke data laju penuh
+    ica = fit_ica(raw, n_components=n_components, random_state=random_state, picks=picks,
+                  **(ica_options or {}))
+
+    if eog_ch_names:
+        print("ICA fit selesai. Mencari komponen artefak (kedipan mata)...")
+        eog_indices, _ = ica.find_bads_eog(raw, ch_name=list(eog_ch_names), threshold=eog_threshold)
+        if eog_indices:
+            print(f"Komponen EOG yang terdeteksi: {eog_indices}")
+            ica.exclude = eog_indices
+        else:
+            print("Tidak ada komponen kedipan mata yang signifikan terdeteksi.")
+
+    # In-place pada kanal ICA, tanpa salinan raw
+    ica.apply(raw, verbose=verbose)
+    return ica
@@ -1,38 +1,36 @@
 # filename: logic.py
 
-import mne
 import pandas as pd
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-import mysql.connector
 from config import settings  # Pastikan config diimpor
+from database import engine
+from feature_store import load_feature_table
+from pow_tensor import PowColumnMap, PowTensor, SessionIndex, nanmean
+from render_cache import roc_figure_path, session_slug, topoplot_figure_path, topoplot_filename
 
 # ==================================
-# 1. PERSIAPAN DATA (Tidak ada perubahan)
+# 1. PERSIAPAN DATA
 # ==================================
-def create_cleaning_csv(path):
-    df = pd.read_csv(path, header=0, low_memory=False)
-    df.columns = df.columns.str.strip()
-    pm_cols = ['PM.Attention', 'PM.Stress', 'PM.Relaxation',
-               'PM.Focus', 'PM.Engagement', 'PM.Excitement', 'PM.Interest']
-    required_cols = ['time'] + pm_cols
+PM_COLUMNS = ['PM.Attention', 'PM.Stress', 'PM.Relaxation',
+              'PM.Focus', 'PM.Engagement', 'PM.Excitement', 'PM.Interest']
+
+def create_cleaning_frame(df: pd.DataFrame, source="data"):
+    """Ambil kolom time + PM.* dan buang baris yang tidak lengkap."""
+    required_cols = ['time'] + PM_COLUMNS
     if not all(col in df.columns for col in required_cols):
         missing = [col for col in required_cols if col not in df.columns]
-        raise ValueError(f"Kolom berikut tidak ditemukan di {path}: {missing}")
-    df_clean = df.dropna(subset=required_cols)[required_cols]
-    df_clean.to_csv("cleaning.csv", index=False)
+        raise ValueError(f"Kolom berikut tidak ditemukan di {source}: {missing}")
+    return df.dropna(subset=required_cols)[required_cols]
 
-def create_cleaning2_csv(path):
-    df = pd.read_csv(path, header=0, low_memory=False)
-    df.columns = df.columns.str.strip()
+def create_cleaning2_frame(df: pd.DataFrame, source="data"):
+    """Ambil kolom time + POW.* dan buang baris yang tidak lengkap."""
     pow_cols = [col for col in df.columns if col.startswith("POW.")]
     required_cols = ['time'] + pow_cols
     if not all(col in df.columns for col in required_cols):
         missing = [col for col in required_cols if col not in df.columns]
-        raise ValueError(f"Kolom berikut tidak ditemukan di {path}: {missing}")
-    df_clean = df.dropna(subset=required_cols)[required_cols]
-    df_clean.to_csv("cleaning2.csv", index=False)
+        raise ValueError(f"Kolom berikut tidak ditemukan di {source}: {missing}")
+    return df.dropna(subset=required_cols)[required_cols]
 
 
 # ==================================
@@ -57,50 +55,15 @@ SESSION_DEFINITIONS = {
 # -----------------------
 def find_pow_col(df: pd.DataFrame, channel: str, band: str):
     """
-    Cari kolom POW yang sesuai, mencoba beberapa varian nama:
-      - POW.<channel>.<band>
-      - POW.EEG.<channel>.<band>
-      - POW.<channel>_<band>
-      - POW_<channel>_<band>
-      - <channel>.<band>
-      - <channel>_<band>
+    Cari kolom POW yang sesuai dengan mencoba varian nama dari pow_col_candidates.
     Case-insensitive fallback juga dicoba.
     Jika tidak ditemukan, return None.
-    """
-    candidates = [
-        f"POW.{channel}.{band}",
-        f"POW.EEG.{channel}.{band}",
-        f"POW.{channel}_{band}",
-        f"POW_{channel}_{band}",
-        f"{channel}.{band}",
-        f"{channel}_{band}"
-    ]
-
-    # direct match (case-sensitive)
-    for c in candidates:
-        if c in df.columns:
-            return c
-
-    # try case-insensitive
-    cols_lower = {col.lower(): col for col in df.columns}
-    for c in candidates:
-        if c.lower() in cols_lower:
-            return cols_lower[c.lower()]
-
-    return None
 
-def safe_col_mean(session_df: pd.DataFrame, channel: str, band: str):
+    Untuk banyak kombinasi channel/band sekaligus, gunakan PowColumnMap
+    (atau PowTensor.from_frame).
     """
-    Ambil mean dari kolom POW untuk channel+band yang ada,
-    jika tidak ada, return np.nan
-    """
-    col = find_pow_col(session_df, channel, band)
-    if col is None:
-        return np.nan
-    vals = session_df[col].dropna().values
-    if len(vals) == 0:
-        return np.nan
-    return float(np.mean(vals))
+    col_map = PowColumnMap(df.columns, channels=[channel], bands=[band])
+    return col_map.column(channel, band)
 
 # -----------------------
 # Big Five (tetap)
@@ -128,312 +91,316 @@ def analyze_big_five(all_aucs):
 # -----------------------
 # Cognitive function (DIUBAH sesuai permintaan)
 # -----------------------
-def analyze_cognitive_function(csv_path="cleaning2.csv"):
-    """
-    Hitung skor cognitive traits berdasarkan rumus baru:
-    - IKN  = (Beta(AF3) + Beta(AF4)) / (Alpha(AF3) + Alpha(AF4) + ε)
-    - IWM  = (Theta(AF3) + Theta(AF4) + Gamma(AF3) + Gamma(AF4)) / (Alpha(AF3) + Alpha(AF4) + ε)
-    - ISTM = (Theta(AF3) + Theta(AF4) + Theta(T7) + Theta(T8)) / (Alpha(AF3) + Alpha(AF4) + ε)
+# Skor cognitive per tes: (suku pembilang, suku penyebut); setiap suku adalah
+# (daftar channel, band) yang di-nansum dari rata-rata POW sesi tes tersebut.
+COGNITIVE_EPSILON = 0.01
+COGNITIVE_FORMULAS = {
+    # IKN  = (Beta(AF3) + Beta(AF4)) / (Alpha(AF3) + Alpha(AF4) + ε)
+    'KRAEPELIN TEST': ([(['AF3', 'AF4'], 'Beta')], [(['AF3', 'AF4'], 'Alpha')]),
+    # IWM  = (Theta(AF3) + Theta(AF4) + Gamma(AF3) + Gamma(AF4)) / (Alpha(AF3) + Alpha(AF4) + ε)
+    'WCST': ([(['AF3', 'AF4'], 'Theta'), (['AF3', 'AF4'], 'Gamma')], [(['AF3', 'AF4'], 'Alpha')]),
+    # ISTM = (Theta(AF3) + Theta(AF4) + Theta(T7) + Theta(T8)) / (Alpha(AF3) + Alpha(AF4) + ε)
+    'DIGIT SPAN': ([(['AF3', 'AF4', 'T7', 'T8'], 'Theta')], [(['AF3', 'AF4'], 'Alpha')]),
+}
 
-    Membaca cleaning2.csv yang berisi kolom POW.*.
-    Epsilon = 0.01
+def cognitive_score(test: str, means: np.ndarray, channel_index, band_index):
+    """
+    Skor cognitive satu tes dari rata-rata POW sesinya (channel x band).
+    Mengembalikan None jika pembilang NaN.
     """
-    epsilon = 0.01
-    df = pd.read_csv(csv_path)
+    numerator_terms, denominator_terms = COGNITIVE_FORMULAS[test]
 
-    results = []
+    def _term_sum(terms):
+        return np.nansum(np.concatenate(
+            [means[[channel_index(ch) for ch in channels], band_index(band)] for channels, band in terms]))
 
-    # ====== KRAEPELIN TEST → IKN ======
-    start_time, end_time = SESSION_DEFINITIONS['KRAEPELIN TEST']
-    session_df = df[(df['time'] >= start_time) & (df['time'] < end_time)]
-    if not session_df.empty:
-        af3_beta = safe_col_mean(session_df, "AF3", "Beta")
-        af4_beta = safe_col_mean(session_df, "AF4", "Beta")
-        af3_alpha = safe_col_mean(session_df, "AF3", "Alpha")
-        af4_alpha = safe_col_mean(session_df, "AF4", "Alpha")
-
-        beta_sum = np.nansum([af3_beta, af4_beta])
-        alpha_sum = np.nansum([af3_alpha, af4_alpha])
-
-        # compute score; if numerator NaN => None
-        if np.isnan(beta_sum):
-            score_val = None
-        else:
-            score_val = float(beta_sum / (alpha_sum + epsilon))
-
-        results.append({
-            "TEST": "KRAEPELIN TEST",
-            "SCORE": score_val
-        })
-
-    # ====== WCST → IWM ======
-    start_time, end_time = SESSION_DEFINITIONS['WCST']
-    session_df = df[(df['time'] >= start_time) & (df['time'] < end_time)]
-    if not session_df.empty:
-        af3_theta = safe_col_mean(session_df, "AF3", "Theta")
-        af4_theta = safe_col_mean(session_df, "AF4", "Theta")
-        af3_gamma = safe_col_mean(session_df, "AF3", "Gamma")
-        af4_gamma = safe_col_mean(session_df, "AF4", "Gamma")
-        af3_alpha = safe_col_mean(session_df, "AF3", "Alpha")
-        af4_alpha = safe_col_mean(session_df, "AF4", "Alpha")
-
-        numerator = np.nansum([af3_theta, af4_theta, af3_gamma, af4_gamma])
-        denominator = np.nansum([af3_alpha, af4_alpha])
-
-        if np.isnan(numerator):
-            score_val = None
-        else:
-            score_val = float(numerator / (denominator + epsilon))
-
-        results.append({
-            "TEST": "WCST",
-            "SCORE": score_val
-        })
-
-    # ====== DIGIT SPAN → ISTM ======
-    start_time, end_time = SESSION_DEFINITIONS['DIGIT SPAN']
-    session_df = df[(df['time'] >= start_time) & (df['time'] < end_time)]
-    if not session_df.empty:
-        af3_theta = safe_col_mean(session_df, "AF3", "Theta")
-        af4_theta = safe_col_mean(session_df, "AF4", "Theta")
-        t7_theta = safe_col_mean(session_df, "T7", "Theta")
-        t8_theta = safe_col_mean(session_df, "T8", "Theta")
-        af3_alpha = safe_col_mean(session_df, "AF3", "Alpha")
-        af4_alpha = safe_col_mean(session_df, "AF4", "Alpha")
-
-        numerator = np.nansum([af3_theta, af4_theta, t7_theta, t8_theta])
-        denominator = np.nansum([af3_alpha, af4_alpha])
-
-        if np.isnan(numerator):
-            score_val = None
-        else:
-            score_val = float(numerator / (denominator + epsilon))
-
-        results.append({
-            "TEST": "DIGIT SPAN",
-            "SCORE": score_val
-        })
+    numerator = _term_sum(numerator_terms)
+    denominator = _term_sum(denominator_terms)
+    if np.isnan(numerator):
+        return None
+    return float(numerator / (denominator + COGNITIVE_EPSILON))
 
+def analyze_cognitive_function(pow_tensor: PowTensor):
+    """
+    Hitung skor cognitive traits berdasarkan rumus di COGNITIVE_FORMULAS
+    (IKN untuk KRAEPELIN TEST, IWM untuk WCST, ISTM untuk DIGIT SPAN).
+
+    Menerima PowTensor (dengan index sesi) dari data POW.
+    Epsilon = 0.01
+    """
+    results = []
+    for test in COGNITIVE_FORMULAS:
+        if len(pow_tensor.session(test)):
+            means = pow_tensor.session_mean(test)
+            results.append({
+                "TEST": test,
+                "SCORE": cognitive_score(test, means, pow_tensor.channel_index, pow_tensor.band_index)
+            })
     return results
 
 
 # ### PERUBAHAN DIMULAI DI SINI ###
-def analyze_response_during_test(csv_path="cleaning.csv"):
+# Kolom tabel user_response -> kolom PM sumbernya (rata-rata per sesi).
+# Metrik stress tidak dipakai; 'RELAX' lama menjadi 'RELAXATION'.
+RESPONSE_METRICS = {
+    "ENGAGEMENT": 'PM.Engagement',
+    "INTEREST": 'PM.Interest',
+    "FOCUS": 'PM.Focus',
+    "RELAXATION": 'PM.Relaxation',
+    "ATTENTION": 'PM.Attention',
+}
+
+def analyze_response_during_test(df: pd.DataFrame, sessions: SessionIndex = None):
     """
     Fungsi ini dimodifikasi untuk menghitung metrik yang sesuai dengan
     struktur tabel 'user_response' yang baru.
+    Menerima frame hasil create_cleaning_frame yang berisi kolom PM.*.
     """
-    df = pd.read_csv(csv_path)
+    if sessions is None:
+        sessions = SessionIndex.from_frame(df, SESSION_DEFINITIONS)
     results = []
 
-    for category, (start_time, end_time) in SESSION_DEFINITIONS.items():
-        session_df = df[(df['time'] >= start_time) & (df['time'] < end_time)]
+    for category in SESSION_DEFINITIONS:
+        session_df = sessions.frame(df, category)
         
         if not session_df.empty:
-            # Menghitung metrik baru: engagement dan interest
-            # Menghapus metrik lama: stress
-            # Mengganti nama 'RELAX' menjadi 'RELAXATION' untuk konsistensi
-            results.append({
-                "CATEGORY": category,
-                "ENGAGEMENT": session_df['PM.Engagement'].mean(),
-                "INTEREST": session_df['PM.Interest'].mean(),
-                "FOCUS": session_df['PM.Focus'].mean(),
-                "RELAXATION": session_df['PM.Relaxation'].mean(),
-                "ATTENTION": session_df['PM.Attention'].mean()
-            })
+            row = {"CATEGORY": category}
+            # Kolom PM disimpan float32 (pm_engine.py); rata-rata dikembalikan sebagai float Python
+            # agar hasil analisis bisa dikirim lewat serializer JSON Celery
+            row.update({metric: float(nanmean(session_df[column].to_numpy()))
+                        for metric, column in RESPONSE_METRICS.items()})
+            results.append(row)
             
     return results
 
 # ==================================
-# 3. FUNGSI VISUALISASI (Diperbarui agar tahan terhadap variasi nama POW)
+# 3. SKOR ROC (numerik saja; gambar dirender di plotting.py / render_cache.py)
 # ==================================
-def generate_all_topoplots(cleaning2_path="cleaning2.csv", output_dir="static/topoplots", username="default"):
-    os.makedirs(output_dir, exist_ok=True)
-    df = pd.read_csv(cleaning2_path)
-
-    ch_names = ['AF3', 'T7', 'Pz', 'T8', 'AF4']
-    info = mne.create_info(ch_names=ch_names, sfreq=256, ch_types='eeg')
-    montage = mne.channels.make_standard_montage('standard_1020')
-    info.set_montage(montage)
-
-    sessions_to_plot = {k: v for k, v in SESSION_DEFINITIONS.items() if k not in ['OPEN EYES', 'CLOSED EYES', 'AUTOBIOGRAPHY']}
-
-    band_list = [
-        ("Theta", "Theta"),
-        ("Alpha", "Alpha"),
-        ("Beta", "Beta"),
-        ("High Beta", "BetaH"),
-        ("Gamma", "Gamma")
-    ]
-
-    for session_name, (start_time, end_time) in sessions_to_plot.items():
-        session_df = df[(df['time'] >= start_time) & (df['time'] < end_time)]
-        if session_df.empty:
-            continue
-
-        fig, axes = plt.subplots(1, len(band_list), figsize=(5 * len(band_list), 6))
-
-        for i, (band_title, band_code) in enumerate(band_list):
-            ax = axes[i]
-            # buat list kolom sesuai urutan ch_names
-            band_cols = []
-            for ch in ch_names:
-                col = find_pow_col(session_df, ch, band_code)
-                band_cols.append(col)
-
-            # ambil rata-rata tiap channel (keeping order)
-            avg_values = []
-            for col in band_cols:
-                if col is None:
-                    avg_values.append(np.nan)
-                else:
-                    vals = session_df[col].dropna().values
-                    avg_values.append(float(np.mean(vals)) if len(vals) > 0 else np.nan)
-
-            avg_values = np.array(avg_values, dtype=float)
-
-            # handle case semua nan
-            if np.all(np.isnan(avg_values)):
-                # isi dengan zeros supaya plot tidak crash, tapi beri peringatan
-                avg_values = np.zeros(len(ch_names))
-                vmin = 0.0
-                vmax = 0.0
-            else:
-                vmin = np.nanmin(avg_values)
-                vmax = np.nanmax(avg_values)
-                if vmin == vmax:
-                    vmin -= 1e-9
-                    vmax += 1e-9
-
-            im, _ = mne.viz.plot_topomap(avg_values, info, axes=ax, show=False, names=ch_names, cmap='jet')
-            im.set_clim(vmin, vmax)
-
-            for text in ax.texts:
-                if text.get_text() in ch_names:
-                    text.set_fontweight('bold')
-                    text.set_fontsize(12)
-
-            cbar = fig.colorbar(im, ax=ax, orientation='horizontal', pad=0.1, shrink=0.8)
-            cbar.set_label('Power ($\\mu V^2$)', fontsize=10)
-            cbar.ax.tick_params(labelsize=10)
-            ax.set_title(band_title, fontsize=12, fontweight='bold')
-
-        fig.suptitle(f'Topoplot Aktivitas Otak: {session_name}', fontsize=16, y=0.98, fontweight='bold')
-        plt.tight_layout(rect=[0, 0.05, 1, 0.95])
-
-        filename = f"{username}_topoplot_{session_name.lower().replace(' ', '_')}.png"
-        output_file = os.path.join(output_dir, filename)
-        plt.savefig(output_file, dpi=150)
-        plt.close(fig)
-
-def generate_roc_curves(cleaning2_path="cleaning2.csv", output_dir="static/roc_curves", username="default"):
-    os.makedirs(output_dir, exist_ok=True)
-    df = pd.read_csv(cleaning2_path)
-
-    channels = ['AF3', 'T7', 'Pz', 'T8', 'AF4']
-    bands_map = {
-        'Theta': 'Theta',
-        'Alpha': 'Alpha',
-        'Beta': 'Beta',
-        'Gamma': 'Gamma'
-    }
+ROC_CHANNELS = ['AF3', 'T7', 'Pz', 'T8', 'AF4']
+ROC_BANDS = {
+    'Theta': 'Theta',
+    'Alpha': 'Alpha',
+    'Beta': 'Beta',
+    'Gamma': 'Gamma'
+}
+# Sesi yang punya gambar topoplot (semua kecuali sesi baseline)
+TOPOPLOT_SESSIONS = [name for name in SESSION_DEFINITIONS if name not in ('OPEN EYES', 'CLOSED EYES', 'AUTOBIOGRAPHY')]
+ROC_TASK_SESSIONS = ['OPENESS', 'CONSCIENTIOUSNESS', 'EXTRAVERSION', 'AGREEABLENESS', 'NEUROTICISM', 'KRAEPELIN TEST', 'WCST', 'DIGIT SPAN']
 
-    baseline_start, baseline_end = SESSION_DEFINITIONS['AUTOBIOGRAPHY']
-    df_baseline = df[(df['time'] >= baseline_start) & (df['time'] < baseline_end)]
 
-    task_sessions_names = ['OPENESS', 'CONSCIENTIOUSNESS', 'EXTRAVERSION', 'AGREEABLENESS', 'NEUROTICISM', 'KRAEPELIN TEST', 'WCST', 'DIGIT SPAN']
+def exact_roc(baseline: np.ndarray, tasks):
+    """
+    ROC eksak baseline (kelas 0) vs setiap sesi tugas (kelas 1) untuk semua kolom
+    (mis. channel x band) sekaligus, dari satu pengurutan per sesi.
+
+    Skor gabungan diurutkan menurun; cumsum label memberi TP/FP pada setiap batas
+    kelompok nilai sama (ties), yaitu titik-titik kurva ROC. Luas trapesium di
+    bawah titik-titik tersebut sama persis dengan statistik Mann-Whitney
+    U / (n_task * n_baseline), dengan ties bernilai 1/2. NaN diabaikan per kolom.
+
+    Args:
+        baseline (np.ndarray): (n_baseline x kolom...).
+        tasks (list[np.ndarray]): Skor tiap sesi tugas, (n_task_i x kolom...).
+
+    Returns:
+        tuple: (auc, fpr, tpr, is_point). auc berbentuk (n_sesi x kolom...), NaN jika
+        salah satu kelas kosong; fpr/tpr/is_point berbentuk (n_sesi x n_baris x kolom...),
+        titik kurva adalah baris dengan is_point True (diawali titik (0, 0)).
+    """
+    baseline = np.asarray(baseline, dtype=float)
+    n_baseline = len(baseline)
+    n_rows = n_baseline + max((len(task) for task in tasks), default=0)
+    shape = (len(tasks), n_rows) + baseline.shape[1:]
+
+    # Baris padding/NaN bernilai -inf dengan bobot 0: selalu di akhir urutan dan tidak menambah TP/FP
+    values = np.full(shape, -np.inf)
+    negative = np.zeros(shape)
+    positive = np.zeros(shape)
+    values[:, :n_baseline] = baseline
+    negative[:, :n_baseline] = 1.0
+    for i, task in enumerate(tasks):
+        values[i, n_baseline:n_baseline + len(task)] = task
+        positive[i, n_baseline:n_baseline + len(task)] = 1.0
+    missing = np.isnan(values)
+    values[missing] = -np.inf
+    negative[missing] = 0.0
+    positive[missing] = 0.0
+
+    order = np.argsort(-values, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    sorted_positive = np.take_along_axis(positive, order, axis=1)
+    sorted_negative = np.take_along_axis(negative, order, axis=1)
+    tp = np.cumsum(sorted_positive, axis=1)
+    fp = np.cumsum(sorted_negative, axis=1)
+
+    # Titik kurva = baris terakhir setiap kelompok nilai yang sama (kecuali kelompok padding)
+    is_point = np.ones(shape, dtype=bool)
+    is_point[:, :-1] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    is_point &= (sorted_positive + sorted_negative) > 0
+
+    # TP/FP pada titik sebelumnya (TP/FP tidak turun, jadi cukup maximum.accumulate)
+    tp_prev = np.zeros(shape)
+    fp_prev = np.zeros(shape)
+    tp_prev[:, 1:] = np.maximum.accumulate(np.where(is_point, tp, 0.0), axis=1)[:, :-1]
+    fp_prev[:, 1:] = np.maximum.accumulate(np.where(is_point, fp, 0.0), axis=1)[:, :-1]
+    area = np.sum(np.where(is_point, (fp - fp_prev) * (tp + tp_prev), 0.0), axis=1) / 2
+
+    n_positive, n_negative = tp[:, -1], fp[:, -1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        auc = np.where((n_positive > 0) & (n_negative > 0), area / (n_positive * n_negative), np.nan)
+        fpr = fp / n_negative[:, np.newaxis]
+        tpr = tp / n_positive[:, np.newaxis]
+    return auc, fpr, tpr, is_point
+
+
+class RocScores:
+    """
+    Hasil exact_roc untuk semua kolom (channel, band) yang tersedia.
 
+    Atribut:
+        columns (list): Pasangan (channel, band_key) sesuai urutan kolom.
+        sessions (list): Nama sesi tugas sesuai urutan baris auc.
+        auc (np.ndarray): AUC (n_sesi x n_kolom), NaN jika baseline/sesi kosong.
+        fpr, tpr, is_point (np.ndarray): Keluaran exact_roc (n_sesi x n_baris x n_kolom).
+    """
+    def __init__(self, columns, sessions, auc, fpr, tpr, is_point):
+        self.columns = list(columns)
+        self.sessions = list(sessions)
+        self.auc = auc
+        self.fpr, self.tpr, self.is_point = fpr, tpr, is_point
+
+    def curves(self, k: int):
+        """Kurva kolom ke-k: list (sesi, AUC, fpr, tpr) untuk sesi yang punya AUC, diawali titik (0, 0)."""
+        curves = []
+        for s, session_name in enumerate(self.sessions):
+            if np.isnan(self.auc[s, k]):
+                continue  # baseline atau sesi tugas kosong
+            points = self.is_point[s, :, k]
+            curves.append((session_name, float(self.auc[s, k]),
+                           np.concatenate([[0.0], self.fpr[s, points, k]]),
+                           np.concatenate([[0.0], self.tpr[s, points, k]])))
+        return curves
+
+    def all_aucs(self):
+        """{sesi: [AUC tiap kolom, urut channel lalu band]} untuk analyze_big_five."""
+        return {session_name: [float(value) for value in self.auc[s] if not np.isnan(value)]
+                for s, session_name in enumerate(self.sessions)}
+
+
+def score_roc_curves(pow_tensor: PowTensor) -> RocScores:
+    """AUC dan titik kurva semua (sesi tugas, channel x band) dari satu pengurutan per sesi."""
+    columns = [(channel, band_key, pow_tensor.channel_index(channel), pow_tensor.band_index(band_name))
+               for channel in ROC_CHANNELS for band_key, band_name in ROC_BANDS.items()
+               if pow_tensor.has(channel, band_name)]  # lewati kombinasi yang tidak ada kolomnya
+    c_idx = [c for _, _, c, _ in columns]
+    b_idx = [b for _, _, _, b in columns]
+
+    baseline = pow_tensor.session('AUTOBIOGRAPHY')[:, c_idx, b_idx]
+    tasks = [pow_tensor.session(name)[:, c_idx, b_idx] for name in ROC_TASK_SESSIONS]
+    auc, fpr, tpr, is_point = exact_roc(baseline, tasks)
+    return RocScores([(channel, band_key) for channel, band_key, _, _ in columns], ROC_TASK_SESSIONS,
+                     auc, fpr, tpr, is_point)
+
+
+def roc_figure_name(channel: str, band_key: str) -> str:
+    """Nama gambar ROC satu kolom, mis. 'AF3_theta'."""
+    return f"{channel}_{band_key.lower()}"
+
+
+def roc_result_rows(roc_scores: RocScores, username: str):
+    """
+    Baris tabel roc_curves per kolom. 'graph' adalah URL render-on-demand
+    (lihat render_cache.py); gambar baru dirender saat pertama kali diminta.
+    """
     roc_results = []
-    all_aucs = {session: [] for session in task_sessions_names}
-
-    for channel in channels:
-        for band_key, band_name in bands_map.items():
-            col_name = find_pow_col(df, channel, band_name)
-            if col_name is None:
-                continue  # tidak ada kolom untuk kombinasi ini
-
-            plt.figure(figsize=(10, 8))
-
-            for session_name in task_sessions_names:
-                task_start, task_end = SESSION_DEFINITIONS[session_name]
-                df_task_single = df[(df['time'] >= task_start) & (df['time'] < task_end)]
+    for channel, band_key in roc_scores.columns:
+        name = roc_figure_name(channel, band_key)
+        note = f"ROC Curves for {band_key} on {channel}, comparing Baseline (Autobiography) vs 8 individual Task Sessions."
+        roc_results.append({"name": name, "graph": roc_figure_path(username, name), "note": note})
+    return roc_results
 
-                baseline_scores = df_baseline[col_name].dropna().values
-                task_scores = df_task_single[col_name].dropna().values
 
-                if len(baseline_scores) == 0 or len(task_scores) == 0:
-                    continue
-
-                y_scores = np.concatenate([baseline_scores, task_scores])
-                y_true = np.concatenate([np.zeros(len(baseline_scores)), np.ones(len(task_scores))])
-
-                min_score, max_score = np.min(y_scores), np.max(y_scores)
-                if min_score == max_score:
-                    # degenerate case: buat sedikit range
-                    thresholds = np.array([min_score - 1e-6, min_score, min_score + 1e-6])
-                else:
-                    thresholds = np.linspace(min_score, max_score, 200)
-
-                tpr_list, fpr_list = [], []
-
-                for thresh in sorted(thresholds, reverse=True):
-                    y_pred = (y_scores >= thresh).astype(int)
-                    tp = np.sum((y_true == 1) & (y_pred == 1))
-                    fp = np.sum((y_true == 0) & (y_pred == 1))
-                    tn = np.sum((y_true == 0) & (y_pred == 0))
-                    fn = np.sum((y_true == 1) & (y_pred == 0))
-
-                    tpr = tp / (tp + fn) if (tp + fn) > 0 else 0
-                    fpr = fp / (fp + tn) if (fp + tn) > 0 else 0
-                    tpr_list.append(tpr)
-                    fpr_list.append(fpr)
-
-                auc = np.trapz(tpr_list, fpr_list)
-                all_aucs[session_name].append(auc)
-                plt.plot(fpr_list, tpr_list, lw=2.5, label=f'{session_name} (AUC = {auc:.2f})', solid_joinstyle='round')
-
-            plt.plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--')
-            plt.xlim([0.0, 1.0])
-            plt.ylim([0.0, 1.05])
-            plt.xlabel('False Positive Rate', fontsize=12)
-            plt.ylabel('True Positive Rate', fontsize=12)
-            plt.title(f'ROC: {band_key} on {channel} (Baseline vs Tasks)', fontsize=14, fontweight='bold')
-            plt.legend(loc="lower right", fontsize='small')
-            plt.grid(alpha=0.4)
-
-            filename = f"{username}_roc_{channel}_{band_key.lower()}.png"
-            output_file = os.path.join(output_dir, filename)
-            plt.savefig(output_file, dpi=120)
-            plt.close()
-
-            note = f"ROC Curves for {band_key} on {channel}, comparing Baseline (Autobiography) vs 8 individual Task Sessions."
-            roc_results.append({"graph": output_file, "note": note})
-
-    return roc_results, all_aucs
+def figure_arrays(pow_tensor: PowTensor, roc_scores: RocScores) -> dict:
+    """
+    Data numerik semua gambar satu kandidat, untuk disimpan RenderCache: rata-rata
+    (channel x band) tiap sesi topoplot dan titik kurva ROC tiap kolom.
+    """
+    sessions = [name for name in TOPOPLOT_SESSIONS if len(pow_tensor.session(name)) > 0]
+    means = np.full((len(sessions), len(pow_tensor.channels), len(pow_tensor.bands)), np.nan)
+    for i, session_name in enumerate(sessions):
+        means[i] = pow_tensor.session_mean(session_name)
+    return {
+        "channels": np.array(pow_tensor.channels),
+        "bands": np.array(pow_tensor.bands),
+        "topoplot_sessions": np.array(sessions),
+        "topoplot_means": means,
+        "roc_columns": np.array(roc_scores.columns).reshape(-1, 2),
+        "roc_sessions": np.array(roc_scores.sessions),
+        "roc_auc": roc_scores.auc,
+        "roc_fpr": roc_scores.fpr,
+        "roc_tpr": roc_scores.tpr,
+        "roc_is_point": roc_scores.is_point,
+    }
 
 # ======================
-# 4. RUN ANALYSIS UTAMA (DISesuaikan membaca cleaning2 untuk cognitive)
+# 4. RUN ANALYSIS UTAMA
 # ======================
-def run_full_analysis(path: str, user_id: int, username: str):
-    create_cleaning_csv(path)
-    create_cleaning2_csv(path)
-
-    # Perubahan: cognitive harus baca cleaning2.csv (POW)
-    cognitive = analyze_cognitive_function("cleaning2.csv")
-    response = analyze_response_during_test("cleaning.csv")
-
-    generate_all_topoplots("cleaning2.csv", username=username)
-    roc_results, all_aucs = generate_roc_curves("cleaning2.csv", username=username)
+FIGURE_DATA_ARTIFACT = "figure_data.npz"
+
+def _restore_cached_analysis(payload: dict, artifacts_dir: str, username: str, render_cache=None):
+    """Memasang data gambar dari cache untuk user ini; gambar dirender saat diminta."""
+    if render_cache is not None:
+        render_cache.put_figure_data_file(username, os.path.join(artifacts_dir, FIGURE_DATA_ARTIFACT))
+    roc_results = [
+        {"name": row['name'], "graph": roc_figure_path(username, row['name']), "note": row['note']}
+        for row in payload['roc']
+    ]
+    return payload['cognitive_function'], payload['response_during_test'], payload['big_five'], roc_results
 
-    big_five = analyze_big_five(all_aucs)
+def run_full_analysis(path: str, user_id: int, username: str, cache=None, cache_key: str = None,
+                      render_cache=None, save: bool = True):
+    """
+    Analisis lengkap satu kandidat dari file fitur, lalu simpan ke database.
+
+    Gambar topoplot/ROC tidak dirender di sini: data numeriknya disimpan ke
+    render_cache (RenderCache) dan URL hasil menunjuk endpoint render-on-demand.
+    Tanpa render_cache hanya skor yang dihitung. Jika cache (ArtifactCache) dan
+    cache_key diberikan, skor dan data gambar untuk rekaman yang sama diambil
+    dari cache alih-alih dihitung ulang. Dengan save=False hasil tidak ditulis ke
+    database dan tetap memuat "roc_results_db"; pemanggil menulisnya sendiri, mis.
+    sekaligus untuk satu batch lewat AnalysisRowBuffer.
+    """
+    cached = cache.get_analysis(cache_key) if cache is not None and cache_key else None
+    if cached is not None:
+        print(f"Hasil analisis ditemukan di cache ({cache_key[:12]}), perhitungan dilewati.")
+        cognitive, response, big_five, roc_results = _restore_cached_analysis(*cached, username, render_cache)
+    else:
+        # File fitur (biner, lihat feature_store.py) dimuat sekali saja
+        df = load_feature_table(path)
+        df_pm = create_cleaning_frame(df, source=path)
+        df_pow = create_cleaning2_frame(df, source=path)
+        del df
+
+        # Data POW dibangun sekali menjadi tensor (time x channel x band) + index sesi
+        pow_tensor = PowTensor.from_frame(df_pow, session_definitions=SESSION_DEFINITIONS)
+        del df_pow
+        pm_sessions = SessionIndex.from_frame(df_pm, SESSION_DEFINITIONS)
+
+        # Cognitive memakai data POW, response memakai data PM
+        cognitive = analyze_cognitive_function(pow_tensor)
+        response = analyze_response_during_test(df_pm, pm_sessions)
+
+        roc_scores = score_roc_curves(pow_tensor)
+        big_five = analyze_big_five(roc_scores.all_aucs())
+        roc_results = roc_result_rows(roc_scores, username)
 
     topoplot_sessions = ['KRAEPELIN_TEST', 'WCST', 'DIGIT_SPAN', 'OPENESS', 'CONSCIENTIOUSNESS', 'EXTRAVERSION', 'AGREEABLENESS', 'NEUROTICISM']
     topoplot_urls = {
-        s.upper(): f"{settings.BASE_URL}/static/topoplots/{username}_topoplot_{s.lower().replace(' ', '_')}.png"
+        s.upper(): f"{settings.BASE_URL}/{topoplot_figure_path(username, s.lower())}"
         for s in topoplot_sessions
     }
     roc_curve_urls = {
-        os.path.basename(res['graph']).replace('.png', ''): f"{settings.BASE_URL}/{res['graph']}"
+        f"{username}_roc_{res['name']}": f"{settings.BASE_URL}/{res['graph']}"
         for res in roc_results
     }
 
@@ -445,100 +412,181 @@ def run_full_analysis(path: str, user_id: int, username: str):
         "roc_curve_urls": roc_curve_urls,
         "roc_results_db": roc_results
     }
-    save_to_mysql(result, user_id, username)
-    del result["roc_results_db"]
+    if save:
+        save_to_mysql(result, user_id, username)
+        del result["roc_results_db"]
+
+    if cached is None and render_cache is not None:
+        figure_data_path = render_cache.put_figure_data(username, figure_arrays(pow_tensor, roc_scores))
+
+        # Entri cache hanya dibuat jika data gambarnya ada
+        if cache is not None and cache_key:
+            cache.put_analysis(cache_key, {
+                "cognitive_function": cognitive,
+                "response_during_test": response,
+                "big_five": big_five,
+                "roc": [{"name": row['name'], "note": row['note']} for row in roc_results],
+            }, {FIGURE_DATA_ARTIFACT: figure_data_path})
     return result
 
 # ======================
 # 5. SAVE KE DATABASE (DIMODIFIKASI)
 # ======================
-def save_to_mysql(results, user_id, username):
-    db = mysql.connector.connect(
-        host=settings.DB_HOST, port=settings.DB_PORT, user=settings.DB_USER,
-        password=settings.DB_PASSWORD, database=settings.DB_NAME
-    )
-    cursor = db.cursor()
-
-    def clean_nan(value):
-        """
-        Membersihkan nilai NaN dan mengonversi tipe data NumPy
-        menjadi tipe data standar Python agar kompatibel dengan database.
-        """
-        # Cek jika value adalah tipe float dari NumPy (misal: np.float64)
-        if isinstance(value, np.floating):
-            # Jika NaN, kembalikan None. Jika tidak, konversi ke float standar.
-            return None if np.isnan(value) else float(value)
-        
-        # Cek jika value adalah tipe integer dari NumPy (misal: np.int64)
-        if isinstance(value, np.integer):
-            return int(value)
-        
-        # Cek untuk float standar Python (menjaga logika lama)
-        if isinstance(value, float) and np.isnan(value):
-            return None
-            
-        return value
+# Kolom tiap tabel hasil analisis, sesuai urutan nilai pada setiap baris
+ANALYSIS_TABLES = {
+    'user_personalities': ('user_id', 'personality_id', 'score', 'brain_topography', 'brain_topography_url'),
+    'user_cognitive': ('user_id', 'test_id', 'score', 'brain_topography', 'brain_topography_url'),
+    'user_response': ('user_id', 'stimulation_id', 'engagement', 'interest', 'focus', 'relaxation', 'attention'),
+    'roc_curves': ('user_id', 'graph', 'note'),
+}
 
-    personality_ids = {
-        'OPENESS': 1, 'CONSCIENTIOUSNESS': 2, 'EXTRAVERSION': 3,
-        'AGREEABLENESS': 4, 'NEUROTICISM': 5
-    }
-    test_ids = {
-        'KRAEPELIN TEST': 1, 'WCST': 2, 'DIGIT SPAN': 3
-    }
-    stimulation_ids = {
-        'OPEN EYES': 1, 'CLOSED EYES': 2, 'AUTOBIOGRAPHY': 3, 'OPENESS': 4,
-        'CONSCIENTIOUSNESS': 5, 'EXTRAVERSION': 6, 'AGREEABLENESS': 7,
-        'NEUROTICISM': 8, 'KRAEPELIN TEST': 9, 'WCST': 10, 'DIGIT SPAN': 11
-    }
+PERSONALITY_IDS = {
+    'OPENESS': 1, 'CONSCIENTIOUSNESS': 2, 'EXTRAVERSION': 3,
+    'AGREEABLENESS': 4, 'NEUROTICISM': 5
+}
+TEST_IDS = {
+    'KRAEPELIN TEST': 1, 'WCST': 2, 'DIGIT SPAN': 3
+}
+STIMULATION_IDS = {
+    'OPEN EYES': 1, 'CLOSED EYES': 2, 'AUTOBIOGRAPHY': 3, 'OPENESS': 4,
+    'CONSCIENTIOUSNESS': 5, 'EXTRAVERSION': 6, 'AGREEABLENESS': 7,
+    'NEUROTICISM': 8, 'KRAEPELIN TEST': 9, 'WCST': 10, 'DIGIT SPAN': 11
+}
+
+
+def clean_nan(value):
+    """
+    Membersihkan nilai NaN dan mengonversi tipe data NumPy
+    menjadi tipe data standar Python agar kompatibel dengan database.
+    """
+    # Cek jika value adalah tipe float dari NumPy (misal: np.float64)
+    if isinstance(value, np.floating):
+        # Jika NaN, kembalikan None. Jika tidak, konversi ke float standar.
+        return None if np.isnan(value) else float(value)
+
+    # Cek jika value adalah tipe integer dari NumPy (misal: np.int64)
+    if isinstance(value, np.integer):
+        return int(value)
+
+    # Cek untuk float standar Python (menjaga logika lama)
+    if isinstance(value, float) and np.isnan(value):
+        return None
+
+    return value
+
+
+def analysis_rows(results, user_id, username):
+    """
+    Baris database hasil analisis satu kandidat. brain_topography tetap berisi nama
+    file topoplot seperti sebelumnya; brain_topography_url dan graph berisi path URL
+    gambar render-on-demand (tanpa BASE_URL), lihat render_cache.py.
+
+    Returns:
+        dict: {nama tabel: list tuple nilai} untuk setiap tabel ANALYSIS_TABLES.
+    """
+    rows = {table: [] for table in ANALYSIS_TABLES}
 
-    # Loop untuk 'big_five' (Sudah sesuai dari perubahan sebelumnya)
     for row in results['big_five']:
-        personality_id = personality_ids.get(row['PERSONALITY'].upper())
+        personality_id = PERSONALITY_IDS.get(row['PERSONALITY'].upper())
         if not personality_id: continue
-        cursor.execute(
-            "INSERT INTO user_personalities (user_id, personality_id, score, brain_topography) VALUES (%s, %s, %s, %s)",
-            (user_id, personality_id, clean_nan(row['SCORE']), f"{username}_topoplot_{row['PERSONALITY'].lower()}.png")
+        slug = session_slug(row['PERSONALITY'])
+        rows['user_personalities'].append(
+            (user_id, personality_id, clean_nan(row['SCORE']), topoplot_filename(username, slug),
+             topoplot_figure_path(username, slug))
         )
 
-    # Loop untuk 'cognitive_function' (Sudah sesuai dari perubahan sebelumnya)
     for row in results['cognitive_function']:
-        test_id = test_ids.get(row['TEST'].upper())
+        test_id = TEST_IDS.get(row['TEST'].upper())
         if not test_id: continue
-        cursor.execute(
-            "INSERT INTO user_cognitive (user_id, test_id, score, brain_topography) VALUES (%s, %s, %s, %s)",
-            (user_id, test_id, clean_nan(row['SCORE']), f"{username}_topoplot_{row['TEST'].lower().replace(' ', '_')}.png")
+        slug = session_slug(row['TEST'])
+        rows['user_cognitive'].append(
+            (user_id, test_id, clean_nan(row['SCORE']), topoplot_filename(username, slug),
+             topoplot_figure_path(username, slug))
         )
 
-    # ### PERUBAHAN DI SINI ###
-    # Loop untuk 'response_during_test'
     for row in results['response_during_test']:
-        stimulation_id = stimulation_ids.get(row['CATEGORY'].upper())
+        stimulation_id = STIMULATION_IDS.get(row['CATEGORY'].upper())
         if not stimulation_id: continue
-        # Query diubah agar sesuai dengan kolom tabel 'user_response' yang baru
-        cursor.execute(
-            "INSERT INTO user_response (user_id, stimulation_id, engagement, interest, focus, relaxation, attention) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-            (
-                user_id,
-                stimulation_id,
-                clean_nan(row.get('ENGAGEMENT')),  # Menggunakan .get() untuk keamanan
-                clean_nan(row.get('INTEREST')),
-                clean_nan(row.get('FOCUS')),
-                clean_nan(row.get('RELAXATION')),
-                clean_nan(row.get('ATTENTION'))
-            )
-        )
+        rows['user_response'].append((
+            user_id,
+            stimulation_id,
+            clean_nan(row.get('ENGAGEMENT')),  # Menggunakan .get() untuk keamanan
+            clean_nan(row.get('INTEREST')),
+            clean_nan(row.get('FOCUS')),
+            clean_nan(row.get('RELAXATION')),
+            clean_nan(row.get('ATTENTION'))
+        ))
+
+    for row in results.get('roc_results_db', []):
+        rows['roc_curves'].append((user_id, row['graph'].replace('\\', '/'), row['note']))
+
+    return rows
+
+
+def insert_statement(table, placeholder='%s'):
+    """INSERT untuk satu tabel ANALYSIS_TABLES; placeholder mengikuti paramstyle driver ('%s' mysql, '?' sqlite3)."""
+    columns = ANALYSIS_TABLES[table]
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+
 
-    # Loop untuk 'roc_curves' (Tidak ada perubahan)
-    if 'roc_results_db' in results:
-        for row in results['roc_results_db']:
-            graph_path = row['graph'].replace('\\', '/')
-            note = row['note']
-            cursor.execute(
-                "INSERT INTO roc_curves (user_id, graph, note) VALUES (%s, %s, %s)",
-                (user_id, graph_path, note)
-            )
-
-    db.commit()
-    cursor.close()
-    db.close()
+def write_analysis_rows(connection, rows, placeholder='%s'):
+    """
+    Menulis baris analysis_rows() (satu atau banyak kandidat) dalam satu transaksi:
+    satu executemany per tabel. mysql.connector menggabungkan executemany INSERT
+    menjadi satu INSERT multi-row, jadi satu round trip per tabel, bukan per baris.
+    """
+    cursor = connection.cursor()
+    try:
+        for table, values in rows.items():
+            if values:
+                cursor.executemany(insert_statement(table, placeholder), values)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def connect_mysql():
+    """Koneksi DB-API dari pool engine database.py; close() mengembalikannya ke pool."""
+    return engine.raw_connection()
+
+
+def save_to_mysql(results, user_id, username):
+    db = connect_mysql()
+    try:
+        write_analysis_rows(db, analysis_rows(results, user_id, username))
+    finally:
+        db.close()
+
+
+class AnalysisRowBuffer:
+    """
+    Menampung baris hasil analisis beberapa kandidat (mis. satu batch ingest) lalu
+    menulis semuanya sekaligus lewat flush(): satu koneksi, satu transaksi, satu
+    executemany per tabel. Hasil diambil dari run_full_analysis(..., save=False).
+    """
+    def __init__(self):
+        self.rows = {table: [] for table in ANALYSIS_TABLES}
+        self.candidates = 0
+
+    def add(self, results, user_id, username):
+        for table, values in analysis_rows(results, user_id, username).items():
+            self.rows[table].extend(values)
+        self.candidates += 1
+
+    def flush(self, connection=None, placeholder='%s'):
+        """Menulis semua baris yang tertampung; tanpa connection dipinjam koneksi dari pool."""
+        if self.candidates == 0:
+            return 0
+        db = connection if connection is not None else connect_mysql()
+        try:
+            write_analysis_rows(db, self.rows, placeholder)
+        finally:
+            if connection is None:
+                db.close()
+        flushed = self.candidates
+        self.rows = {table: [] for table in ANALYSIS_TABLES}
+        self.candidates = 0
+        return flushed
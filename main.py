@@ -1,9 +1,11 @@
-from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, status
+from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Header, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from typing import Annotated, Optional, List
 from sqlalchemy.orm import Session, joinedload
+import asyncio
 import uuid
 import os
 import shutil
@@ -12,7 +14,13 @@ import logging
 from fastapi.staticfiles import StaticFiles
 from celery import Celery
 from fastapi.responses import JSONResponse
-from tasks import process_analysis_task
+from tasks import start_analysis_pipeline, start_batch_pipeline, start_feature_analysis_pipeline, mark_user_error, artifact_cache, render_cache, UPLOAD_DIR
+from artifact_cache import copy_and_hash
+from batch_ingest import parse_manifest, extract_bundle, remove_files
+from upload_store import UploadStore, UploadStoreError, UploadOffsetError
+from realtime import RealtimeStreamStore, RealtimeError, RealtimeSequenceError
+from render_cache import FIGURE_URL_PREFIX, FigureNotFoundError
+from feature_store import FEATURE_FILE_SUFFIX
 from logger_config import setup_logger
 from datetime import date
 
@@ -21,13 +29,13 @@ import spacy
 import spacy.cli
 from sklearn.feature_extraction.text import TfidfVectorizer
 
-from tools import process_edf_to_final_csv, convert_edf_to_single_csv, process_edf_with_ica_to_csv
+from tools import process_edf_to_final_csv, process_edf_to_feature_file, convert_edf_to_single_csv, process_edf_with_ica_to_csv, OUTPUT_DIR
 from auth import get_current_user, get_password_hash, create_access_token, get_user, verify_password 
 from logic import run_full_analysis
 from database import get_db, engine
 import models
 import schemas
-from schemas import StandardResponse, AnalysisResult, User as UserSchema, FilePathPayload, TokenPayload, UserListPayload, PasswordChange
+from schemas import StandardResponse, AnalysisResult, User as UserSchema, FilePathPayload, TokenPayload, UserListPayload, PasswordChange, BatchPayload, BatchItemStatus, UploadStatusPayload, RealtimeStatusPayload
 from config import settings
 from generate_fix import generate_full_report
 from generate_fix_pendek import generate_short_report
@@ -41,7 +49,7 @@ from sklearn.feature_extraction.text import CountVectorizer
 from umap import UMAP
 from Sastrawi.StopWordRemover.StopWordRemoverFactory import StopWordRemoverFactory
 
-models.Base.metadata.create_all(bind=engine)
+models.create_all_tables()
 
 analysis_logger = setup_logger('analysis_logger', 'analysis.log')
 auth_logger = setup_logger('auth_logger', 'auth.log')
@@ -66,6 +74,19 @@ app.add_middleware(
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Sesi unggah bertahap disimpan di bawah UPLOAD_DIR agar commit cukup memindahkan file
+upload_store = UploadStore(
+    os.path.join(UPLOAD_DIR, "partial"),
+    max_chunk_bytes=settings.UPLOAD_CHUNK_MAX_BYTES,
+    stale_seconds=settings.UPLOAD_STALE_HOURS * 3600
+)
+
+# Stream realtime hidup di memori proses ini (lihat realtime.py)
+realtime_store = RealtimeStreamStore(
+    stale_seconds=settings.REALTIME_STALE_MINUTES * 60,
+    max_block_seconds=settings.REALTIME_MAX_BLOCK_SECONDS
+)
+
 print("Memuat model analisis sentimen, harap tunggu...")
 try:
     sentiment_analyzer = pipeline(
@@ -155,12 +176,7 @@ async def analyze_edf(
 ):
     analysis_logger.info(f"===== REQUEST ANALISIS DITERIMA UNTUK USER: {username} =====")
 
-    if pekerjaan:
-        pekerjaan_bersih = pekerjaan.strip().lower()
-        if pekerjaan_bersih in ["", "null", "none", "-", "tidak ada"]:
-            pekerjaan = None
-        else:
-            pekerjaan = pekerjaan.strip()
+    pekerjaan = _sanitize_pekerjaan(pekerjaan)
     
     # Jika pekerjaan adalah None, log akan mencatatnya
     analysis_logger.info(f"Status Pekerjaan setelah sanitisasi: {pekerjaan}")
@@ -171,6 +187,34 @@ async def analyze_edf(
         raise HTTPException(status_code=400, detail="Username for new client already registered")
     if not file.filename.lower().endswith('.edf'):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload an .edf file.")
+    new_user = await run_in_threadpool(
+        _register_client, db, fullname=fullname, username=username, password=password, company=company,
+        gender=gender, age=age, address=address, test_date=test_date, test_location=test_location,
+        pekerjaan=pekerjaan, operator_name=operator_name
+    )
+
+    # --- TUGAS CEPAT 2: Simpan File EDF ke upload store ---
+    # Pra-pemrosesan (ICA, filter, FFT) TIDAK dijalankan di sini agar event loop
+    # tidak terblokir; semuanya dikerjakan oleh worker Celery.
+    unique_id = uuid.uuid4()
+    edf_path = os.path.join(UPLOAD_DIR, f"{unique_id}_{file.filename.replace(' ', '_')}")
+    try:
+        analysis_logger.info(f"[Langkah 3] Menyimpan file EDF ke '{edf_path}'.")
+        content_hash = await run_in_threadpool(_save_upload, file, edf_path)
+    except Exception as e:
+        analysis_logger.error(f"Gagal pada tahap persiapan awal: {e}", exc_info=True)
+        if os.path.exists(edf_path):
+            os.remove(edf_path)
+        raise HTTPException(status_code=500, detail=f"Gagal pada tahap persiapan awal: {e}")
+
+    return _dispatch_analysis(edf_path, new_user.id, username, pekerjaan, operator_name, content_hash)
+
+def _register_client(db: Session, fullname, username, password, company, gender, age, address,
+                     test_date, test_location, pekerjaan, operator_name) -> models.User:
+    """
+    Membuat user klien baru (password di-hash) dan meng-commit-nya ke database.
+    Blocking (bcrypt + query): dari handler async panggil lewat run_in_threadpool.
+    """
     try:
         analysis_logger.info("Mencoba membuat objek user di memori...")
         new_user = models.User(
@@ -189,6 +233,7 @@ async def analyze_edf(
         db.refresh(new_user)
         
         analysis_logger.info(f"Registrasi user '{username}' (ID: {new_user.id}) berhasil.")
+        return new_user
 
     except Exception as e:
         # JIKA TERJADI ERROR, LOG INI AKAN TERCATAT SEBELUM CRASH!
@@ -196,41 +241,413 @@ async def analyze_edf(
         db.rollback() # Batalkan transaksi yang gagal
         raise HTTPException(status_code=500, detail=f"Database error during user registration: {e}")
 
-    # --- TUGAS CEPAT 2: Simpan & Konversi File EDF (Tetap di sini) ---
-    unique_id = uuid.uuid4()
-    temp_edf_path = f"./{unique_id}_{file.filename}"
-    processed_csv_path = f"./{unique_id}_processed.csv"
+def _unregister_client(db: Session, user: models.User):
+    """Membatalkan _register_client untuk user yang belum punya data analisis apa pun."""
+    db.delete(user)
+    db.commit()
+    analysis_logger.info(f"Registrasi user '{user.username}' dibatalkan.")
+
+def _dispatch_analysis(edf_path: str, user_id: int, username: str, pekerjaan: Optional[str], operator_name: str,
+                       content_hash: Optional[str] = None, on_failure=None):
+    """
+    Menjadwalkan pipeline Celery untuk EDF yang sudah ada di upload store, lalu langsung membalas 202.
+    Jika penjadwalan gagal, on_failure() dipanggil sebagai ganti menghapus EDF.
+    """
     try:
-        analysis_logger.info(f"[Langkah 3] Menyimpan & konversi file EDF ke CSV.")
-        with open(temp_edf_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        process_edf_to_final_csv(temp_edf_path, processed_csv_path) # Dari tools.py
-        analysis_logger.info(f"File CSV berhasil dibuat di '{processed_csv_path}'.")
-
-        # --- TUGAS BERAT: Delegasikan ke Celery! ---
-        analysis_logger.info(f"Mendelegasikan analisis penuh untuk user ID {new_user.id} ke background worker...")
-        process_analysis_task.delay(
-            processed_csv_path, new_user.id, username, pekerjaan
-        )
+        # --- TUGAS BERAT: Delegasikan seluruh pipeline ke Celery! ---
+        analysis_logger.info(f"Mendelegasikan pra-pemrosesan & analisis penuh untuk user ID {user_id} ke background worker...")
+        start_analysis_pipeline(edf_path, user_id, username, pekerjaan, ica_cache_key=operator_name,
+                                content_hash=content_hash)
 
         # --- LANGSUNG KEMBALIKAN RESPONSE (Jangan Menunggu) ---
         return JSONResponse(
             status_code=status.HTTP_202_ACCEPTED,
             content={
                 "message": "Permintaan analisis diterima dan sedang diproses di latar belakang.",
-                "user_id": new_user.id
+                "user_id": user_id
             }
         )
     except Exception as e:
         analysis_logger.error(f"Gagal pada tahap persiapan awal: {e}", exc_info=True)
+        # EDF hanya dihapus jika pipeline gagal dijadwalkan; jika berhasil, worker yang menghapusnya
+        if on_failure is not None:
+            on_failure()
+        elif os.path.exists(edf_path):
+            os.remove(edf_path)
         raise HTTPException(status_code=500, detail=f"Gagal pada tahap persiapan awal: {e}")
-    finally:
-        # Hanya membersihkan file .edf, karena .csv dibutuhkan oleh Celery
-        if os.path.exists(temp_edf_path):
-            os.remove(temp_edf_path)
+
+def _save_upload(file: UploadFile, destination: str) -> str:
+    """Menyalin isi UploadFile ke disk (dipanggil lewat threadpool); mengembalikan SHA-256 isinya."""
+    return copy_and_hash(file.file, destination)
+
+def _sanitize_pekerjaan(pekerjaan: Optional[str]) -> Optional[str]:
+    """Nilai pekerjaan kosong/placeholder ("null", "-", "tidak ada", ...) dianggap None."""
+    if pekerjaan:
+        pekerjaan_bersih = pekerjaan.strip().lower()
+        if pekerjaan_bersih in ["", "null", "none", "-", "tidak ada"]:
+            return None
+        return pekerjaan.strip()
+    return pekerjaan
+
+# ==============================================================================
+#  UNGGAHAN EDF BERTAHAP (RESUMABLE): init -> append (PUT per chunk) -> commit
+# ==============================================================================
+
+def _upload_error(e: UploadStoreError) -> HTTPException:
+    headers = {"Upload-Offset": str(e.current_offset)} if isinstance(e, UploadOffsetError) else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+@app.post("/v1/bwa/uploads", summary="Admin: Start a Resumable EDF Upload", response_model=StandardResponse[UploadStatusPayload], tags=["BWA"])
+async def init_upload(
+    current_admin: models.User = Depends(get_current_user),
+    filename: str = Form(...),
+    total_size: int = Form(..., description="Ukuran file EDF dalam byte."),
+    sha256: Optional[str] = Form(None, description="SHA-256 seluruh file (hex), diverifikasi saat commit.")
+):
+    if not filename.lower().endswith('.edf'):
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an .edf file.")
+    try:
+        upload = await run_in_threadpool(upload_store.init, filename, total_size, sha256)
+    except UploadStoreError as e:
+        raise _upload_error(e)
+    return StandardResponse(message="Sesi unggah dibuat.", payload=UploadStatusPayload(**upload))
+
+@app.get("/v1/bwa/uploads/{upload_id}", summary="Admin: Get Resumable Upload Offset", response_model=StandardResponse[UploadStatusPayload], tags=["BWA"])
+async def get_upload_status(upload_id: str, current_admin: models.User = Depends(get_current_user)):
+    try:
+        upload = upload_store.status(upload_id)
+    except UploadStoreError as e:
+        raise _upload_error(e)
+    return StandardResponse(message="Status unggah berhasil diambil.", payload=UploadStatusPayload(**upload))
+
+@app.put("/v1/bwa/uploads/{upload_id}", summary="Admin: Append a Chunk to a Resumable Upload", response_model=StandardResponse[UploadStatusPayload], tags=["BWA"])
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int,
+    x_chunk_sha256: str = Header(..., description="SHA-256 (hex) dari isi chunk."),
+    current_admin: models.User = Depends(get_current_user)
+):
+    """Body request adalah byte mentah chunk (application/octet-stream) yang dimulai pada `offset`."""
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > upload_store.max_chunk_bytes:
+        raise HTTPException(status_code=413, detail=f"Chunk melebihi batas {upload_store.max_chunk_bytes} byte.")
+    data = await request.body()
+    try:
+        upload = await run_in_threadpool(upload_store.append, upload_id, offset, data, x_chunk_sha256)
+    except UploadStoreError as e:
+        raise _upload_error(e)
+    return StandardResponse(message="Chunk diterima.", payload=UploadStatusPayload(**upload))
+
+@app.delete("/v1/bwa/uploads/{upload_id}", response_model=StandardResponse, summary="Admin: Abort a Resumable Upload", tags=["BWA"])
+async def abort_upload(upload_id: str, current_admin: models.User = Depends(get_current_user)):
+    try:
+        await run_in_threadpool(upload_store.abort, upload_id)
+    except UploadStoreError as e:
+        raise _upload_error(e)
+    return StandardResponse(message=f"Upload '{upload_id}' dibatalkan.")
+
+@app.post("/v1/bwa/uploads/{upload_id}/commit", summary="Admin: Commit an Upload, Register Client and Analyze", status_code=status.HTTP_202_ACCEPTED, tags=["BWA"])
+async def commit_upload_and_analyze(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(get_current_user),
+    fullname: str = Form(...),
+    username: str = Form(...),
+    password: str = Form(...),
+    company: str = Form(...),
+    gender: str = Form(...),
+    age: int = Form(...),
+    address: str = Form(...),
+    test_date: date = Form(...),
+    test_location: str = Form(...),
+    pekerjaan: Optional[str] = Form(None),
+    operator_name: str = Form(...)
+):
+    """
+    Sama dengan /v1/bwa/analyze/, tetapi EDF diambil dari sesi unggah yang sudah lengkap.
+    File dipindahkan (bukan disalin) dari upload store ke direktori pipeline.
+
+    Sesi unggah baru dilepas setelah pipeline terjadwal: jika registrasi atau
+    penjadwalan gagal, file tetap (atau dikembalikan) di upload store dan
+    registrasi dibatalkan, sehingga commit bisa diulang tanpa mengunggah ulang.
+    """
+    analysis_logger.info(f"===== COMMIT UPLOAD {upload_id} UNTUK USER: {username} =====")
+    pekerjaan = _sanitize_pekerjaan(pekerjaan)
+    if get_user(db, username):
+        raise HTTPException(status_code=400, detail="Username for new client already registered")
+    try:
+        upload = await run_in_threadpool(upload_store.verify, upload_id)
+    except UploadStoreError as e:
+        raise _upload_error(e)
+
+    new_user = await run_in_threadpool(
+        _register_client, db, fullname=fullname, username=username, password=password, company=company,
+        gender=gender, age=age, address=address, test_date=test_date, test_location=test_location,
+        pekerjaan=pekerjaan, operator_name=operator_name
+    )
+    try:
+        edf_path = await run_in_threadpool(upload_store.commit, upload_id, UPLOAD_DIR, False)
+    except UploadStoreError as e:
+        await run_in_threadpool(_unregister_client, db, new_user)
+        raise _upload_error(e)
+
+    def rollback():
+        upload_store.restore(upload_id, edf_path, upload)
+        _unregister_client(db, new_user)
+
+    return _dispatch_analysis(edf_path, new_user.id, username, pekerjaan, operator_name, on_failure=rollback)
+
+def _register_batch(db: Session, batch_id: str, candidates, password_hashes):
+    """
+    Membuat user semua kandidat batch beserta AnalysisBatchItem-nya dalam satu transaksi.
+    Blocking: dari handler async panggil lewat run_in_threadpool. Mengembalikan [(user_id, username)].
+    """
+    new_users = [
+        models.User(
+            fullname=c['fullname'], username=c['username'], password=password_hash,
+            company=c['company'], gender=c['gender'], age=c['age'], address=c['address'],
+            jobs=_sanitize_pekerjaan(c['pekerjaan']), test_date=c['test_date'],
+            test_location=c['test_location'], operator=c['operator_name']
+        )
+        for c, password_hash in zip(candidates, password_hashes)
+    ]
+    db.add_all(new_users)
+    db.flush()
+    db.add_all([
+        models.AnalysisBatchItem(batch_id=batch_id, user_id=user.id, edf_filename=c['edf_filename'])
+        for user, c in zip(new_users, candidates)
+    ])
+    registered = [(user.id, user.username) for user in new_users]
+    db.commit()
+    return registered
+
+@app.post("/v1/bwa/analyze/batch", summary="Admin: Register a Cohort and Analyze a Bundle of EDFs", status_code=status.HTTP_202_ACCEPTED, response_model=StandardResponse[BatchPayload], tags=["BWA"])
+async def analyze_edf_batch(
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(get_current_user),
+    files: List[UploadFile] = File(..., description="Satu/lebih file .zip berisi EDF, atau beberapa file .edf."),
+    manifest: UploadFile = File(..., description="Manifest biodata kandidat (.csv atau .json), satu baris per kandidat dengan kolom edf_filename.")
+):
+    """
+    Registrasi banyak kandidat sekaligus (satu sesi tes kohort) dan jadwalkan
+    pipeline analisis untuk masing-masing. Semua user dibuat dalam satu transaksi;
+    progres per kandidat dapat dipantau lewat GET /v1/bwa/analyze/batch/{batch_id}.
+    """
+    # --- Langkah 1: Validasi manifest & username ---
+    try:
+        candidates = parse_manifest(manifest.filename, await manifest.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    analysis_logger.info(f"===== REQUEST BATCH DITERIMA: {len(candidates)} KANDIDAT =====")
+
+    usernames = [candidate['username'] for candidate in candidates]
+    existing = [row.username for row in db.query(models.User.username).filter(models.User.username.in_(usernames))]
+    if existing:
+        raise HTTPException(status_code=400, detail=f"Username berikut sudah terdaftar: {existing}")
+
+    # --- Langkah 2: Salin EDF ke upload store (threadpool) ---
+    try:
+        edf_paths = await run_in_threadpool(
+            extract_bundle, [(f.filename, f.file) for f in files],
+            [candidate['edf_filename'] for candidate in candidates], UPLOAD_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # --- Langkah 3: Hash password paralel di threadpool, lalu registrasi dalam satu transaksi ---
+    batch_id = str(uuid.uuid4())
+    try:
+        password_hashes = await asyncio.gather(
+            *(run_in_threadpool(get_password_hash, candidate['password']) for candidate in candidates))
+        registered = await run_in_threadpool(_register_batch, db, batch_id, candidates, password_hashes)
+        analysis_logger.info(f"Batch {batch_id}: {len(registered)} user berhasil diregistrasi.")
+    except Exception as e:
+        analysis_logger.error(f"Batch {batch_id}: registrasi gagal, transaksi dibatalkan. Error: {e}", exc_info=True)
+        await run_in_threadpool(db.rollback)
+        remove_files(edf_paths.values())
+        raise HTTPException(status_code=500, detail=f"Database error during batch registration: {e}")
+
+    # --- Langkah 4: Fan-out pipeline ke worker Celery (chord: hasil seluruh batch ditulis sekaligus) ---
+    items = [
+        {"edf_path": edf_paths[c['edf_filename']], "user_id": user_id, "username": username,
+         "pekerjaan": _sanitize_pekerjaan(c['pekerjaan']), "ica_cache_key": c['operator_name']}
+        for (user_id, username), c in zip(registered, candidates)
+    ]
+    try:
+        start_batch_pipeline(batch_id, items)
+    except Exception as e:
+        analysis_logger.error(f"Batch {batch_id}: gagal menjadwalkan pipeline: {e}", exc_info=True)
+        remove_files([item['edf_path'] for item in items])
+        for item in items:
+            mark_user_error(item['user_id'], item['username'], f"Gagal menjadwalkan pipeline: {e}")
+
+    return StandardResponse(message="Batch analisis diterima dan sedang diproses di latar belakang.",
+                            payload=_batch_payload(db, batch_id))
+
+def _batch_item_status(user: models.User) -> str:
+    """Tahap pipeline seorang kandidat, diturunkan dari kolom hasil di tabel users."""
+    if user.is_error:
+        return "error"
+    if user.laporan_pendek:
+        return "selesai"
+    if user.laporan_panjang:
+        return "laporan_panjang_selesai"
+    if user.cognitive_data:
+        return "analisis_selesai"
+    return "diproses"
+
+def _batch_payload(db: Session, batch_id: str) -> Optional[BatchPayload]:
+    items = (
+        db.query(models.AnalysisBatchItem)
+        .options(joinedload(models.AnalysisBatchItem.user).selectinload(models.User.cognitive_data))
+        .filter(models.AnalysisBatchItem.batch_id == batch_id)
+        .order_by(models.AnalysisBatchItem.id)
+        .all()
+    )
+    if not items:
+        return None
+    statuses = [
+        BatchItemStatus(
+            user_id=item.user_id, username=item.user.username, edf_filename=item.edf_filename,
+            status=_batch_item_status(item.user), error_message=item.user.error_message
+        )
+        for item in items
+    ]
+    return BatchPayload(
+        batch_id=batch_id, total=len(statuses),
+        completed=sum(s.status == "selesai" for s in statuses),
+        failed=sum(s.status == "error" for s in statuses),
+        items=statuses
+    )
+
+@app.get("/v1/bwa/analyze/batch/{batch_id}", response_model=StandardResponse[BatchPayload], summary="Admin: Get Batch Analysis Progress", tags=["BWA"])
+async def get_batch_progress(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(get_current_user)
+):
+    payload = _batch_payload(db, batch_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} tidak ditemukan.")
+    return StandardResponse(message="Progres batch berhasil diambil.", payload=payload)
+
+# ==============================================================================
+#  ANALISIS REALTIME: start -> PUT blok sampel selama tes -> finish
+# ==============================================================================
+
+def _realtime_error(e: RealtimeError) -> HTTPException:
+    headers = {"Realtime-Next-Seq": str(e.next_seq)} if isinstance(e, RealtimeSequenceError) else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+@app.post("/v1/bwa/realtime", summary="Admin: Start a Realtime Analysis Stream", response_model=StandardResponse[RealtimeStatusPayload], tags=["BWA"])
+async def start_realtime_stream(
+    current_admin: models.User = Depends(get_current_user),
+    sfreq: float = Form(..., description="Frekuensi sampling headset (Hz)."),
+    start_timestamp: Optional[float] = Form(None, description="Unix timestamp sampel pertama (default: waktu server).")
+):
+    try:
+        stream = realtime_store.create(sfreq, start_timestamp)
+    except RealtimeError as e:
+        raise _realtime_error(e)
+    analysis_logger.info(f"Stream realtime {stream.stream_id} dimulai (sfreq={sfreq}).")
+    return StandardResponse(message="Stream realtime dibuat.", payload=RealtimeStatusPayload(**stream.status()))
+
+@app.get("/v1/bwa/realtime/{stream_id}", summary="Admin: Get Realtime Stream Progress", response_model=StandardResponse[RealtimeStatusPayload], tags=["BWA"])
+async def get_realtime_stream(stream_id: str, current_admin: models.User = Depends(get_current_user)):
+    try:
+        stream = realtime_store.get(stream_id)
+    except RealtimeError as e:
+        raise _realtime_error(e)
+    return StandardResponse(message="Status stream berhasil diambil.", payload=RealtimeStatusPayload(**stream.status()))
+
+@app.put("/v1/bwa/realtime/{stream_id}/samples", summary="Admin: Append a Block of Headset Samples", response_model=StandardResponse[RealtimeStatusPayload], tags=["BWA"])
+async def append_realtime_samples(
+    stream_id: str,
+    request: Request,
+    seq: int,
+    current_admin: models.User = Depends(get_current_user)
+):
+    """
+    Body: blok sampel µV dengan kolom sesuai `channels`, sebagai float32 little-endian
+    (application/octet-stream) atau JSON {"samples": [[...], ...]}. `seq` dimulai dari 0;
+    blok yang dikirim ulang diabaikan. Sesi yang selesai oleh blok ini ada di `newly_closed`.
+    """
+    body = await request.body()
+    try:
+        stream_status = await run_in_threadpool(
+            realtime_store.append, stream_id, seq, body, request.headers.get("content-type"))
+    except RealtimeError as e:
+        raise _realtime_error(e)
+    return StandardResponse(message="Blok sampel diterima.", payload=RealtimeStatusPayload(**stream_status))
+
+@app.delete("/v1/bwa/realtime/{stream_id}", response_model=StandardResponse, summary="Admin: Abort a Realtime Stream", tags=["BWA"])
+async def abort_realtime_stream(stream_id: str, current_admin: models.User = Depends(get_current_user)):
+    try:
+        realtime_store.remove(stream_id)
+    except RealtimeError as e:
+        raise _realtime_error(e)
+    return StandardResponse(message=f"Stream realtime '{stream_id}' dibatalkan.")
+
+@app.post("/v1/bwa/realtime/{stream_id}/finish", summary="Admin: Finish a Realtime Stream, Register Client and Analyze", status_code=status.HTTP_202_ACCEPTED, tags=["BWA"])
+async def finish_realtime_stream(
+    stream_id: str,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(get_current_user),
+    fullname: str = Form(...),
+    username: str = Form(...),
+    password: str = Form(...),
+    company: str = Form(...),
+    gender: str = Form(...),
+    age: int = Form(...),
+    address: str = Form(...),
+    test_date: date = Form(...),
+    test_location: str = Form(...),
+    pekerjaan: Optional[str] = Form(None),
+    operator_name: str = Form(...)
+):
+    """
+    Menutup stream, meregistrasi klien, lalu menjadwalkan analisis (skor, topoplot,
+    laporan) dari fitur yang sudah dihitung selama tes; tahap pra-pemrosesan EDF dilewati.
+    """
+    analysis_logger.info(f"===== FINISH STREAM REALTIME {stream_id} UNTUK USER: {username} =====")
+    pekerjaan = _sanitize_pekerjaan(pekerjaan)
+    if get_user(db, username):
+        raise HTTPException(status_code=400, detail="Username for new client already registered")
+    features_path = os.path.join(UPLOAD_DIR, f"realtime_{stream_id}_features{FEATURE_FILE_SUFFIX}")
+    try:
+        stream_status = await run_in_threadpool(realtime_store.finish, stream_id, features_path)
+    except RealtimeError as e:
+        raise _realtime_error(e)
+
+    try:
+        new_user = await run_in_threadpool(
+            _register_client, db, fullname=fullname, username=username, password=password, company=company,
+            gender=gender, age=age, address=address, test_date=test_date, test_location=test_location,
+            pekerjaan=pekerjaan, operator_name=operator_name
+        )
+        analysis_logger.info(f"Mendelegasikan analisis fitur realtime untuk user ID {new_user.id} ke background worker...")
+        start_feature_analysis_pipeline(features_path, new_user.id, username, pekerjaan)
+    except Exception as e:
+        # File fitur hanya dihapus jika pipeline gagal dijadwalkan; stream tetap ada agar finish bisa diulang
+        if os.path.exists(features_path):
+            os.remove(features_path)
+        if isinstance(e, HTTPException):
+            raise
+        analysis_logger.error(f"Gagal menjadwalkan analisis realtime: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Gagal pada tahap persiapan awal: {e}")
+
+    realtime_store.remove(stream_id)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "message": "Stream realtime selesai; analisis lengkap sedang diproses di latar belakang.",
+            "user_id": new_user.id,
+            "sessions": stream_status["closed_sessions"]
+        }
+    )
 
 @app.post("/v1/bwa/tools/edf-to-csv", summary="Convert EDF to a single CSV file", response_model=StandardResponse[FilePathPayload], tags=["BWA"])
-async def convert_edf_to_csv_endpoint(file: UploadFile = File(...)):
+def convert_edf_to_csv_endpoint(file: UploadFile = File(...)):
     temp_file_path = f"./{uuid.uuid4()}_{file.filename}"
     with open(temp_file_path, "wb") as f:
         shutil.copyfileobj(file.file, f)
@@ -243,7 +660,7 @@ async def convert_edf_to_csv_endpoint(file: UploadFile = File(...)):
             os.remove(temp_file_path)
 
 @app.post("/v1/bwa/tools/edf-to-ica-csv", summary="Process EDF with ICA and save to a single CSV", response_model=StandardResponse[FilePathPayload], tags=["BWA"])
-async def process_edf_with_ica_endpoint(file: UploadFile = File(...)):
+def process_edf_with_ica_endpoint(file: UploadFile = File(...)):
     temp_file_path = f"./{uuid.uuid4()}_{file.filename}"
     with open(temp_file_path, "wb") as f:
         shutil.copyfileobj(file.file, f)
@@ -255,6 +672,29 @@ async def process_edf_with_ica_endpoint(file: UploadFile = File(...)):
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
 
+@app.post("/v1/bwa/tools/edf-to-features", summary="Process EDF into POW/PM features (CSV or binary)", response_model=StandardResponse[FilePathPayload], tags=["BWA"])
+def process_edf_to_features_endpoint(file: UploadFile = File(...), output_format: str = Form("csv")):
+    if output_format not in ("csv", "npy"):
+        raise HTTPException(status_code=400, detail="output_format harus 'csv' atau 'npy'.")
+    temp_file_path = f"./{uuid.uuid4()}_{file.filename}"
+    content_hash = copy_and_hash(file.file, temp_file_path)
+    try:
+        base_filename = os.path.splitext(file.filename.replace(' ', '_'))[0]
+        output_path = os.path.join(OUTPUT_DIR, f"{base_filename}_features.{output_format}")
+        if output_format == "csv":
+            process_edf_to_final_csv(temp_file_path, output_path, cache=artifact_cache, content_hash=content_hash)
+        else:
+            process_edf_to_feature_file(temp_file_path, output_path, cache=artifact_cache, content_hash=content_hash)
+        clean_path = output_path.replace('\\', '/')
+        return StandardResponse(message="File EDF berhasil diproses menjadi fitur POW/PM.", payload=FilePathPayload(file_path=clean_path))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Gagal memproses file EDF: {str(e)}")
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
 @app.get(
     "/v1/bwa/tools/download", 
     summary="Download a generated file", 
@@ -277,6 +717,40 @@ async def download_file(filepath: str):
         filename=os.path.basename(filepath)
     )
 
+# Gambar topoplot/ROC dirender saat pertama kali diminta lalu di-cache di disk (lihat render_cache.py)
+FIGURE_RESPONSES = {
+    200: {"content": {"image/png": {}}, "description": "Returns the rendered PNG."},
+    403: {"description": "Not allowed to view this candidate's figures"},
+    404: {"description": "Figure not found"},
+}
+
+def _check_figure_access(current_user: models.User, username: str):
+    """Gambar kandidat hanya boleh dilihat admin atau kandidat itu sendiri."""
+    if current_user.roles != 'admin' and current_user.username != username:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Anda tidak memiliki izin untuk melihat gambar ini.")
+
+# Isi gambar dibaca di threadpool dan dikirim dari memori: path cache bisa di-evict
+# proses lain setelah dirender, sebelum FileResponse sempat membukanya
+@app.get(f"/{FIGURE_URL_PREFIX}/{{username}}/topoplot/{{session}}.png", summary="Render a Candidate Topoplot On Demand", tags=["BWA"], responses=FIGURE_RESPONSES)
+async def get_topoplot_figure(username: str, session: str, current_user: models.User = Depends(get_current_user)):
+    """Topoplot satu sesi (mis. 'kraepelin_test') milik kandidat, dirender dari hasil analisis yang tersimpan."""
+    _check_figure_access(current_user, username)
+    try:
+        content = await run_in_threadpool(render_cache.topoplot_bytes, username, session)
+    except FigureNotFoundError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(content=content, media_type="image/png")
+
+@app.get(f"/{FIGURE_URL_PREFIX}/{{username}}/roc/{{name}}.png", summary="Render a Candidate ROC Curve On Demand", tags=["BWA"], responses=FIGURE_RESPONSES)
+async def get_roc_figure(username: str, name: str, current_user: models.User = Depends(get_current_user)):
+    """Kurva ROC satu channel x band (mis. 'AF3_theta') milik kandidat, dirender dari hasil analisis yang tersimpan."""
+    _check_figure_access(current_user, username)
+    try:
+        content = await run_in_threadpool(render_cache.roc_bytes, username, name)
+    except FigureNotFoundError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(content=content, media_type="image/png")
+
 @app.delete("/v1/bwa/users/{user_id}", response_model=StandardResponse, summary="Admin: Delete a User", tags=["BWA"])
 async def delete_user(
     user_id: int,
@@ -313,6 +787,7 @@ async def delete_user(
 
     db.delete(user_to_delete)
     db.commit()
+    render_cache.remove(user_to_delete.username)
 
     return StandardResponse(message=f"User '{user_to_delete.username}' (ID: {user_id}) dan semua data terkaitnya berhasil dihapus.")
 
@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, String, Text, Enum, Date, Float, Double, ForeignKey, Boolean
+    Column, Integer, String, Text, Enum, Date, Float, Double, ForeignKey, Boolean, inspect, text
 )
 from sqlalchemy.orm import relationship
 from database import Base, engine
@@ -36,6 +36,7 @@ class User(Base):
     cognitive_data = relationship("UserCognitive", back_populates="user", cascade="all, delete-orphan")
     response_data = relationship("UserResponse", back_populates="user", cascade="all, delete-orphan")
     roc_curves = relationship("ROCCurve", back_populates="user", cascade="all, delete-orphan")
+    batch_items = relationship("AnalysisBatchItem", back_populates="user", cascade="all, delete-orphan")
 
 # ==============================================================================
 #  2. TABEL LOOKUP (MASTER DATA)
@@ -74,7 +75,8 @@ class UserPersonality(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     personality_id = Column(Integer, ForeignKey("personalities.id"), nullable=False)
     score = Column(Float, nullable=True)
-    brain_topography = Column(String(255), nullable=True)
+    brain_topography = Column(String(255), nullable=True)  # nama file topoplot, mis. 'budi_topoplot_openess.png'
+    brain_topography_url = Column(String(255), nullable=True)  # path URL render-on-demand (tanpa BASE_URL)
     user = relationship("User", back_populates="personalities_data")
     personality = relationship("Personality", back_populates="user_personalities")
 
@@ -85,6 +87,7 @@ class UserCognitive(Base):
     test_id = Column(Integer, ForeignKey("tests.id"), nullable=False)
     score = Column(Float)
     brain_topography = Column(String(255))
+    brain_topography_url = Column(String(255), nullable=True)
     user = relationship("User", back_populates="cognitive_data")
     test = relationship("Test", back_populates="user_cognitive_data")
 
@@ -109,9 +112,45 @@ class ROCCurve(Base):
     note = Column(Text, nullable=True)
     user = relationship("User", back_populates="roc_curves")
 
+# ==============================================================================
+#  4. TABEL BATCH (INGEST MULTI-KANDIDAT)
+# ==============================================================================
+
+class AnalysisBatchItem(Base):
+    """
+    Satu kandidat di dalam batch analisis. Semua item dari satu request batch
+    berbagi batch_id yang sama; progres tiap kandidat dibaca dari tabel users.
+    """
+    __tablename__ = "analysis_batch_items"
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String(36), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    edf_filename = Column(String(255), nullable=False)
+    user = relationship("User", back_populates="batch_items")
+
+# Kolom yang ditambahkan setelah tabelnya dibuat; create_all tidak mengubah tabel yang sudah ada
+ADDED_COLUMNS = {
+    'user_personalities': {'brain_topography_url': 'VARCHAR(255) NULL'},
+    'user_cognitive': {'brain_topography_url': 'VARCHAR(255) NULL'},
+}
+
+def add_missing_columns():
+    """Menambahkan kolom ADDED_COLUMNS yang belum ada (ALTER TABLE); aman dijalankan berulang."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, columns in ADDED_COLUMNS.items():
+            if not inspector.has_table(table):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                    print(f"Kolom {table}.{name} ditambahkan.")
+
 def create_all_tables():
     print("Mencoba membuat tabel...")
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
     print("Tabel berhasil dibuat (jika belum ada).")
 
 if __name__ == "__main__":
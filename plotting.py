@@ -0,0 +1,328 @@
+# filename: plotting.py
+#
+# Rendering gambar hasil analisis (topoplot per sesi dan kurva ROC per channel x band).
+# Terpisah dari perhitungan skor di logic.py: skor dan baris database tidak
+# membutuhkan matplotlib, dan gambar dapat dirender belakangan atau tidak sama sekali.
+# render_topoplot/render_roc merender satu gambar dari data tersimpan (dipakai
+# render_cache.py); generate_all_topoplots/render_roc_curves merender semuanya sekaligus.
+#
+# Rendering memakai canvas Agg langsung (tanpa pyplot, tidak bergantung backend/display).
+# Figure topoplot dan ROC disusun sekali per proses dengan layout tetap, lalu dipakai
+# ulang untuk semua kandidat: setiap gambar hanya memperbarui data artist-nya.
+
+import os
+from functools import lru_cache
+
+import mne
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Ellipse
+from matplotlib.transforms import IdentityTransform
+
+from logic import ROC_TASK_SESSIONS, TOPOPLOT_SESSIONS, RocScores, roc_figure_name
+from pow_tensor import PowTensor
+
+TOPOPLOT_CHANNELS = ['AF3', 'T7', 'Pz', 'T8', 'AF4']
+TOPOPLOT_BANDS = [
+    ("Theta", "Theta"),
+    ("Alpha", "Alpha"),
+    ("Beta", "Beta"),
+    ("High Beta", "BetaH"),
+    ("Gamma", "Gamma")
+]
+# Layout tetap figure topoplot: hasil tight_layout(rect=[0, 0.05, 1, 0.95]) yang dibekukan
+TOPOPLOT_LAYOUT = dict(left=0.006, right=0.994, bottom=0.075, top=0.863, wspace=0.031)
+
+
+class TopomapRenderer:
+    """
+    Topomap untuk satu set channel tetap. Posisi sensor, outline kepala, dan
+    interpolasi dihitung sekali lalu dipakai ulang untuk setiap subplot.
+
+    Interpolasi mne.viz.plot_topomap (Clough-Tocher + titik ekstrapolasi kepala)
+    linear terhadap nilai channel, sehingga citra satu subplot cukup
+    interp_matrix (piksel x channel) @ nilai. Matriks disusun dari satu
+    plot_topomap per vektor basis; gaya artist statis (sensor, outline, nama
+    channel) disalin dari satu plot acuan agar hasilnya sama dengan plot_topomap.
+    """
+    CONTOURS = 6
+
+    def __init__(self, info, res=64):
+        self.ch_names = list(info.ch_names)
+        n_channels = len(self.ch_names)
+        ax = Figure().add_subplot()
+
+        basis = []
+        for values in np.eye(n_channels):
+            ax.clear()
+            im, _ = mne.viz.plot_topomap(values, info, axes=ax, show=False, contours=0, res=res)
+            basis.append(np.ma.filled(im.get_array(), np.nan).ravel())
+        self.interp_matrix = np.stack(basis, axis=1)
+        self.grid_shape = im.get_array().shape
+
+        # Plot acuan lengkap: sumber extent, batas sumbu, dan gaya setiap artist
+        ax.clear()
+        im, contour = mne.viz.plot_topomap(np.arange(1.0, n_channels + 1), info, axes=ax, show=False,
+                                           names=self.ch_names, contours=self.CONTOURS, res=res)
+        self.extent = im.get_extent()
+        xmin, xmax, ymin, ymax = self.extent
+        self.grid_x, self.grid_y = np.meshgrid(np.linspace(xmin, xmax, res), np.linspace(ymin, ymax, res))
+        self.image_zorder = im.get_zorder()
+        self.contour_style = dict(colors='k', linewidths=contour.get_linewidths()[0], zorder=contour.get_zorder())
+        sensors = next(c for c in ax.collections if isinstance(c, PathCollection))
+        self.sensor_style = dict(paths=sensors.get_paths(), sizes=sensors.get_sizes(), offsets=sensors.get_offsets(),
+                                 facecolors=sensors.get_facecolors(), edgecolors=sensors.get_edgecolors(),
+                                 linewidths=sensors.get_linewidths(), zorder=sensors.get_zorder())
+        self.outlines = [(line.get_xdata(), line.get_ydata(),
+                          dict(color=line.get_color(), linewidth=line.get_linewidth(),
+                               clip_on=line.get_clip_on(), zorder=line.get_zorder()))
+                         for line in ax.lines]
+        self.names = [(text.get_position(), text.get_text(), text.get_zorder()) for text in ax.texts]
+        self.xlim, self.ylim = ax.get_xlim(), ax.get_ylim()
+
+    def grid(self, values):
+        """Citra interpolasi (res x res) untuk nilai per channel (urutan ch_names)."""
+        values = np.asarray(values, dtype=float)
+        if np.all(values == values[0]):
+            # Nilai konstan: citra tepat konstan, tanpa derau pembulatan yang memunculkan kontur
+            return np.where(np.isnan(self.interp_matrix[:, 0]), np.nan, values[0]).reshape(self.grid_shape)
+        return (self.interp_matrix @ values).reshape(self.grid_shape)
+
+    def _contour(self, ax, grid, clip_path):
+        # Fungsi konstan tidak punya kontur (sama seperti plot_topomap)
+        if ((grid == grid.flat[0]) | np.isnan(grid)).all():
+            return None
+        contour = ax.contour(self.grid_x, self.grid_y, grid, self.CONTOURS, **self.contour_style)
+        contour.set_clip_path(clip_path)
+        return contour
+
+    def draw(self, ax, values, cmap='jet', vmin=None, vmax=None, name_style=None):
+        """
+        Menggambar topomap nilai per channel (urutan ch_names) ke ax.
+
+        Returns:
+            tuple: (AxesImage, QuadContourSet atau None), seperti mne.viz.plot_topomap.
+        """
+        grid = self.grid(values)
+        # Citra dan kontur dipotong lingkaran kepala (extent interpolasi = batas kepala)
+        xmin, xmax, ymin, ymax = self.extent
+        head = Ellipse(((xmin + xmax) / 2, (ymin + ymax) / 2), xmax - xmin, ymax - ymin, transform=ax.transData)
+
+        im = ax.imshow(grid, cmap=cmap, origin='lower', aspect='equal', extent=self.extent,
+                       interpolation='bilinear', vmin=vmin, vmax=vmax, zorder=self.image_zorder)
+        im.set_clip_path(head)
+        contour = self._contour(ax, grid, im.get_clip_path())
+
+        style = dict(self.sensor_style)
+        sensors = PathCollection(style.pop('paths'), offset_transform=ax.transData, **style)
+        sensors.set_transform(IdentityTransform())
+        ax.add_collection(sensors)
+        for x, y, line_style in self.outlines:
+            ax.plot(x, y, **line_style)
+        for (x, y), name, zorder in self.names:
+            ax.text(x, y, name, horizontalalignment='center', verticalalignment='center', zorder=zorder,
+                    **(name_style or {'size': 'x-small'}))
+
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_frame_on(False)
+        ax.set_xlim(self.xlim)
+        ax.set_ylim(self.ylim)
+        return im, contour
+
+    def update(self, ax, im, contour, values, vmin=None, vmax=None):
+        """Memperbarui topomap hasil draw() dengan nilai baru; mengembalikan kontur yang baru."""
+        grid = self.grid(values)
+        im.set_data(grid)
+        im.set_clim(vmin, vmax)
+        # QuadContourSet tidak bisa diperbarui datanya: diganti
+        if contour is not None:
+            contour.remove()
+        return self._contour(ax, grid, im.get_clip_path())
+
+
+@lru_cache(maxsize=None)
+def topoplot_info():
+    """Info MNE (channel TOPOPLOT_CHANNELS + montage standard_1020), dibangun sekali per proses."""
+    info = mne.create_info(ch_names=TOPOPLOT_CHANNELS, sfreq=256, ch_types='eeg')
+    montage = mne.channels.make_standard_montage('standard_1020')
+    info.set_montage(montage)
+    return info
+
+
+@lru_cache(maxsize=None)
+def topomap_renderer():
+    """TopomapRenderer untuk TOPOPLOT_CHANNELS, dibangun sekali per proses."""
+    return TopomapRenderer(topoplot_info())
+
+
+class TopoplotFigure:
+    """
+    Figure topoplot satu sesi (satu topomap + colorbar per band) yang disusun sekali
+    dengan layout tetap TOPOPLOT_LAYOUT. render() hanya memperbarui citra, kontur,
+    skala warna, dan judul. Tidak thread-safe (RenderCache menyerialkan render).
+    """
+    def __init__(self, renderer: TopomapRenderer):
+        self.renderer = renderer
+        self.figure = Figure(figsize=(5 * len(TOPOPLOT_BANDS), 6))
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.subplots(1, len(TOPOPLOT_BANDS))
+        self.images, self.contours = [], []
+
+        placeholder = np.zeros(len(renderer.ch_names))
+        for ax, (band_title, _) in zip(self.axes, TOPOPLOT_BANDS):
+            im, contour = renderer.draw(ax, placeholder, cmap='jet', vmin=0.0, vmax=1.0,
+                                        name_style={'fontweight': 'bold', 'fontsize': 12})
+            cbar = self.figure.colorbar(im, ax=ax, orientation='horizontal', pad=0.1, shrink=0.8)
+            cbar.set_label('Power ($\\mu V^2$)', fontsize=10)
+            cbar.ax.tick_params(labelsize=10)
+            ax.set_title(band_title, fontsize=12, fontweight='bold')
+            self.images.append(im)
+            self.contours.append(contour)
+
+        self.title = self.figure.suptitle('', fontsize=16, y=0.98, fontweight='bold')
+        self.figure.subplots_adjust(**TOPOPLOT_LAYOUT)
+
+    def render(self, session_name, session_means, band_positions, output_file, dpi=150):
+        """Menulis topoplot satu sesi; session_means berbentuk (channel x band), urutan ch_names renderer."""
+        for i, ax in enumerate(self.axes):
+            # rata-rata tiap channel sesuai urutan ch_names
+            avg_values = session_means[:, band_positions[i]]
+
+            # handle case semua nan
+            if np.all(np.isnan(avg_values)):
+                # isi dengan zeros supaya plot tidak crash, tapi beri peringatan
+                avg_values = np.zeros(len(self.renderer.ch_names))
+                vmin = 0.0
+                vmax = 0.0
+            else:
+                vmin = np.nanmin(avg_values)
+                vmax = np.nanmax(avg_values)
+                if vmin == vmax:
+                    vmin -= 1e-9
+                    vmax += 1e-9
+
+            self.contours[i] = self.renderer.update(ax, self.images[i], self.contours[i], avg_values, vmin, vmax)
+
+        self.title.set_text(f'Topoplot Aktivitas Otak: {session_name}')
+        self.figure.savefig(output_file, dpi=dpi)
+        return output_file
+
+
+@lru_cache(maxsize=None)
+def topoplot_figure():
+    """TopoplotFigure milik proses ini (dipakai ulang untuk semua sesi dan kandidat)."""
+    return TopoplotFigure(topomap_renderer())
+
+
+def render_topoplot(session_name, session_means, channels, bands, output_file):
+    """
+    Satu topoplot dari rata-rata sesi (channel x band, urutan channels/bands),
+    mis. data yang disimpan logic.figure_arrays.
+    """
+    channel_order = [list(channels).index(ch) for ch in TOPOPLOT_CHANNELS]
+    band_positions = [list(bands).index(band_code) for _, band_code in TOPOPLOT_BANDS]
+    return topoplot_figure().render(session_name, np.asarray(session_means)[channel_order], band_positions,
+                                    output_file)
+
+
+def generate_all_topoplots(pow_tensor: PowTensor, output_dir="static/topoplots", username="default"):
+    os.makedirs(output_dir, exist_ok=True)
+
+    channel_order = [pow_tensor.channel_index(ch) for ch in TOPOPLOT_CHANNELS]
+    band_positions = [pow_tensor.band_index(band_code) for _, band_code in TOPOPLOT_BANDS]
+
+    files = []
+    for session_name in TOPOPLOT_SESSIONS:
+        if len(pow_tensor.session(session_name)) == 0:
+            continue
+        # rata-rata seluruh (channel, band) sesi ini dalam satu reduksi
+        session_means = pow_tensor.session_mean(session_name)[channel_order]
+        filename = f"{username}_topoplot_{session_name.lower().replace(' ', '_')}.png"
+        files.append(topoplot_figure().render(session_name, session_means, band_positions,
+                                              os.path.join(output_dir, filename)))
+    return files
+
+
+class RocFigure:
+    """
+    Figure ROC satu (channel, band) yang disusun sekali: sumbu, diagonal, label, dan
+    grid tetap; render() hanya memperbarui data kurva, legenda, dan judul.
+    Tidak thread-safe (RenderCache menyerialkan render).
+    """
+    def __init__(self, n_curves=len(ROC_TASK_SESSIONS)):
+        self.figure = Figure(figsize=(10, 8))
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        # Kurva dibuat sebelum diagonal agar diagonal tetap tergambar di atasnya
+        self.lines = []
+        for _ in range(n_curves):
+            self._add_line()
+
+        ax = self.ax
+        ax.plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--')
+        ax.set_xlim([0.0, 1.0])
+        ax.set_ylim([0.0, 1.05])
+        ax.set_xlabel('False Positive Rate', fontsize=12)
+        ax.set_ylabel('True Positive Rate', fontsize=12)
+        ax.grid(alpha=0.4)
+        self.title = ax.set_title('', fontsize=14, fontweight='bold')
+
+    def _add_line(self):
+        # Warna mengikuti siklus default (C0, C1, ...) seperti plot berurutan
+        line, = self.ax.plot([], [], lw=2.5, solid_joinstyle='round', color=f'C{len(self.lines) % 10}')
+        self.lines.append(line)
+
+    def render(self, channel, band_key, curves, output_file, dpi=120):
+        """Menulis gambar ROC dari kurva RocScores.curves(k): list (sesi, AUC, fpr, tpr)."""
+        while len(self.lines) < len(curves):
+            self._add_line()
+        for line, (session_name, auc, fpr, tpr) in zip(self.lines, curves):
+            line.set_data(fpr, tpr)
+            line.set_label(f'{session_name} (AUC = {auc:.2f})')
+            line.set_visible(True)
+        for line in self.lines[len(curves):]:
+            line.set_visible(False)
+
+        if curves:
+            self.ax.legend(handles=self.lines[:len(curves)], loc="lower right", fontsize='small')
+        elif self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+        self.title.set_text(f'ROC: {band_key} on {channel} (Baseline vs Tasks)')
+        self.figure.savefig(output_file, dpi=dpi)
+        return output_file
+
+
+@lru_cache(maxsize=None)
+def roc_figure():
+    """RocFigure milik proses ini (dipakai ulang untuk semua kolom dan kandidat)."""
+    return RocFigure()
+
+
+def render_roc(channel, band_key, curves, output_file):
+    """Satu gambar ROC untuk satu (channel, band) dari kurva RocScores.curves(k)."""
+    return roc_figure().render(channel, band_key, curves, output_file)
+
+
+def render_roc_curves(roc_scores: RocScores, username: str, output_dir="static/roc_curves"):
+    """Merender satu gambar ROC per kolom (channel, band), memakai titik kurva dari roc_scores."""
+    os.makedirs(output_dir, exist_ok=True)
+    return [render_roc(channel, band_key, roc_scores.curves(k),
+                       os.path.join(output_dir, f"{username}_roc_{roc_figure_name(channel, band_key)}.png"))
+            for k, (channel, band_key) in enumerate(roc_scores.columns)]
+
+
+def render_analysis_figures(pow_tensor: PowTensor, roc_scores: RocScores, username: str,
+                            topoplot_dir="static/topoplots", roc_dir="static/roc_curves"):
+    """
+    Merender semua gambar satu kandidat sekaligus (topoplot + ROC), mis. untuk ekspor.
+    Pipeline biasa memakai render_cache.py (per permintaan).
+
+    Returns:
+        list: Path file gambar yang ditulis (topoplot lalu ROC).
+    """
+    topoplot_files = generate_all_topoplots(pow_tensor, topoplot_dir, username)
+    roc_files = render_roc_curves(roc_scores, username, roc_dir)
+    return topoplot_files + roc_files
@@ -0,0 +1,77 @@
+# filename: pm_engine.py
+#
+# Perhitungan metrik PM (Attention, Focus, Stress, ...) dari power band.
+#
+# Setiap metrik didefinisikan secara deklaratif sebagai rasio jumlah power linear:
+#     PM = sum(band pembilang) / (sum(band penyebut) + epsilon)
+# Tabel formula dikompilasi sekali menjadi matriks 0/1 (band x jumlah-unik) sehingga
+# seluruh metrik dihitung dalam satu lintasan NumPy atas matriks (epoch x band).
+# Jumlah band yang dipakai beberapa metrik (mis. Alpha+Theta) dan formula yang
+# identik (Attention == Engagement) hanya dihitung sekali.
+
+import numpy as np
+
+PM_EPSILON = 1e-9
+
+# nama kolom -> (band pembilang, band penyebut)
+PM_FORMULAS = {
+    'PM.Attention': (('Beta',), ('Alpha', 'Theta')),
+    'PM.Engagement': (('Beta',), ('Alpha', 'Theta')),
+    'PM.Interest': (('Beta', 'Gamma'), ('Alpha', 'Theta')),
+    'PM.Excitement': (('Gamma', 'BetaH'), ('Alpha',)),
+    'PM.Focus': (('Beta',), ('Alpha',)),
+    'PM.Stress': (('BetaH',), ('Alpha',)),
+    'PM.Relaxation': (('Alpha', 'Theta'), ('Beta',)),
+}
+
+
+class PmEngine:
+    """
+    Tabel formula PM yang sudah dikompilasi untuk urutan band tertentu.
+
+    Atribut:
+        sum_matrix (np.ndarray): Matriks 0/1 (n_band x n_jumlah_unik).
+        ratio_terms (np.ndarray): Pasangan (indeks pembilang, indeks penyebut) unik.
+        column_ratio (np.ndarray): Indeks rasio unik untuk setiap kolom output.
+    """
+    def __init__(self, bands, formulas=PM_FORMULAS, epsilon=PM_EPSILON):
+        self.bands = list(bands)
+        self.columns = list(formulas.keys())
+        self.epsilon = epsilon
+        band_pos = {band: j for j, band in enumerate(self.bands)}
+
+        sum_terms = {}   # frozenset band -> indeks kolom di sum_matrix
+        ratio_terms = {}  # (indeks pembilang, indeks penyebut) -> indeks rasio
+        column_ratio = []
+        for name, (numerator, denominator) in formulas.items():
+            missing = [band for band in (*numerator, *denominator) if band not in band_pos]
+            if missing:
+                raise ValueError(f"Formula {name} memakai band yang tidak tersedia: {missing}")
+            term = tuple(sum_terms.setdefault(frozenset(group), len(sum_terms))
+                         for group in (numerator, denominator))
+            column_ratio.append(ratio_terms.setdefault(term, len(ratio_terms)))
+
+        self.sum_matrix = np.zeros((len(self.bands), len(sum_terms)))
+        for group, k in sum_terms.items():
+            self.sum_matrix[[band_pos[band] for band in group], k] = 1.0
+        self.ratio_terms = np.array(list(ratio_terms.keys()), dtype=int).reshape(-1, 2)
+        self.column_ratio = np.array(column_ratio, dtype=int)
+
+    def compute(self, band_power_db: np.ndarray) -> np.ndarray:
+        """
+        Menghitung semua metrik PM dalam satu lintasan.
+
+        Args:
+            band_power_db (np.ndarray): Power band dalam dB, shape (n_epoch x n_band),
+                kolom mengikuti urutan self.bands.
+
+        Returns:
+            np.ndarray: Metrik PM float32, shape (n_epoch x n_kolom), urutan self.columns.
+        """
+        power = np.power(10.0, np.asarray(band_power_db, dtype=np.float64) / 10)
+        finite = np.isfinite(power)
+        sums = np.where(finite, power, 0.0) @ self.sum_matrix
+        # Jumlah yang memuat band NaN tetap NaN (bukan 0 dari perkalian matriks)
+        sums[(~finite) @ self.sum_matrix > 0] = np.nan
+        ratios = sums[:, self.ratio_terms[:, 0]] / (sums[:, self.ratio_terms[:, 1]] + self.epsilon)
+        return ratios[:, self.column_ratio].astype(np.float32)
@@ -0,0 +1,163 @@
+# filename: pow_tensor.py
+#
+# Representasi array untuk data POW: tensor float32 (time x channel x band)
+# beserta index sesi. Dibangun sekali dari output transformasi, lalu dipakai
+# oleh perhitungan PM (tools.py) dan seluruh tahap analisis (logic.py).
+
+import numpy as np
+import pandas as pd
+
+POW_CHANNELS = ['AF3', 'T7', 'Pz', 'T8', 'AF4']
+POW_BANDS = ['Theta', 'Alpha', 'Beta', 'BetaH', 'Gamma']
+
+
+def pow_col_candidates(channel: str, band: str):
+    """
+    Varian nama kolom POW yang dikenali, berurutan sesuai prioritas:
+      - POW.<channel>.<band>
+      - POW.EEG.<channel>.<band>
+      - POW.<channel>_<band>
+      - POW_<channel>_<band>
+      - <channel>.<band>
+      - <channel>_<band>
+    """
+    return [
+        f"POW.{channel}.{band}",
+        f"POW.EEG.{channel}.{band}",
+        f"POW.{channel}_{band}",
+        f"POW_{channel}_{band}",
+        f"{channel}.{band}",
+        f"{channel}_{band}"
+    ]
+
+
+class PowColumnMap:
+    """
+    Tabel padat (channel, band) -> posisi kolom, diselesaikan sekali per dataset.
+    Nama dicocokkan dengan pow_col_candidates (case-sensitive dulu, lalu
+    case-insensitive). Posisi -1 berarti kolom tidak ada.
+    """
+    def __init__(self, columns, channels=POW_CHANNELS, bands=POW_BANDS):
+        self.columns = list(columns)
+        self.channels = list(channels)
+        self.bands = list(bands)
+        self._channel_pos = {ch: i for i, ch in enumerate(self.channels)}
+        self._band_pos = {band: j for j, band in enumerate(self.bands)}
+
+        direct = {col: i for i, col in enumerate(self.columns)}
+        lower = {col.lower(): i for i, col in enumerate(self.columns)}
+
+        self.positions = np.full((len(self.channels), len(self.bands)), -1, dtype=int)
+        for i, ch in enumerate(self.channels):
+            for j, band in enumerate(self.bands):
+                candidates = pow_col_candidates(ch, band)
+                # direct match (case-sensitive), lalu case-insensitive
+                pos = next((direct[c] for c in candidates if c in direct), None)
+                if pos is None:
+                    pos = next((lower[c.lower()] for c in candidates if c.lower() in lower), -1)
+                self.positions[i, j] = pos
+
+    def position(self, channel: str, band: str) -> int:
+        return int(self.positions[self._channel_pos[channel], self._band_pos[band]])
+
+    def column(self, channel: str, band: str):
+        pos = self.position(channel, band)
+        return None if pos < 0 else self.columns[pos]
+
+
+class SessionIndex:
+    """
+    Batas baris tiap sesi pada kolom 'time' yang terurut, dihitung sekali dengan
+    np.searchsorted. Setiap sesi lalu diambil sebagai slice posisi [start, end)
+    (view, tanpa boolean scan ulang atas seluruh kolom).
+    """
+    def __init__(self, time_values, session_definitions):
+        time_values = np.asarray(time_values, dtype=float)
+        if len(time_values) > 1 and np.any(np.diff(time_values) < 0):
+            raise ValueError("Kolom 'time' harus terurut naik untuk membangun SessionIndex.")
+        names = list(session_definitions.keys())
+        bounds = np.array([session_definitions[name] for name in names], dtype=float).reshape(-1, 2)
+        # side='left' pada kedua batas == filter (time >= start) & (time < end)
+        starts = np.searchsorted(time_values, bounds[:, 0], side='left')
+        stops = np.searchsorted(time_values, bounds[:, 1], side='left')
+        self.slices = {name: slice(int(a), int(b)) for name, a, b in zip(names, starts, stops)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, session_definitions):
+        return cls(df['time'].to_numpy(), session_definitions)
+
+    def __getitem__(self, session_name) -> slice:
+        return self.slices[session_name]
+
+    def frame(self, df: pd.DataFrame, session_name) -> pd.DataFrame:
+        """Potongan baris df untuk satu sesi (df harus frame yang sama dengan saat index dibangun)."""
+        return df.iloc[self.slices[session_name]]
+
+
+def nanmean(values: np.ndarray, axis=0):
+    """
+    Mean yang mengabaikan NaN, diakumulasi dalam float64. Irisan tanpa nilai
+    menghasilkan NaN tanpa RuntimeWarning.
+    """
+    counts = np.sum(~np.isnan(values), axis=axis)
+    sums = np.nansum(values, axis=axis, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+class PowTensor:
+    """
+    Data POW dalam bentuk array float32 berdimensi (time x channel x band),
+    ditambah kolom time dan (opsional) SessionIndex.
+
+    Kombinasi channel/band yang tidak ada di sumber data berisi NaN dan
+    ditandai False pada atribut `available`.
+    """
+    def __init__(self, data, time, channels=POW_CHANNELS, bands=POW_BANDS,
+                 session_definitions=None, available=None):
+        self.data = np.asarray(data, dtype=np.float32)
+        self.time = np.asarray(time, dtype=float)
+        self.channels = list(channels)
+        self.bands = list(bands)
+        self.available = np.ones(self.data.shape[1:], dtype=bool) if available is None else np.asarray(available, dtype=bool)
+        self.sessions = SessionIndex(self.time, session_definitions) if session_definitions is not None else None
+        self._channel_pos = {ch: i for i, ch in enumerate(self.channels)}
+        self._band_pos = {band: j for j, band in enumerate(self.bands)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, time_column='time', channels=POW_CHANNELS, bands=POW_BANDS,
+                   session_definitions=None):
+        """Membangun tensor dari frame berkolom POW.* (nama kolom diselesaikan sekali)."""
+        column_map = PowColumnMap(df.columns, channels, bands)
+        positions = column_map.positions
+        available = positions >= 0
+
+        data = np.full((len(df), len(channels), len(bands)), np.nan, dtype=np.float32)
+        if available.any():
+            values = df.to_numpy(dtype=float)
+            data[:, available] = values[:, positions[available]]
+        return cls(data, df[time_column].to_numpy(), channels, bands, session_definitions, available)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def channel_index(self, channel: str) -> int:
+        return self._channel_pos[channel]
+
+    def band_index(self, band: str) -> int:
+        return self._band_pos[band]
+
+    def has(self, channel: str, band: str) -> bool:
+        return bool(self.available[self._channel_pos[channel], self._band_pos[band]])
+
+    def session(self, session_name) -> np.ndarray:
+        """View (n_time_sesi x channel x band) untuk satu sesi."""
+        return self.data[self.sessions[session_name]]
+
+    def session_mean(self, session_name) -> np.ndarray:
+        """Mean tiap (channel, band) dalam satu sesi; satu reduksi atas seluruh irisan."""
+        return nanmean(self.session(session_name), axis=0)
+
+    def channel_mean(self) -> np.ndarray:
+        """Mean antar channel untuk tiap (time, band); shape (n_time x n_band)."""
+        return nanmean(self.data, axis=1)
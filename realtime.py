@@ -0,0 +1,372 @@
+# filename: realtime.py
+#
+# Mode analisis realtime: sampel headset dikirim per blok selama tes berlangsung
+# (lihat endpoint /v1/bwa/realtime di main.py), bukan sebagai satu file EDF di akhir.
+#
+# Setiap blok langsung:
+#   1. difilter bandpass secara kausal (state filter dibawa antar blok),
+#   2. dipotong menjadi epoch baru dengan panjang/langkah yang sama dengan
+#      eeg_fast_transform, lalu dihitung POW dan PM-nya (tools.epoch_band_power, pm_engine),
+#   3. diakumulasikan ke jumlah berjalan per sesi (SESSION_DEFINITIONS).
+# Begitu waktu stream melewati akhir suatu sesi, metrik sesi tersebut (baris
+# user_response dan skor cognitive) langsung ditutup dan dikirim ke klien.
+# Saat stream selesai, tabel fitur yang terkumpul diserahkan ke tahap analyze
+# pipeline Celery tanpa tahap pra-pemrosesan EDF.
+#
+# Catatan: ICA membutuhkan seluruh rekaman, sehingga mode realtime hanya memakai
+# filter bandpass kausal. Hasilnya mendekati (tidak identik dengan) pipeline EDF;
+# untuk hasil yang persis sama, unggah EDF rekaman yang sama lewat /v1/bwa/analyze/.
+
+import json
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+from tools import (EEG_CHANNELS, FEATURE_EPOCH_LEN, FEATURE_EPOCH_STEP, POW_BAND_FREQUENCIES, SPECTRAL_SFREQ,
+                   get_spectral_plan, epoch_band_power, order_feature_columns)
+from pow_tensor import PowTensor, POW_CHANNELS, POW_BANDS
+from pm_engine import PmEngine
+from feature_store import save_feature_table
+from logic import SESSION_DEFINITIONS, RESPONSE_METRICS, COGNITIVE_FORMULAS, cognitive_score
+
+REALTIME_FILTER_ORDER = 4
+
+
+class RealtimeError(Exception):
+    """Error stream realtime; status_code dipakai endpoint sebagai kode HTTP."""
+    status_code = 400
+
+
+class RealtimeStreamNotFoundError(RealtimeError):
+    status_code = 404
+
+
+class RealtimeSequenceError(RealtimeError):
+    """Nomor urut blok melompat (ada blok sebelumnya yang belum diterima)."""
+    status_code = 409
+
+    def __init__(self, message, next_seq):
+        super().__init__(message)
+        self.next_seq = next_seq
+
+
+def parse_sample_block(body: bytes, content_type: str, n_channels: int) -> np.ndarray:
+    """
+    Mengubah body request menjadi array sampel (n_sampel x n_channel) dalam µV.
+
+    Format yang diterima:
+      - application/octet-stream: float32 little-endian, baris demi baris (sampel-mayor).
+      - application/json: {"samples": [[AF3, T7, Pz, T8, AF4], ...]}.
+    """
+    try:
+        if (content_type or '').split(';')[0].strip() == 'application/json':
+            samples = np.asarray(json.loads(body)['samples'], dtype=np.float64)
+        else:
+            if len(body) % (4 * n_channels):
+                raise ValueError(f"panjang body bukan kelipatan {n_channels} float32")
+            samples = np.frombuffer(body, dtype='<f4').astype(np.float64)
+        samples = samples.reshape(-1, n_channels)
+    except (ValueError, KeyError, TypeError) as e:
+        raise RealtimeError(f"Blok sampel tidak valid: {e}")
+    if not len(samples):
+        raise RealtimeError("Blok sampel kosong.")
+    if not np.all(np.isfinite(samples)):
+        raise RealtimeError("Blok sampel berisi NaN/inf.")
+    return samples
+
+
+def _json_float(value):
+    """float Python, atau None untuk NaN (agar aman diserialisasi ke JSON)."""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class _SessionAccumulator:
+    """Jumlah berjalan POW (channel x band) dan metrik response untuk satu sesi."""
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.n_epochs = 0
+        self.pow_sum = np.zeros((len(POW_CHANNELS), len(POW_BANDS)))
+        self.pow_rows = 0
+        self.response_sum = np.zeros(len(RESPONSE_METRICS))
+        self.response_rows = 0
+
+    def add(self, pow_rows, response_rows):
+        """
+        pow_rows: (n x channel x band) POW epoch; response_rows: (n x metrik) PM epoch.
+        Seperti create_cleaning_frame/create_cleaning2_frame, baris yang memuat NaN dilewati.
+        """
+        self.n_epochs += len(pow_rows)
+        pow_rows = pow_rows[~np.isnan(pow_rows).any(axis=(1, 2))]
+        self.pow_sum += pow_rows.sum(axis=0, dtype=np.float64)
+        self.pow_rows += len(pow_rows)
+        response_rows = response_rows[~np.isnan(response_rows).any(axis=1)]
+        self.response_sum += response_rows.sum(axis=0, dtype=np.float64)
+        self.response_rows += len(response_rows)
+
+    def result(self) -> dict:
+        response = None
+        if self.response_rows:
+            response = {"CATEGORY": self.name}
+            response.update({metric: _json_float(total / self.response_rows)
+                             for metric, total in zip(RESPONSE_METRICS, self.response_sum)})
+        score = None
+        if self.name in COGNITIVE_FORMULAS and self.pow_rows:
+            means = self.pow_sum / self.pow_rows
+            score = cognitive_score(self.name, means, POW_CHANNELS.index, POW_BANDS.index)
+        return {
+            "session": self.name,
+            "start": self.start,
+            "end": self.end,
+            "n_epochs": self.n_epochs,
+            "response": response,
+            "cognitive_score": score,
+        }
+
+
+class RealtimeAnalyzer:
+    """
+    State analisis untuk satu stream: filter kausal, buffer sampel sisa epoch,
+    baris fitur yang sudah dihitung, dan akumulator per sesi.
+
+    Epoch dimulai pada sampel 0, epoch_step, 2*epoch_step, ... dan sebuah epoch baru
+    dihitung begitu ada sampel setelah akhir epoch tersebut (sama dengan batas
+    `t.shape[0] - epoch_len` pada eeg_fast_transform), sehingga jumlah dan waktu
+    epoch sama dengan pipeline EDF untuk rekaman yang sama.
+    """
+    def __init__(self, sfreq: float, start_timestamp: float = None, channels=EEG_CHANNELS,
+                 band_frequencies=POW_BAND_FREQUENCIES, epoch_len=FEATURE_EPOCH_LEN,
+                 epoch_step=FEATURE_EPOCH_STEP, session_definitions=SESSION_DEFINITIONS,
+                 l_freq=1., h_freq=40.):
+        if sfreq <= 0:
+            raise RealtimeError("sfreq harus lebih besar dari 0.")
+        self.sfreq = float(sfreq)
+        self.start_timestamp = time.time() if start_timestamp is None else float(start_timestamp)
+        self.channels = list(channels)
+        self.epoch_len = epoch_len
+        self.epoch_step = epoch_step
+        # Indeks bin band memakai SPECTRAL_SFREQ, sama dengan eeg_fast_transform di compute_final_features
+        self.plan = get_spectral_plan(epoch_len, epoch_step, SPECTRAL_SFREQ, band_frequencies)
+        self.columns = self.plan.columns([f"EEG.{ch}" for ch in self.channels])
+
+        # Bandpass kausal; h_freq diabaikan jika tidak di bawah Nyquist
+        if h_freq is not None and h_freq < self.sfreq / 2:
+            self._sos = butter(REALTIME_FILTER_ORDER, [l_freq, h_freq], btype='bandpass', fs=self.sfreq, output='sos')
+        else:
+            self._sos = butter(REALTIME_FILTER_ORDER, l_freq, btype='highpass', fs=self.sfreq, output='sos')
+        self._zi = None
+
+        self.samples_received = 0
+        self._buffer = np.empty((0, len(self.channels)))
+        self._buffer_start = 0   # indeks sampel absolut dari baris pertama _buffer
+        self._next_epoch = 0     # indeks sampel absolut awal epoch berikutnya
+
+        self.pm_engine = PmEngine(POW_BANDS)
+        self._response_pos = [self.pm_engine.columns.index(column) for column in RESPONSE_METRICS.values()]
+
+        self.n_epochs = 0
+        self._times = []
+        self._pow_rows = []
+        self._pm_rows = []
+
+        self._pending = [_SessionAccumulator(name, float(start), float(end))
+                         for name, (start, end) in session_definitions.items()]
+        self.closed_sessions = []
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return self.samples_received / self.sfreq
+
+    def push(self, samples: np.ndarray) -> list:
+        """
+        Menambahkan blok sampel (n_sampel x n_channel, µV).
+
+        Returns:
+            list[dict]: Sesi yang ditutup oleh blok ini (lihat _SessionAccumulator.result).
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim != 2 or samples.shape[1] != len(self.channels):
+            raise RealtimeError(f"Blok sampel harus berbentuk (n_sampel x {len(self.channels)}).")
+
+        if self._zi is None:
+            # State awal seolah sinyal sudah konstan pada sampel pertama (tanpa transien lompatan)
+            self._zi = sosfilt_zi(self._sos)[:, :, np.newaxis] * samples[0]
+        filtered, self._zi = sosfilt(self._sos, samples, axis=0, zi=self._zi)
+        self._buffer = np.concatenate([self._buffer, filtered])
+        self.samples_received += len(samples)
+
+        epoch_starts = np.arange(self._next_epoch, self.samples_received - self.epoch_len, self.epoch_step)
+        if len(epoch_starts):
+            self._add_epochs(epoch_starts)
+            self._next_epoch = int(epoch_starts[-1]) + self.epoch_step
+
+        # Buffer cukup menyimpan sampel sejak awal epoch berikutnya
+        drop = self._next_epoch - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start = self._next_epoch
+
+        # Semua epoch berikutnya berwaktu >= awal epoch berikutnya
+        return self._close_sessions(self._next_epoch / self.sfreq)
+
+    def _add_epochs(self, epoch_starts):
+        # (n_epoch, n_channel, epoch_len) sebagai view atas buffer
+        windows = sliding_window_view(self._buffer, self.epoch_len, axis=0)
+        epochs = windows[epoch_starts - self._buffer_start]
+        pow_values = epoch_band_power(epochs, self.plan)
+        times = epoch_starts / self.sfreq
+
+        # PM dihitung persis seperti compute_final_features (PowTensor -> PmEngine)
+        pow_tensor = PowTensor.from_frame(pd.DataFrame(pow_values, columns=self.columns).assign(time=times))
+        pm_values = self.pm_engine.compute(pow_tensor.channel_mean())
+
+        self.n_epochs += len(times)
+        self._times.append(times)
+        self._pow_rows.append(pow_values)
+        self._pm_rows.append(pm_values)
+
+        response_values = pm_values[:, self._response_pos]
+        for session in self._pending:
+            # Sama dengan filter (time >= start) & (time < end) pada SessionIndex
+            mask = (times >= session.start) & (times < session.end)
+            if mask.any():
+                session.add(pow_tensor.data[mask], response_values[mask])
+
+    def _close_sessions(self, horizon: float) -> list:
+        closed = []
+        for session in list(self._pending):
+            if session.end <= horizon:
+                self._pending.remove(session)
+                result = session.result()
+                self.closed_sessions.append(result)
+                closed.append(result)
+        return closed
+
+    def finish(self):
+        """
+        Menutup semua sesi yang tersisa dan membangun tabel fitur lengkap.
+
+        Returns:
+            tuple: (pd.DataFrame fitur dengan kolom Timestamp, time, PM.*, POW.*;
+                    list sesi yang ditutup saat finish).
+        """
+        if not self._times:
+            raise RealtimeError("Stream terlalu pendek untuk membentuk satu epoch.")
+        closed = self._close_sessions(np.inf)
+
+        times = np.concatenate(self._times)
+        df_final = pd.DataFrame(np.concatenate(self._pow_rows), columns=self.columns)
+        df_final = pd.concat(
+            [df_final, pd.DataFrame(np.concatenate(self._pm_rows), columns=self.pm_engine.columns)], axis=1)
+        df_final.insert(0, 'Timestamp', self.start_timestamp + times)
+        df_final.insert(1, 'time', times)
+        return order_feature_columns(df_final), closed
+
+
+class RealtimeStream:
+    """Satu stream realtime: analyzer ditambah nomor urut blok dan waktu aktivitas terakhir."""
+    def __init__(self, stream_id: str, analyzer: RealtimeAnalyzer):
+        self.stream_id = stream_id
+        self.analyzer = analyzer
+        self.next_seq = 0
+        self.last_activity = time.time()
+        self.lock = threading.Lock()
+
+    def append(self, seq: int, samples: np.ndarray) -> list:
+        """
+        Memproses blok bernomor seq. Blok yang dikirim ulang (seq < next_seq)
+        diabaikan agar retry klien aman; blok yang melompat ditolak (409).
+        """
+        with self.lock:
+            self.last_activity = time.time()
+            if seq < self.next_seq:
+                return []
+            if seq > self.next_seq:
+                raise RealtimeSequenceError(f"Blok {seq} melompat; server menunggu blok {self.next_seq}.", self.next_seq)
+            closed = self.analyzer.push(samples)
+            self.next_seq += 1
+            return closed
+
+    def finish(self):
+        """Menutup stream: lihat RealtimeAnalyzer.finish."""
+        with self.lock:
+            self.last_activity = time.time()
+            return self.analyzer.finish()
+
+    def status(self, newly_closed=None) -> dict:
+        analyzer = self.analyzer
+        return {
+            "stream_id": self.stream_id,
+            "sfreq": analyzer.sfreq,
+            "channels": analyzer.channels,
+            "next_seq": self.next_seq,
+            "samples_received": analyzer.samples_received,
+            "elapsed_seconds": analyzer.elapsed_seconds,
+            "epochs": analyzer.n_epochs,
+            "closed_sessions": list(analyzer.closed_sessions),
+            "newly_closed": newly_closed or [],
+        }
+
+
+class RealtimeStreamStore:
+    """
+    Registry stream aktif di memori proses API. Stream realtime terikat pada satu
+    proses, jadi jalankan API dengan satu worker (atau sticky session) untuk mode ini.
+    """
+    def __init__(self, stale_seconds: float, max_block_seconds: float):
+        self.stale_seconds = stale_seconds
+        self.max_block_seconds = max_block_seconds
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def create(self, sfreq: float, start_timestamp: float = None) -> RealtimeStream:
+        self.purge_stale()
+        stream = RealtimeStream(uuid.uuid4().hex, RealtimeAnalyzer(sfreq, start_timestamp))
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> RealtimeStream:
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None:
+            raise RealtimeStreamNotFoundError(f"Stream realtime '{stream_id}' tidak ditemukan.")
+        return stream
+
+    def append(self, stream_id: str, seq: int, body: bytes, content_type: str) -> dict:
+        stream = self.get(stream_id)
+        samples = parse_sample_block(body, content_type, len(stream.analyzer.channels))
+        if len(samples) > self.max_block_seconds * stream.analyzer.sfreq:
+            raise RealtimeError(f"Blok melebihi batas {self.max_block_seconds} detik sampel.")
+        closed = stream.append(seq, samples)
+        return stream.status(closed)
+
+    def finish(self, stream_id: str, features_path: str) -> dict:
+        """
+        Menutup semua sesi dan menulis tabel fitur stream ke features_path
+        (format feature_store). Stream tetap terdaftar sampai remove() dipanggil,
+        sehingga finish boleh diulang jika langkah setelahnya gagal.
+        """
+        stream = self.get(stream_id)
+        df_features, closed = stream.finish()
+        save_feature_table(df_features, features_path)
+        return stream.status(closed)
+
+    def remove(self, stream_id: str):
+        with self._lock:
+            if self._streams.pop(stream_id, None) is None:
+                raise RealtimeStreamNotFoundError(f"Stream realtime '{stream_id}' tidak ditemukan.")
+
+    def purge_stale(self):
+        """Menghapus stream yang tidak menerima blok lebih lama dari stale_seconds."""
+        cutoff = time.time() - self.stale_seconds
+        with self._lock:
+            for stream_id in [sid for sid, stream in self._streams.items() if stream.last_activity < cutoff]:
+                del self._streams[stream_id]
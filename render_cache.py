@@ -0,0 +1,278 @@
+# filename: render_cache.py
+#
+# Gambar hasil analisis (topoplot per sesi, ROC per channel x band) dirender
+# sesuai permintaan, bukan seluruhnya saat analisis.
+#
+# Saat analisis hanya data numerik gambar satu kandidat yang disimpan (satu file
+# .npz, lihat logic.figure_arrays). Endpoint /v1/bwa/figures/... merender gambar
+# saat pertama kali diminta lalu menyimpan PNG-nya di cache disk yang dibatasi
+# ukurannya. Eviction LRU: setiap hit memperbarui mtime file, dan jika total
+# ukuran melewati batas, file dengan mtime paling lama dihapus lebih dulu.
+# PNG yang terhapus cukup dirender ulang dari data numeriknya.
+#
+# Laporan PDF memakai topoplot dalam format SVG (lihat REPORT_FIGURE_FORMAT di
+# config.py) yang disisipkan sebagai gambar vektor ReportLab lewat svglib, tanpa
+# encode/decode PNG. Tanpa paket svglib laporan kembali memakai PNG.
+#
+# Struktur direktori:
+#   <root>/data/<username>.npz
+#   <root>/png/<username>/topoplot_<sesi>.png   (atau .svg untuk laporan)
+#   <root>/png/<username>/roc_<channel>_<band>.png
+
+import importlib.util
+import os
+import shutil
+import threading
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+
+FIGURE_URL_PREFIX = "v1/bwa/figures"
+FIGURE_FORMATS = ('png', 'svg')
+
+
+def topoplot_figure_path(username: str, session_slug: str) -> str:
+    """Path URL (tanpa BASE_URL) topoplot satu sesi, mis. 'kraepelin_test'."""
+    return f"{FIGURE_URL_PREFIX}/{quote(username, safe='')}/topoplot/{session_slug}.png"
+
+
+def topoplot_filename(username: str, session_slug: str) -> str:
+    """Nama file topoplot versi lama (kolom brain_topography), mis. 'budi_topoplot_kraepelin_test.png'."""
+    return f"{username}_topoplot_{session_slug}.png"
+
+
+def roc_figure_path(username: str, name: str) -> str:
+    """Path URL (tanpa BASE_URL) ROC satu kolom, mis. 'AF3_theta'."""
+    return f"{FIGURE_URL_PREFIX}/{quote(username, safe='')}/roc/{name}.png"
+
+
+def session_slug(session_name: str) -> str:
+    return session_name.lower().replace(' ', '_')
+
+
+def resolve_report_figure_format(fmt: str) -> str:
+    """Validasi format gambar laporan; svg kembali ke png bila paket svglib tidak tersedia."""
+    if fmt not in FIGURE_FORMATS:
+        raise ValueError(f"Format gambar laporan tidak dikenal: '{fmt}'. Pilihan: {', '.join(FIGURE_FORMATS)}")
+    if fmt == 'svg' and importlib.util.find_spec('svglib') is None:
+        print("Paket 'svglib' tidak terpasang, laporan memakai topoplot PNG.")
+        return 'png'
+    return fmt
+
+
+class FigureNotFoundError(Exception):
+    """Data gambar atau gambar yang diminta tidak ada; status_code dipakai endpoint."""
+    status_code = 404
+
+
+class RenderCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.data_dir = os.path.join(root, 'data')
+        self.png_dir = os.path.join(root, 'png')
+        self.max_bytes = max_bytes
+        # Render dijalankan satu per satu per proses: plotting memakai ulang satu objek
+        # figure per proses (TopoplotFigure/RocFigure) yang tidak boleh digambar dua thread
+        # sekaligus. Lock yang sama menjaga urutan tulis tmp -> os.replace -> evict.
+        self._lock = threading.Lock()
+        os.makedirs(self.data_dir, exist_ok=True)
+        os.makedirs(self.png_dir, exist_ok=True)
+
+    def _user_name(self, username: str) -> str:
+        if not username or username in ('.', '..') or any(c in username for c in '/\\\0'):
+            raise FigureNotFoundError(f"Gambar untuk user '{username}' tidak ditemukan.")
+        return username
+
+    def _data_path(self, username: str) -> str:
+        return os.path.join(self.data_dir, f"{self._user_name(username)}.npz")
+
+    # --- Data numerik per kandidat ---
+
+    def put_figure_data(self, username: str, arrays: dict) -> str:
+        """Menyimpan data gambar (atomik) dan membuang PNG lama milik user ini."""
+        target = self._data_path(username)
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez_compressed(tmp, **arrays)
+        os.replace(tmp, target)
+        shutil.rmtree(os.path.join(self.png_dir, username), ignore_errors=True)
+        return target
+
+    def put_figure_data_file(self, username: str, source_path: str) -> str:
+        """Seperti put_figure_data, dari file .npz yang sudah ada (mis. entri ArtifactCache)."""
+        target = self._data_path(username)
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(source_path, tmp)
+        os.replace(tmp, target)
+        shutil.rmtree(os.path.join(self.png_dir, username), ignore_errors=True)
+        return target
+
+    def _load(self, username: str):
+        path = self._data_path(username)
+        if not os.path.exists(path):
+            raise FigureNotFoundError(f"Data gambar untuk user '{username}' tidak ditemukan.")
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def remove(self, username: str):
+        """Menghapus data dan seluruh gambar milik satu user."""
+        try:
+            path = self._data_path(username)
+        except FigureNotFoundError:
+            return  # nama yang tidak mungkin punya data gambar
+        if os.path.exists(path):
+            os.remove(path)
+        shutil.rmtree(os.path.join(self.png_dir, username), ignore_errors=True)
+
+    # --- Gambar ---
+
+    def _topoplot_render(self, username: str, slug: str, fmt: str):
+        if fmt not in FIGURE_FORMATS:
+            raise ValueError(f"Format gambar tidak dikenal: '{fmt}'")
+
+        def render(output_file):
+            from plotting import render_topoplot
+            data = self._load(username)
+            sessions = [str(name) for name in data['topoplot_sessions']]
+            slugs = [session_slug(name) for name in sessions]
+            if slug not in slugs:
+                raise FigureNotFoundError(f"Topoplot sesi '{slug}' tidak tersedia untuk user '{username}'.")
+            i = slugs.index(slug)
+            render_topoplot(sessions[i], data['topoplot_means'][i], list(data['channels']), list(data['bands']),
+                            output_file)
+        return render
+
+    def topoplot(self, username: str, slug: str, fmt: str = 'png') -> str:
+        """Path gambar topoplot satu sesi (slug mis. 'kraepelin_test'; fmt 'png' atau 'svg'), dirender jika belum ada."""
+        return self._get_or_render(username, f"topoplot_{slug}.{fmt}", self._topoplot_render(username, slug, fmt))
+
+    def topoplot_bytes(self, username: str, slug: str, fmt: str = 'png') -> bytes:
+        """
+        Isi gambar topoplot satu sesi. Untuk pemakai yang membaca gambar belakangan
+        (mis. laporan PDF): path cache bisa di-evict proses lain kapan saja.
+        """
+        return self._read_or_render(username, f"topoplot_{slug}.{fmt}", self._topoplot_render(username, slug, fmt))
+
+    def figure_names(self, username: str) -> list:
+        """
+        Semua gambar milik user ini sebagai pasangan (jenis, nama) berurutan tetap:
+        topoplot per sesi lalu ROC per channel x band, mis. ('topoplot', 'kraepelin_test').
+        """
+        from logic import roc_figure_name
+        data = self._load(username)
+        topoplots = [('topoplot', session_slug(str(name))) for name in data['topoplot_sessions']]
+        rocs = [('roc', roc_figure_name(str(channel), str(band_key))) for channel, band_key in data['roc_columns']]
+        return topoplots + rocs
+
+    def prerender(self, username: str, figures=None) -> list:
+        """
+        Merender gambar PNG ke cache lebih awal (figures None = semua, lihat figure_names)
+        agar permintaan berikutnya langsung hit. Mengembalikan path gambar sesuai urutan
+        figures; yang sudah ada tidak dirender ulang.
+        """
+        figures = self.figure_names(username) if figures is None else figures
+        paths = []
+        for kind, name in figures:
+            if kind == 'topoplot':
+                paths.append(self.topoplot(username, name))
+            elif kind == 'roc':
+                paths.append(self.roc(username, name))
+            else:
+                raise ValueError(f"Jenis gambar tidak dikenal: '{kind}'")
+        return paths
+
+    def _roc_render(self, username: str, name: str):
+        def render(output_file):
+            from logic import RocScores, roc_figure_name
+            from plotting import render_roc
+            data = self._load(username)
+            roc_scores = RocScores([tuple(column) for column in data['roc_columns']], list(data['roc_sessions']),
+                                   data['roc_auc'], data['roc_fpr'], data['roc_tpr'], data['roc_is_point'])
+            names = [roc_figure_name(channel, band_key) for channel, band_key in roc_scores.columns]
+            if name not in names:
+                raise FigureNotFoundError(f"Kurva ROC '{name}' tidak tersedia untuk user '{username}'.")
+            k = names.index(name)
+            channel, band_key = roc_scores.columns[k]
+            render_roc(channel, band_key, roc_scores.curves(k), output_file)
+        return render
+
+    def roc(self, username: str, name: str) -> str:
+        """Path PNG ROC satu kolom (name mis. 'AF3_theta'), dirender jika belum ada."""
+        return self._get_or_render(username, f"roc_{name}.png", self._roc_render(username, name))
+
+    def roc_bytes(self, username: str, name: str) -> bytes:
+        """Isi PNG ROC satu kolom; seperti topoplot_bytes, aman terhadap eviction."""
+        return self._read_or_render(username, f"roc_{name}.png", self._roc_render(username, name))
+
+    def _get_or_render(self, username: str, filename: str, render) -> str:
+        user_dir = os.path.join(self.png_dir, self._user_name(username))
+        path = os.path.join(user_dir, filename)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # tandai baru dipakai (LRU)
+                return path
+            except FileNotFoundError:
+                pass  # baru saja di-evict proses lain; render ulang
+        with self._lock:
+            if os.path.exists(path):
+                return path
+            # Ditulis dulu di root png/ agar permintaan yang gagal (404) tidak meninggalkan direktori
+            tmp = self._tmp_path(filename)
+            try:
+                render(tmp)
+                os.makedirs(user_dir, exist_ok=True)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            self.evict(keep=path)
+        return path
+
+    def _read_or_render(self, username: str, filename: str, render) -> bytes:
+        path = self._get_or_render(username, filename, render)
+        try:
+            # File yang sudah terbuka tetap terbaca utuh walaupun di-evict sesudahnya
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        # Di-evict proses lain (mis. API) sebelum sempat dibuka: render khusus pemanggil ini
+        with self._lock:
+            tmp = self._tmp_path(filename)
+            try:
+                render(tmp)
+                with open(tmp, 'rb') as f:
+                    return f.read()
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def _tmp_path(self, filename: str) -> str:
+        # Ekstensi dipertahankan: format keluaran savefig ditentukan dari nama file
+        return os.path.join(self.png_dir, f".{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+
+    def evict(self, keep: str = None):
+        """Menghapus gambar dengan mtime paling lama sampai total ukuran <= max_bytes."""
+        files, total = [], 0
+        for user in os.listdir(self.png_dir):
+            user_dir = os.path.join(self.png_dir, user)
+            if not os.path.isdir(user_dir):
+                continue
+            for name in os.listdir(user_dir):
+                path = os.path.join(user_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
@@ -1,7 +1,7 @@
 # filename: schemas.py
 
 from pydantic import BaseModel, Field
-from typing import Optional, List, TypeVar, Generic
+from typing import Optional, List, Dict, Any, TypeVar, Generic
 import datetime
 
 PayloadType = TypeVar('PayloadType')
@@ -21,12 +21,14 @@ class TokenPayload(BaseModel):
 class UserPersonality(BaseModel):
     score: Optional[float] = None
     brain_topography: Optional[str] = None
+    brain_topography_url: Optional[str] = None
     class Config: 
         from_attributes = True
 
 class UserCognitive(BaseModel):
     score: Optional[float] = None
     brain_topography: Optional[str] = None
+    brain_topography_url: Optional[str] = None
     class Config: 
         from_attributes = True
 
@@ -122,6 +124,47 @@ class AnalysisResult(BaseModel):
 class FilePathPayload(BaseModel):
     file_path: str = Field(..., description="Path ke file CSV yang dihasilkan")
 
+class UploadStatusPayload(BaseModel):
+    upload_id: str
+    filename: str
+    total_size: int
+    offset: int = Field(..., description="Jumlah byte yang sudah diterima; chunk berikutnya dikirim dari offset ini.")
+    sha256: Optional[str] = None
+    max_chunk_bytes: int
+
+class RealtimeSessionResult(BaseModel):
+    session: str
+    start: float
+    end: float
+    n_epochs: int
+    response: Optional[Dict[str, Any]] = Field(None, description="Baris user_response sesi ini (rata-rata PM).")
+    cognitive_score: Optional[float] = Field(None, description="Skor cognitive, hanya untuk sesi tes kognitif.")
+
+class RealtimeStatusPayload(BaseModel):
+    stream_id: str
+    sfreq: float
+    channels: List[str] = Field(..., description="Urutan kolom sampel pada setiap blok.")
+    next_seq: int = Field(..., description="Nomor urut blok berikutnya yang ditunggu server.")
+    samples_received: int
+    elapsed_seconds: float
+    epochs: int
+    closed_sessions: List[RealtimeSessionResult]
+    newly_closed: List[RealtimeSessionResult] = Field([], description="Sesi yang ditutup oleh blok terakhir.")
+
+class BatchItemStatus(BaseModel):
+    user_id: int
+    username: str
+    edf_filename: str
+    status: str = Field(..., description="diproses | analisis_selesai | laporan_panjang_selesai | selesai | error")
+    error_message: Optional[str] = None
+
+class BatchPayload(BaseModel):
+    batch_id: str
+    total: int
+    completed: int
+    failed: int
+    items: List[BatchItemStatus]
+
 class UserListPayload(BaseModel):
     data: List[User] = Field(..., description="Daftar data pengguna untuk halaman ini.")
     last_id: Optional[int] = Field(None, description="ID terakhir dalam daftar, untuk digunakan di permintaan berikutnya.")
@@ -1,49 +1,292 @@
 # filename: tasks.py
 
-from celery import Celery
+from celery import Celery, Task, chain, chord, group
+from celery.signals import worker_process_init
 import os
 import shutil
-import traceback # <-- 1. IMPORT TRACEBACK
+import tempfile
+import traceback
 
 # Impor fungsi-fungsi utama dari file lain
-from logic import run_full_analysis
+from tools import process_edf_to_feature_file
+from logic import AnalysisRowBuffer, run_full_analysis
+from feature_store import FEATURE_FILE_SUFFIX
+from artifact_cache import ArtifactCache, hash_file
+from render_cache import FigureNotFoundError, RenderCache, resolve_report_figure_format, session_slug
 from generate_fix import generate_full_report
 from generate_fix_pendek import generate_short_report
-from database import SessionLocal
+from database import SessionLocal, engine
 import models
 from config import settings
 from logger_config import setup_logger
 
-celery_app = Celery('tasks', broker='redis://localhost:6379/0')
+celery_app = Celery('tasks', broker='redis://localhost:6379/0', backend=settings.CELERY_RESULT_BACKEND)
 analysis_logger = setup_logger('analysis_logger', 'analysis.log')
 
-@celery_app.task
-def process_analysis_task(
-    processed_csv_path, user_id, username, pekerjaan
-):
-    analysis_logger.info(f"CELERY WORKER: Memulai analisis untuk user ID {user_id}...")
+# Setiap tahap pipeline punya queue sendiri agar worker bisa diskalakan per tahap, mis.:
+#   celery -A tasks worker -Q bwa.preprocess -c 4
+#   celery -A tasks worker -Q bwa.analyze,bwa.report -c 2
+# Routing hanya aktif jika CELERY_ROUTE_STAGES=true; default-nya semua tahap
+# tetap di queue bawaan agar satu worker biasa cukup. bwa.figures berisi pekerjaan
+# prioritas rendah di luar jalur laporan, cukup dilayani worker kecil:
+#   celery -A tasks worker -Q bwa.figures -c 1
+# Prerender gambar satu kandidat dipecah menjadi PRERENDER_WORKERS task (Celery
+# group) sehingga worker bwa.figures dengan -c > 1 merendernya paralel.
+PIPELINE_QUEUES = {
+    'tasks.preprocess_edf_task': 'bwa.preprocess',
+    'tasks.analyze_features_task': 'bwa.analyze',
+    'tasks.analyze_batch_item_task': 'bwa.preprocess',
+    'tasks.save_batch_results_task': 'bwa.analyze',
+    'tasks.long_report_task': 'bwa.report',
+    'tasks.short_report_task': 'bwa.report',
+    'tasks.prerender_figures_task': 'bwa.figures',
+}
+if settings.CELERY_ROUTE_STAGES:
+    celery_app.conf.task_routes = {name: {'queue': queue} for name, queue in PIPELINE_QUEUES.items()}
+
+
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """
+    Proses anak worker (prefork) mewarisi pool engine dari proses induk; koneksi
+    warisan dilepas tanpa ditutup agar socket milik induk tidak terganggu. Setelah
+    itu setiap proses worker membangun pool sendiri yang dipakai ulang antar task.
+    """
+    engine.dispose(close=False)
+
+
+UPLOAD_DIR = "uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Rekaman yang identik (hash isi EDF sama) memakai ulang fitur & hasil analisis dari cache
+artifact_cache = ArtifactCache(settings.ARTIFACT_CACHE_DIR) if settings.ARTIFACT_CACHE_ENABLED else None
+
+# Gambar topoplot/ROC dirender saat diminta (endpoint /v1/bwa/figures, laporan) dari data numerik
+render_cache = RenderCache(settings.RENDER_CACHE_DIR, max_bytes=settings.RENDER_CACHE_MAX_MB * 1024 * 1024)
+# Topoplot laporan disisipkan sebagai gambar vektor (SVG) bila svglib tersedia
+report_figure_format = resolve_report_figure_format(settings.REPORT_FIGURE_FORMAT)
+# Prioritas Celery untuk pekerjaan latar belakang (broker Redis: 0 tertinggi, 9 terendah)
+PRERENDER_PRIORITY = 9
+
+
+def mark_user_error(user_id, username, error_message):
+    """Mencatat status error analisis ke tabel users."""
     db = SessionLocal()
-    user = None # Inisialisasi user di luar try
     try:
-        # 2. Ambil objek user di awal untuk pencatatan error jika gagal
         user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
-            # Jika user tidak ditemukan, catat dan hentikan.
-            analysis_logger.error(f"CELERY WORKER ERROR: User dengan ID {user_id} tidak ditemukan di database. Proses dihentikan.")
-            return
+        if user:
+            user.is_error = True
+            user.error_message = error_message
+            db.commit()
+            analysis_logger.info(f"Status error untuk user {username} berhasil dicatat ke database.")
+    except Exception as db_error:
+        analysis_logger.error(f"FATAL: Gagal mencatat status error ke database untuk user {username}. DB Error: {db_error}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+class PipelineTask(Task):
+    """
+    Base task untuk setiap tahap pipeline. Jika satu tahap gagal, error dicatat
+    ke user terkait dan tahap berikutnya di dalam chain tidak dijalankan.
+    Setiap tahap wajib dipanggil dengan keyword argument user_id dan username.
+    """
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        user_id, username = kwargs.get('user_id'), kwargs.get('username')
+        analysis_logger.error(f"CELERY WORKER ERROR: Tahap {self.name} gagal untuk user {username}: {einfo}")
+        if user_id is not None:
+            mark_user_error(user_id, username, f"Error: {exc}\n\nTraceback:\n{einfo}")
+
+
+def ica_options_from_settings(ica_cache_key=None):
+    """Konfigurasi ica_engine.fit_ica dari settings; warm start hanya jika ICA_WARM_START aktif."""
+    return {
+        'method': settings.ICA_METHOD,
+        'fit_decim': settings.ICA_FIT_DECIM,
+        'fit_l_freq': settings.ICA_FIT_L_FREQ,
+        'warm_start_key': ica_cache_key if settings.ICA_WARM_START else None,
+        'cache_dir': settings.ICA_CACHE_DIR,
+    }
+
+
+def start_analysis_pipeline(edf_path, user_id, username, pekerjaan, ica_cache_key=None, content_hash=None):
+    """
+    Menjadwalkan pipeline lengkap untuk satu kandidat:
+    preprocess (EDF -> fitur) -> analyze -> laporan panjang -> laporan pendek.
+    ica_cache_key (mis. nama operator/perangkat) menentukan cache warm start ICA.
+    content_hash (SHA-256 isi EDF) boleh dikirim jika sudah dihitung saat ingest;
+    jika tidak, worker menghitungnya sendiri.
+    """
+    pipeline = chain(
+        preprocess_edf_task.s(edf_path, user_id=user_id, username=username, ica_cache_key=ica_cache_key,
+                              content_hash=content_hash),
+        analyze_features_task.s(user_id=user_id, username=username),
+        long_report_task.s(user_id=user_id, username=username, pekerjaan=pekerjaan),
+        short_report_task.s(user_id=user_id, username=username, pekerjaan=pekerjaan),
+    )
+    return pipeline.apply_async()
 
-        # --- LANGKAH A: JALANKAN ANALISIS LOGIKA INTI ---
+
+def start_feature_analysis_pipeline(features_path, user_id, username, pekerjaan):
+    """
+    Seperti start_analysis_pipeline, tetapi mulai dari file fitur yang sudah jadi
+    (mis. hasil stream realtime): analyze -> laporan panjang -> laporan pendek.
+    Tanpa EDF tidak ada hash isi, sehingga cache artefak tidak dipakai.
+    """
+    pipeline = chain(
+        analyze_features_task.s({"features_path": features_path, "cache_key": None},
+                                user_id=user_id, username=username),
+        long_report_task.s(user_id=user_id, username=username, pekerjaan=pekerjaan),
+        short_report_task.s(user_id=user_id, username=username, pekerjaan=pekerjaan),
+    )
+    return pipeline.apply_async()
+
+
+def preprocess_edf(edf_path, user_id, ica_cache_key=None, content_hash=None):
+    """
+    EDF mentah -> file fitur POW/PM biner (ICA, filter, FFT); EDF dihapus sesudahnya.
+    Mengembalikan path file fitur dan kunci cache artefak (None jika cache nonaktif).
+    """
+    analysis_logger.info(f"CELERY WORKER: Memulai pra-pemrosesan EDF untuk user ID {user_id}...")
+    features_path = os.path.join(UPLOAD_DIR, f"{os.path.splitext(os.path.basename(edf_path))[0]}_features{FEATURE_FILE_SUFFIX}")
+    ica_options = ica_options_from_settings(ica_cache_key)
+    try:
+        cache_key = None
+        if artifact_cache is not None:
+            content_hash = content_hash or hash_file(edf_path)
+            cache_key = artifact_cache.features_key(content_hash, ica_options)
+        process_edf_to_feature_file(edf_path, features_path, ica_options=ica_options,
+                                    cache=artifact_cache, content_hash=content_hash)
+        analysis_logger.info(f"CELERY WORKER: File fitur berhasil dibuat di '{features_path}'.")
+        return {"features_path": features_path, "cache_key": cache_key}
+    finally:
+        if os.path.exists(edf_path):
+            os.remove(edf_path)
+
+
+def analyze_features(preprocessed, user_id, username, save=True):
+    """Analisis inti dari file fitur hasil preprocess_edf; file fitur dihapus sesudahnya."""
+    features_path = preprocessed["features_path"]
+    try:
         analysis_logger.info(f"CELERY WORKER: Menjalankan run_full_analysis untuk {username}")
-        result = run_full_analysis(processed_csv_path, user_id, username)
+        result = run_full_analysis(features_path, user_id, username,
+                                   cache=artifact_cache, cache_key=preprocessed["cache_key"],
+                                   render_cache=render_cache, save=save)
         analysis_logger.info("CELERY WORKER: Analisis logika selesai.")
+        return result
+    finally:
+        if os.path.exists(features_path):
+            os.remove(features_path)
+
+
+@celery_app.task(base=PipelineTask)
+def preprocess_edf_task(edf_path, user_id, username, ica_cache_key=None, content_hash=None):
+    """Tahap 1: EDF mentah -> file fitur (lihat preprocess_edf)."""
+    return preprocess_edf(edf_path, user_id, ica_cache_key=ica_cache_key, content_hash=content_hash)
+
+
+@celery_app.task(base=PipelineTask)
+def analyze_features_task(preprocessed, user_id, username):
+    """Tahap 2: analisis inti (skor + data gambar topoplot/ROC) dan simpan ke database."""
+    return analyze_features(preprocessed, user_id, username)
+
+
+def start_batch_pipeline(batch_id, items):
+    """
+    Menjadwalkan pipeline satu batch sebagai chord. items: dict per kandidat berisi
+    edf_path, user_id, username, pekerjaan dan ica_cache_key. Setiap kandidat
+    dipra-proses dan dianalisis paralel tanpa menulis ke database; setelah semuanya
+    selesai, save_batch_results_task menulis baris hasil seluruh batch dalam satu
+    transaksi lalu menjadwalkan laporan per kandidat.
+    """
+    header = [
+        analyze_batch_item_task.s(item['edf_path'], user_id=item['user_id'], username=item['username'],
+                                  ica_cache_key=item['ica_cache_key'])
+        for item in items
+    ]
+    candidates = [
+        {"user_id": item['user_id'], "username": item['username'], "pekerjaan": item['pekerjaan']}
+        for item in items
+    ]
+    return chord(header)(save_batch_results_task.s(batch_id=batch_id, candidates=candidates))
+
+
+@celery_app.task
+def analyze_batch_item_task(edf_path, user_id, username, ica_cache_key=None):
+    """
+    Tahap 1+2 untuk satu kandidat batch, tanpa menulis ke database. Error dicatat ke
+    user dan dikembalikan sebagai None: satu kandidat gagal tidak boleh menggagalkan
+    chord (dan penulisan hasil) kandidat lain.
+    """
+    try:
+        preprocessed = preprocess_edf(edf_path, user_id, ica_cache_key=ica_cache_key)
+        return analyze_features(preprocessed, user_id, username, save=False)
+    except Exception as e:
+        analysis_logger.error(f"CELERY WORKER ERROR: Analisis batch gagal untuk user {username}: {e}", exc_info=True)
+        mark_user_error(user_id, username, f"Error: {e}\n\nTraceback:\n{traceback.format_exc()}")
+        return None
+
+
+@celery_app.task
+def save_batch_results_task(results, batch_id, candidates):
+    """
+    Callback chord batch: baris hasil semua kandidat yang berhasil ditulis sekaligus
+    (satu executemany per tabel), lalu laporan panjang & pendek dijadwalkan per kandidat.
+    results berurutan sama dengan candidates.
+    """
+    done = [(result, candidate) for result, candidate in zip(results, candidates) if result is not None]
+    row_buffer = AnalysisRowBuffer()
+    for result, candidate in done:
+        row_buffer.add(result, candidate['user_id'], candidate['username'])
+    try:
+        row_buffer.flush()
+    except Exception as e:
+        analysis_logger.error(f"CELERY WORKER ERROR: Batch {batch_id}: gagal menyimpan hasil analisis: {e}", exc_info=True)
+        for _, candidate in done:
+            mark_user_error(candidate['user_id'], candidate['username'], f"Gagal menyimpan hasil analisis: {e}")
+        raise
+    analysis_logger.info(f"CELERY WORKER: Batch {batch_id}: hasil {len(done)}/{len(candidates)} kandidat disimpan.")
+
+    for result, candidate in done:
+        del result["roc_results_db"]
+        user_id, username, pekerjaan = candidate['user_id'], candidate['username'], candidate['pekerjaan']
+        chain(
+            long_report_task.s(result, user_id=user_id, username=username, pekerjaan=pekerjaan),
+            short_report_task.s(user_id=user_id, username=username, pekerjaan=pekerjaan),
+        ).apply_async()
+    return len(done)
+
+
+def write_report_topoplots(username, session_names, output_dir):
+    """
+    Menulis topoplot sesi-sesi laporan ke output_dir milik task dan mengembalikan path-nya.
+    Laporan tidak membaca path render cache langsung: proses API bisa meng-evict file
+    tersebut (batas ukuran cache) selama laporan disusun.
+    """
+    paths = []
+    for session_name in session_names:
+        slug = session_slug(session_name)
+        path = os.path.join(output_dir, f"topoplot_{slug}.{report_figure_format}")
+        with open(path, 'wb') as f:
+            f.write(render_cache.topoplot_bytes(username, slug, fmt=report_figure_format))
+        paths.append(path)
+    return paths
+
+
+@celery_app.task(base=PipelineTask)
+def long_report_task(result, user_id, username, pekerjaan):
+    """Tahap 3: laporan panjang. Mengembalikan konteks yang dibutuhkan laporan pendek."""
+    db = SessionLocal()
+    figure_dir = tempfile.mkdtemp(prefix="report_figures_")
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if not user:
+            # Jika user tidak ditemukan, catat dan hentikan.
+            raise ValueError(f"User dengan ID {user_id} tidak ditemukan di database.")
 
-        # --- LANGKAH B: GENERATE LAPORAN PANJANG ---
         analysis_logger.info("CELERY WORKER: Memulai pembuatan laporan panjang...")
-        # (Logika ini tetap sama)
-        ALLOWED_PERSONALITIES = {"Openess", "Conscientiousness", "Extraversion", "Agreeableness", "Neuroticism"}
-        ALLOWED_COGNITIVE_KEYS = {"Kraepelin Test (Numerik)", "WCST (Logika)", "Digit Span (Short Term Memory)"}
         cognitive_key_map = { "KRAEPELIN TEST": "Kraepelin Test (Numerik)", "WCST": "WCST (Logika)", "DIGIT SPAN": "Digit Span (Short Term Memory)" }
-        cognitive_db_name_map = {"KRAEPELIN TEST": "Kraepelin", "WCST": "WCST", "DIGIT SPAN": "Digit Span"}
 
         top_personality_data = max(result['big_five'], key=lambda x: x.get('SCORE', 0))
         top_cognitive_data = max(result['cognitive_function'], key=lambda x: x.get('SCORE', 0))
@@ -51,9 +294,9 @@ def process_analysis_task(
         kognitif_nama_tertinggi = top_cognitive_data['TEST']
         kognitif_utama_key = cognitive_key_map.get(kognitif_nama_tertinggi.upper())
 
-        output_dir_topoplot = "static/topoplots"
-        topoplot_path_behavior = os.path.join(output_dir_topoplot, f"{username}_topoplot_{top_personality_data['PERSONALITY'].lower().replace(' ', '_')}.png")
-        topoplot_path_cognitive = os.path.join(output_dir_topoplot, f"{username}_topoplot_{kognitif_nama_tertinggi.lower().replace(' ', '_')}.png")
+        # Hanya dua topoplot yang dimuat laporan; keduanya dirender lewat render cache
+        topoplot_path_behavior, topoplot_path_cognitive = write_report_topoplots(
+            username, [top_personality_data['PERSONALITY'], kognitif_nama_tertinggi], figure_dir)
 
         biodata_kandidat = {
             "Nama": user.fullname, "Jenis kelamin": user.gender, "Usia": f"{user.age} Tahun",
@@ -75,52 +318,93 @@ def process_analysis_task(
         db.commit()
         analysis_logger.info(f"CELERY WORKER: Laporan panjang selesai. Level kesesuaian: '{suitability_level_from_long_report}'")
 
-        # --- LANGKAH C: GENERATE LAPORAN PENDEK ---
+        return {
+            "tipe_kepribadian": tipe_kepribadian_tertinggi,
+            "kognitif_nama": kognitif_nama_tertinggi,
+            "kognitif_utama_key": kognitif_utama_key,
+            "biodata_kandidat": biodata_kandidat,
+            "person_job_fit_text": person_job_fit_text,
+            "suitability_level": suitability_level_from_long_report,
+            "table_data": table_data,
+            "overall_average": overall_average,
+        }
+    finally:
+        db.close()
+        shutil.rmtree(figure_dir, ignore_errors=True)
+
+
+@celery_app.task(base=PipelineTask)
+def short_report_task(report_context, user_id, username, pekerjaan):
+    """Tahap 4: laporan pendek, memakai hasil laporan panjang."""
+    db = SessionLocal()
+    figure_dir = tempfile.mkdtemp(prefix="report_figures_")
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if not user:
+            raise ValueError(f"User dengan ID {user_id} tidak ditemukan di database.")
+
         analysis_logger.info("CELERY WORKER: Memulai pembuatan laporan pendek...")
+        cognitive_db_name_map = {"KRAEPELIN TEST": "Kraepelin", "WCST": "WCST", "DIGIT SPAN": "Digit Span"}
+        tipe_kepribadian_tertinggi = report_context["tipe_kepribadian"]
         personality_details = db.query(models.Personality).filter(models.Personality.name == tipe_kepribadian_tertinggi).first()
-        cognitive_db_name = cognitive_db_name_map.get(kognitif_nama_tertinggi.upper())
+        cognitive_db_name = cognitive_db_name_map.get(report_context["kognitif_nama"].upper())
         cognitive_details = db.query(models.Test).filter(models.Test.name == cognitive_db_name).first()
 
+        topoplot_path_behavior, topoplot_path_cognitive = write_report_topoplots(
+            username, [report_context["tipe_kepribadian"], report_context["kognitif_nama"]], figure_dir)
+
         output_dir_pendek = "static/short_report"
         os.makedirs(output_dir_pendek, exist_ok=True)
         nama_file_output_pendek = f"{output_dir_pendek}/{username}_short_report.pdf"
 
         generate_short_report(
-            tipe_kepribadian=tipe_kepribadian_tertinggi, kognitif_utama_key=kognitif_utama_key, pekerjaan=pekerjaan,
-            model_ai="llama3.1:8b", nama_file_output=nama_file_output_pendek, biodata_kandidat=biodata_kandidat,
+            tipe_kepribadian=tipe_kepribadian_tertinggi, kognitif_utama_key=report_context["kognitif_utama_key"], pekerjaan=pekerjaan,
+            model_ai="llama3.1:8b", nama_file_output=nama_file_output_pendek, biodata_kandidat=report_context["biodata_kandidat"],
             topoplot_path_behaviour=topoplot_path_behavior, topoplot_path_cognitive=topoplot_path_cognitive,
             personality_title=personality_details.title, personality_desc=personality_details.description,
             cognitive_title=cognitive_details.title, cognitive_desc=cognitive_details.description,
-            person_job_fit_text_from_long_report=person_job_fit_text,
-            suitability_level=suitability_level_from_long_report,  # <-- Parameter baru ditambahkan di sini
-            suitability_table_data=table_data,
-            average_score=overall_average
+            person_job_fit_text_from_long_report=report_context["person_job_fit_text"],
+            suitability_level=report_context["suitability_level"],
+            suitability_table_data=report_context["table_data"],
+            average_score=report_context["overall_average"]
         )
         user.laporan_pendek = nama_file_output_pendek
         db.commit()
         analysis_logger.info("CELERY WORKER: Laporan pendek selesai.")
 
-    except Exception as e:
-        # 3. JIKA TERJADI ERROR DI BLOK TRY, TANGKAP DAN CATAT KE DATABASE
-        error_details = traceback.format_exc()
-        analysis_logger.error(f"CELERY WORKER ERROR: Terjadi kesalahan fatal saat memproses user {username}: {error_details}")
-        if user:
-            try:
-                user.is_error = True
-                user.error_message = f"Error: {e}\n\nTraceback:\n{error_details}"
-                db.commit()
-                analysis_logger.info(f"Status error untuk user {username} berhasil dicatat ke database.")
-            except Exception as db_error:
-                analysis_logger.error(f"FATAL: Gagal mencatat status error ke database untuk user {username}. DB Error: {db_error}")
-                db.rollback()
-    
+        # Laporan hanya memuat dua topoplot; gambar lain dirender sesudahnya dengan prioritas rendah
+        if settings.PRERENDER_FIGURES:
+            schedule_prerender(username)
     finally:
-        # --- LANGKAH D: BERSIHKAN FILE SEMENTARA ---
-        analysis_logger.info("CELERY WORKER: Membersihkan file sementara...")
-        if os.path.exists(processed_csv_path):
-            os.remove(processed_csv_path)
-        for temp_file in ["cleaning.csv", "cleaning2.csv"]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
         db.close()
-        analysis_logger.info("CELERY WORKER: Pembersihan selesai.")
\ No newline at end of file
+        shutil.rmtree(figure_dir, ignore_errors=True)
+
+
+def schedule_prerender(username, workers=None):
+    """
+    Membagi semua gambar satu kandidat (topoplot per sesi, ROC per channel x band)
+    menjadi paling banyak `workers` bagian dan mengirimnya sebagai satu Celery group.
+    workers=1 berarti satu task yang merender semuanya berurutan.
+    """
+    workers = settings.PRERENDER_WORKERS if workers is None else workers
+    try:
+        figures = render_cache.figure_names(username)
+    except FigureNotFoundError as e:
+        analysis_logger.warning(f"CELERY WORKER: Prerender gambar {username} dilewati: {e}")
+        return None
+    # Pembagian round-robin: bagian ke-i berisi gambar i, i+n, i+2n, ... (urutan tetap)
+    parts = [part for part in (figures[i::max(1, workers)] for i in range(max(1, workers))) if part]
+    if not parts:
+        return None
+    return group(prerender_figures_task.s(username, part) for part in parts).apply_async(priority=PRERENDER_PRIORITY)
+
+
+@celery_app.task
+def prerender_figures_task(username, figures):
+    """Latar belakang: mengisi render cache dengan sebagian gambar PNG milik satu kandidat."""
+    try:
+        paths = render_cache.prerender(username, [tuple(figure) for figure in figures])
+        analysis_logger.info(f"CELERY WORKER: {len(paths)} gambar {username} siap di render cache.")
+    except FigureNotFoundError as e:
+        # Data gambar sudah dihapus/diganti (mis. user dihapus) sebelum task ini berjalan
+        analysis_logger.warning(f"CELERY WORKER: Prerender gambar {username} dilewati: {e}")
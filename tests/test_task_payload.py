@@ -0,0 +1,31 @@
+# Hasil analyze_features_task dikirim ke tahap laporan lewat serializer JSON Celery:
+# hasil analisis baru (tanpa cache) harus bisa di-dump dan di-load ulang oleh kombu.
+import numpy as np
+import pandas as pd
+from kombu.utils.json import dumps, loads
+
+import logic
+from feature_store import save_feature_table
+from pow_tensor import POW_BANDS, POW_CHANNELS
+
+
+def make_feature_table(path, seconds=660, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'time': np.arange(seconds, dtype=float)})
+    for channel in POW_CHANNELS:
+        for band in POW_BANDS:
+            df[f"POW.{channel}.{band}"] = rng.lognormal(1, 0.5, seconds).astype(np.float32)
+    for column in logic.PM_COLUMNS:
+        # Sama seperti keluaran PmEngine.compute
+        df[column] = rng.uniform(0, 1, seconds).astype(np.float32)
+    return save_feature_table(df, str(path))
+
+
+def test_analysis_result_round_trips_through_celery_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(logic, 'save_to_mysql', lambda results, user_id, username: None)
+    result = logic.run_full_analysis(make_feature_table(tmp_path / "features.npy"), 1, "kandidat")
+
+    restored = loads(dumps(result))
+
+    assert restored == result
+    assert all(isinstance(row['ENGAGEMENT'], float) for row in restored['response_during_test'])
@@ -3,7 +3,9 @@
 import mne
 import pandas as pd
 import os
+import shutil
 from fastapi import HTTPException
+from ica_engine import filter_and_apply_ica
 
 # Direktori untuk menyimpan file output
 OUTPUT_DIR = "output_files"
@@ -41,6 +43,11 @@ def process_edf_with_ica_to_csv(input_path: str, original_filename: str) -> str:
     """
     Memproses file EDF dengan filter dan ICA, lalu menyimpannya ke satu file CSV.
 
+    Hanya kanal EEG yang dimuat ke memori dan dibersihkan (in-place, memakai tahap
+    filter + ICA yang sama dengan preproc). Kanal lain dibaca langsung dari file
+    per blok saat CSV ditulis, sehingga EDF klinis dengan banyak kanal tidak
+    perlu dimuat seluruhnya.
+
     Args:
         input_path: Path ke file EDF sementara.
         original_filename: Nama file asli untuk nama output.
@@ -49,157 +56,268 @@ def process_edf_with_ica_to_csv(input_path: str, original_filename: str) -> str:
         Path ke file CSV yang telah diproses.
     """
     try:
-        # 1. Load full EDF
-        raw_full = mne.io.read_raw_edf(input_path, preload=True, verbose=False)
-        
-        # 2. Pilih channel EEG saja untuk ICA
-        eeg_raw = raw_full.copy().pick_types(eeg=True, verbose=False)
+        # 1. Buka EDF tanpa memuat data; hanya kanal EEG yang di-load
+        raw_full = mne.io.read_raw_edf(input_path, preload=False, verbose=False)
+        eeg_picks = mne.pick_types(raw_full.info, eeg=True)
         
-        if not eeg_raw.ch_names:
+        if len(eeg_picks) == 0:
             raise HTTPException(status_code=400, detail="Tidak ditemukan channel EEG di dalam file EDF.")
 
-        # 3. Filter
-        eeg_raw.filter(1., 40., fir_design='firwin', verbose=False)
-
-        # 4. Terapkan ICA
-        n_components = min(15, len(eeg_raw.ch_names) - 1)
+        n_components = min(15, len(eeg_picks) - 1)
         if n_components < 1:
             raise HTTPException(status_code=400, detail="Jumlah channel EEG tidak cukup untuk menjalankan ICA.")
-            
-        ica = mne.preprocessing.ICA(n_components=n_components, random_state=42, max_iter='auto')
-        ica.fit(eeg_raw)
-        
-        # 5. Terapkan ICA ke data EEG
-        ica.apply(eeg_raw, verbose=False)
-
-        # 6. Masukkan kembali data EEG hasil ICA ke data lengkap
-        for ch_name in eeg_raw.ch_names:
-            if ch_name in raw_full.ch_names:
-                idx_full = raw_full.ch_names.index(ch_name)
-                idx_eeg = eeg_raw.ch_names.index(ch_name)
-                raw_full._data[idx_full] = eeg_raw._data[idx_eeg]
-
-        # 7. Ekspor semua channel ke CSV
-        df_cleaned = raw_full.to_data_frame()
-        
+
+        eeg_raw = raw_full.copy().pick(eeg_picks).load_data(verbose=False)
+
+        # 2-4. Filter dan ICA in-place pada kanal EEG (tanpa pembuangan komponen, seperti sebelumnya)
+        filter_and_apply_ica(eeg_raw, n_components=n_components, l_freq=1., h_freq=40.,
+                             random_state=42, verbose=False)
+
+        # 5. Ekspor semua channel ke CSV per blok; kolom EEG diganti dengan hasil ICA
         filename_no_spaces = original_filename.replace(' ', '_')
         
         base_filename = os.path.splitext(filename_no_spaces)[0]
         output_filename = f"{base_filename}_ica_cleaned.csv"
         output_path = os.path.join(OUTPUT_DIR, output_filename)
-        
-        df_cleaned.to_csv(output_path, index=False)
+
+        write_raw_to_csv_in_blocks(raw_full, output_path, replacement=eeg_raw)
         return output_path
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal memproses file dengan ICA: {str(e)}")
+
+
+# Panjang blok (detik) saat mengekspor raw ke CSV
+CSV_EXPORT_BLOCK_SECONDS = 60
+
+def write_raw_to_csv_in_blocks(raw, output_path: str, replacement=None, block_seconds=CSV_EXPORT_BLOCK_SECONDS) -> str:
+    """
+    Menulis raw.to_data_frame() ke CSV blok demi blok (header hanya sekali).
+
+    Args:
+        raw (mne.io.BaseRaw): Sumber data; boleh belum di-load (dibaca per blok dari file).
+        output_path (str): Path CSV output.
+        replacement (mne.io.BaseRaw, optional): Raw berisi sebagian kanal yang nilainya
+            menggantikan kanal bernama sama di raw (mis. kanal EEG hasil ICA).
+        block_seconds (float): Panjang blok dalam detik.
+
+    Returns:
+        str: Path CSV yang ditulis.
+    """
+    block_samples = max(int(block_seconds * raw.info['sfreq']), 1)
+    with open(output_path, 'w', newline='') as f:
+        for start in range(0, raw.n_times, block_samples):
+            stop = min(start + block_samples, raw.n_times)
+            df_block = raw.to_data_frame(start=start, stop=stop)
+            if replacement is not None:
+                df_replacement = replacement.to_data_frame(start=start, stop=stop)
+                df_block[replacement.ch_names] = df_replacement[replacement.ch_names].to_numpy()
+            df_block.to_csv(f, index=False, header=(start == 0))
+    return output_path
     
 import mne
 import pandas as pd
 import numpy as np
 from math import ceil
-from numpy.fft import fft
+from functools import lru_cache
+from numpy.fft import rfft
+from numpy.lib.stride_tricks import sliding_window_view
+from feature_store import save_feature_table, feature_table_to_csv, FEATURE_FILE_SUFFIX
+from artifact_cache import hash_file
+from pow_tensor import PowTensor
+from pm_engine import PmEngine
+
+# Kanal EEG Emotiv INSIGHT yang dipakai oleh pipeline analisis
+EEG_CHANNELS = ['AF3', 'T7', 'Pz', 'T8', 'AF4']
+
+# Jumlah epoch per blok FFT: membatasi puncak memori tabel epoch
+FFT_BLOCK_EPOCHS = 64
+
+# Parameter epoch dan band untuk tabel fitur POW (dipakai juga oleh realtime.py)
+FEATURE_EPOCH_LEN = 512
+FEATURE_EPOCH_STEP = 256
+POW_BAND_FREQUENCIES = [[4, 8], [8, 12], [12, 30], [20, 30], [30, 50]]
+
+def read_edf_eeg_channels(edf_path: str, channels=EEG_CHANNELS):
+    """
+    Membaca hanya kanal EEG yang dibutuhkan dari file EDF, tanpa preload
+    seluruh kanal dan tanpa membuat DataFrame.
+
+    Args:
+        edf_path (str): Path ke file .edf input.
+        channels (list): Nama kanal inti yang dibaca, sesuai urutan output.
 
-def process_edf_to_final_csv(edf_path: str, output_csv_path: str) -> str:
+    Returns:
+        tuple: (data dalam volt dengan shape (n_channels, n_samples), sfreq, timestamp awal rekaman)
+    """
+    raw = mne.io.read_raw_edf(edf_path, include=channels, preload=False, verbose='WARNING')
+    missing = [ch for ch in channels if ch not in raw.ch_names]
+    if missing:
+        raise ValueError(f"Kanal EEG berikut tidak ditemukan di {edf_path}: {missing}")
+    picks = [raw.ch_names.index(ch) for ch in channels]
+
+    sfreq = raw.info['sfreq']
+    data = raw.get_data(picks=picks)
+
+    start_timestamp = raw.info['meas_date'].timestamp()
+    return data, sfreq, start_timestamp
+
+def compute_final_features(edf_path: str, ica_options=None) -> pd.DataFrame:
     """
-    Membaca file EDF mentah, membersihkan sinyal EEG dengan ICA, menghitung 
-    metrik POW dan PM, lalu menyimpannya ke satu file CSV.
+    Membaca file EDF mentah, membersihkan sinyal EEG dengan ICA, lalu menghitung 
+    metrik POW dan PM.
+
+    Hanya lima kanal EEG yang dibaca dari EDF, sehingga memori tidak
+    bergantung pada jumlah kanal EDF.
     
     Args:
         edf_path (str): Path ke file .edf input.
-        output_csv_path (str): Path untuk menyimpan file .csv hasil.
+        ica_options (dict, optional): Konfigurasi mesin ICA, lihat preproc.
 
     Returns:
-        str: Path ke file CSV yang berhasil dibuat.
+        pd.DataFrame: Tabel fitur dengan kolom Timestamp, time, PM.* dan POW.*.
     """
     print(f"Membaca file EDF: {edf_path}...")
-    # LANGKAH 1: BACA FILE .EDF DAN SIAPKAN DATA
-    raw_edf = mne.io.read_raw_edf(edf_path, preload=True, verbose='WARNING')
-    df = raw_edf.to_data_frame(time_format=None)
-    
-    start_timestamp_epoch = raw_edf.info['meas_date'].timestamp()
-    df['Timestamp'] = start_timestamp_epoch + df['time']
-    rename_map = {'AF3': 'EEG.AF3', 'T7': 'EEG.T7', 'Pz': 'EEG.Pz', 'T8': 'EEG.T8', 'AF4': 'EEG.AF4'}
-    df.rename(columns=rename_map, inplace=True)
-    eeg_channels = list(rename_map.values())
-    start_timestamp = df['Timestamp'].iloc[0]
+    # LANGKAH 1: BACA KANAL EEG DARI FILE .EDF
+    eeg_data_volts, sfreq, start_timestamp = read_edf_eeg_channels(edf_path)
+    eeg_channels = [f"EEG.{ch}" for ch in EEG_CHANNELS]
+    timestamps = start_timestamp + np.arange(eeg_data_volts.shape[1]) / sfreq
 
     # LANGKAH 2: PRA-PEMROSESAN DENGAN ICA
-    # (Menggunakan fungsi preproc dari file edf_ica_pm_pow.py)
     print("Memulai pembersihan EEG dengan ICA...")
-    df_eeg_cleaned = preproc(df, eeg_channels) # Fungsi preproc harus ada/diimpor di file ini
+    eeg_cleaned = preproc(eeg_data_volts, EEG_CHANNELS, sfreq, ica_options=ica_options)
+    del eeg_data_volts
     print("Pembersihan EEG selesai.")
 
     # LANGKAH 3: HITUNG POWER BANDS (POW)
-    # (Menggunakan fungsi eeg_fast_transform dari file edf_ica_pm_pow.py)
-    band_frequencies = [[4, 8], [8, 12], [12, 30], [20, 30], [30, 50]]
     print("\nMenghitung Power Bands (POW)...")
     df_pow = eeg_fast_transform(
-        t=np.array(df['Timestamp']),
-        eeg_data=np.array(df_eeg_cleaned),
-        epoch_len=512, epoch_step=256,
-        channels=eeg_channels, band_frequencies=band_frequencies
+        t=timestamps,
+        eeg_data=eeg_cleaned,
+        epoch_len=FEATURE_EPOCH_LEN, epoch_step=FEATURE_EPOCH_STEP,
+        channels=eeg_channels, band_frequencies=POW_BAND_FREQUENCIES
     )
-    df_final = df_pow.copy()
+    df_final = df_pow
 
     # LANGKAH 4: HITUNG METRIK PM
     print("Menghitung metrik PM...")
-    BETA, ALPHA, THETA, BETA_H, GAMMA = 'Beta', 'Alpha', 'Theta', 'BetaH', 'Gamma'
-    beta_cols = [col for col in df_final.columns if col.endswith(f'.{BETA}')]
-    alpha_cols = [col for col in df_final.columns if col.endswith(f'.{ALPHA}')]
-    theta_cols = [col for col in df_final.columns if col.endswith(f'.{THETA}')]
-    beta_h_cols = [col for col in df_final.columns if col.endswith(f'.{BETA_H}')]
-    gamma_cols = [col for col in df_final.columns if col.endswith(f'.{GAMMA}')]
-
-    P_beta_db = df_final[beta_cols].mean(axis=1)
-    P_alpha_db = df_final[alpha_cols].mean(axis=1)
-    P_theta_db = df_final[theta_cols].mean(axis=1)
-    P_beta_high_db = df_final[beta_h_cols].mean(axis=1)
-    P_gamma_db = df_final[gamma_cols].mean(axis=1)
-
-    epsilon = 1e-9
-    P_beta = 10**(P_beta_db / 10)
-    P_alpha = 10**(P_alpha_db / 10)
-    P_theta = 10**(P_theta_db / 10)
-    P_beta_high = 10**(P_beta_high_db / 10)
-    P_gamma = 10**(P_gamma_db / 10)
-
-    df_final['PM.Attention'] = P_beta / (P_alpha + P_theta + epsilon)
-    df_final['PM.Engagement'] = P_beta / (P_alpha + P_theta + epsilon)
-    df_final['PM.Interest'] = (P_beta + P_gamma) / (P_alpha + P_theta + epsilon)
-    df_final['PM.Excitement'] = (P_gamma + P_beta_high) / (P_alpha + epsilon)
-    df_final['PM.Focus'] = P_beta / (P_alpha + epsilon)
-    df_final['PM.Stress'] = P_beta_high / (P_alpha + epsilon)
-    df_final['PM.Relaxation'] = (P_alpha + P_theta) / (P_beta + epsilon)
+    # Tensor POW (epoch x channel x band) dibangun sekali; rata-rata antar channel
+    # untuk semua band dihitung dengan satu reduksi, lalu semua metrik PM dihitung
+    # sekaligus dari tabel formula (lihat pm_engine.py)
+    pow_tensor = PowTensor.from_frame(df_final, time_column='Timestamp')
+    pm_engine = PmEngine(pow_tensor.bands)
+    pm_values = pm_engine.compute(pow_tensor.channel_mean())
+    df_final = pd.concat(
+        [df_final, pd.DataFrame(pm_values, columns=pm_engine.columns, index=df_final.index)], axis=1)
 
     # LANGKAH 5: FINALISASI DAN SIMPAN
     df_final.insert(1, 'time', df_final['Timestamp'] - start_timestamp)
+    return order_feature_columns(df_final)
+
+def order_feature_columns(df_final: pd.DataFrame) -> pd.DataFrame:
+    """Urutan kolom tabel fitur: Timestamp, time, PM.* lalu POW.* (keduanya urut abjad)."""
     time_cols = ['Timestamp', 'time']
     pm_cols = sorted([col for col in df_final.columns if col.startswith('PM.')])
     pow_cols = sorted([col for col in df_final.columns if col.startswith('POW.')])
     final_column_order = time_cols + pm_cols + pow_cols
-    df_final = df_final[final_column_order]
+    return df_final[final_column_order]
+
+def cached_feature_file(edf_path: str, cache, content_hash: str = None, ica_options=None) -> str:
+    """
+    Path file fitur .npy untuk EDF ini di cache artefak (lihat artifact_cache.py).
+    Jika belum ada, fitur dihitung sekali lalu disimpan ke cache.
 
-    df_final.to_csv(output_csv_path, index=False)
+    Args:
+        edf_path (str): Path ke file .edf input.
+        cache (ArtifactCache): Cache artefak.
+        content_hash (str, optional): SHA-256 isi EDF jika sudah dihitung saat ingest.
+        ica_options (dict, optional): Konfigurasi mesin ICA, lihat preproc.
+
+    Returns:
+        str: Path file fitur di dalam cache.
+    """
+    key = cache.features_key(content_hash or hash_file(edf_path), ica_options)
+    cached_path = cache.feature_path(key)
+    if cached_path is not None:
+        print(f"File fitur ditemukan di cache ({key[:12]}), pra-pemrosesan dilewati.")
+        return cached_path
+
+    tmp_path = f"{edf_path}.features{FEATURE_FILE_SUFFIX}"
+    try:
+        save_feature_table(compute_final_features(edf_path, ica_options), tmp_path)
+        return cache.put_features(key, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def process_edf_to_feature_file(edf_path: str, output_path: str, ica_options=None, cache=None, content_hash=None) -> str:
+    """
+    Memproses file EDF dan menyimpan tabel fitur POW/PM dalam format biner
+    kolumnar (lihat feature_store.py). Format inilah yang diserahkan ke worker.
+
+    Args:
+        edf_path (str): Path ke file .edf input.
+        output_path (str): Path untuk menyimpan file fitur (.npy).
+        ica_options (dict, optional): Konfigurasi mesin ICA, lihat preproc.
+        cache (ArtifactCache, optional): Jika diberikan, rekaman yang sama tidak diproses ulang.
+        content_hash (str, optional): SHA-256 isi EDF (dihitung jika None dan cache aktif).
+
+    Returns:
+        str: Path ke file fitur yang berhasil dibuat.
+    """
+    if cache is not None:
+        shutil.copyfile(cached_feature_file(edf_path, cache, content_hash, ica_options), output_path)
+    else:
+        save_feature_table(compute_final_features(edf_path, ica_options), output_path)
+    print(f"\nProses Selesai! File fitur disimpan di: {output_path}")
+    return output_path
+
+def process_edf_to_final_csv(edf_path: str, output_csv_path: str, cache=None, content_hash=None) -> str:
+    """
+    Memproses file EDF dan menyimpan tabel fitur POW/PM ke satu file CSV.
+    Hanya dipakai sebagai format unduhan; pipeline analisis memakai
+    process_edf_to_feature_file.
+
+    Args:
+        edf_path (str): Path ke file .edf input.
+        output_csv_path (str): Path untuk menyimpan file .csv hasil.
+        cache (ArtifactCache, optional): Jika diberikan, rekaman yang sama tidak diproses ulang.
+        content_hash (str, optional): SHA-256 isi EDF (dihitung jika None dan cache aktif).
+
+    Returns:
+        str: Path ke file CSV yang berhasil dibuat.
+    """
+    if cache is not None:
+        feature_table_to_csv(cached_feature_file(edf_path, cache, content_hash), output_csv_path)
+    else:
+        compute_final_features(edf_path).to_csv(output_csv_path, index=False)
     print(f"\nProses Selesai! File CSV komprehensif disimpan di: {output_csv_path}")
     return output_csv_path
 
-def preproc(frame, eeg_channels):
+def preproc(eeg_data_volts, ch_names, sfreq=256, ica_options=None):
     """
     Fungsi ini membersihkan sinyal EEG dari artefak menggunakan ICA.
+
+    Args:
+        eeg_data_volts (np.ndarray): Data EEG dalam volt, shape (n_channels, n_samples).
+        ch_names (list): Nama kanal inti, misalnya ['AF3', 'T7', 'Pz', 'T8', 'AF4'].
+        sfreq (float): Frekuensi sampling rekaman.
+        ica_options (dict, optional): Argumen tambahan untuk ica_engine.fit_ica
+            (method, fit_decim, fit_l_freq, warm_start_key, cache_dir).
+            Default: fastica pada seluruh sampel, seperti sebelumnya.
+
+    Returns:
+        np.ndarray: Data EEG bersih dalam microvolt, shape (n_samples, n_channels).
     """
     print("Memulai pra-pemrosesan dengan ICA...")
     
     # 1. Tentukan informasi dasar dari data EEG Anda
-    sampling_freq = 256  # Sesuai data Emotiv INSIGHT Anda
-    ch_names = [ch.split('.')[-1] for ch in eeg_channels] # Mengambil nama inti: ['AF3', 'T7', 'Pz', 'T8', 'AF4']
     ch_types = ['eeg'] * len(ch_names)
-    
-    # Konversi data dari microvolt ke volt (kebutuhan MNE)
-    eeg_data_volts = frame[eeg_channels].values.T / 1e6
 
     # 2. Buat objek MNE Info dan RawArray
     # Ini adalah cara kita "membungkus" data agar bisa diproses oleh MNE
-    info = mne.create_info(ch_names=ch_names, sfreq=sampling_freq, ch_types=ch_types)
+    info = mne.create_info(ch_names=list(ch_names), sfreq=sfreq, ch_types=ch_types)
     raw = mne.io.RawArray(eeg_data_volts, info)
     
     # Set lokasi sensor standar untuk perangkat 5-kanal (opsional tapi bagus untuk visualisasi)
@@ -207,49 +325,38 @@ def preproc(frame, eeg_channels):
     montage = mne.channels.make_standard_montage('standard_1020')
     raw.set_montage(montage, on_missing='warn')
 
-    # 3. Filter sinyal sebelum ICA
-    # ICA bekerja lebih baik pada data yang sudah di-bandpass filter
-    raw.filter(l_freq=1., h_freq=40.)
+    # 3-6. Filter, ICA, deteksi kedipan mata, lalu hapus komponennya (in-place)
+    # n_components menentukan berapa "sumber" sinyal independen yang ingin kita temukan.
+    # Sinyal EOG "palsu" dibuat dari kanal AF3 dan AF4 untuk membantu deteksi kedipan;
+    # ini adalah trik umum jika tidak ada kanal EOG khusus.
+    filter_and_apply_ica(raw, n_components=len(ch_names), l_freq=1., h_freq=40., random_state=97,
+                         eog_ch_names=['AF3', 'AF4'], eog_threshold=1.5, ica_options=ica_options)
+    print("Artefak telah dihapus dari sinyal EEG.")
 
-    # 4. Inisialisasi dan jalankan ICA
-    # n_components menentukan berapa "sumber" sinyal independen yang ingin kita temukan
-    ica = mne.preprocessing.ICA(n_components=len(ch_names), random_state=97, max_iter='auto')
-    ica.fit(raw)
+    # 4. Ambil kembali data yang sudah bersih, langsung dalam microvolt
+    cleaned_data_microvolts = raw.get_data(units='uV')
 
-    print("ICA fit selesai. Mencari komponen artefak (kedipan mata)...")
+    return cleaned_data_microvolts.T
 
-    # 5. Temukan komponen yang berhubungan dengan kedipan mata (EOG)
-    # Kita akan membuat sinyal EOG "palsu" dari kanal AF3 dan AF4 untuk membantu deteksi
-    # Ini adalah trik umum jika tidak ada kanal EOG khusus
-    eog_indices, eog_scores = ica.find_bads_eog(raw, ch_name=['AF3', 'AF4'], threshold=1.5)
-    
-    if eog_indices:
-        print(f"Komponen EOG yang terdeteksi: {eog_indices}")
-        ica.exclude = eog_indices
-    else:
-        print("Tidak ada komponen kedipan mata yang signifikan terdeteksi.")
-
-    # 6. Terapkan ICA untuk menghapus komponen artefak
-    raw_cleaned = raw.copy()
-    ica.apply(raw_cleaned)
-    print("Artefak telah dihapus dari sinyal EEG.")
+# Frekuensi sampling yang dipakai untuk memetakan Hz ke indeks bin FFT.
+# Nilai historis pipeline adalah 128 (dulu ter-hardcode sebagai pembagi),
+# dan skor-skor analisis dikalibrasi terhadap nilai ini.
+SPECTRAL_SFREQ = 128
 
-    # 7. Ambil kembali data yang sudah bersih
-    cleaned_data_volts = raw_cleaned.get_data()
-    
-    # Konversi kembali dari volt ke microvolt
-    cleaned_data_microvolts = cleaned_data_volts * 1e6
-    
-    # Buat DataFrame baru untuk data EEG yang sudah bersih
-    cleaned_frame = pd.DataFrame(cleaned_data_microvolts.T, columns=eeg_channels)
-    
-    return cleaned_frame
+# Peta untuk menerjemahkan rentang frekuensi ke nama band yang benar
+BAND_NAMES = {
+    (4, 8): 'Theta',
+    (8, 12): 'Alpha',
+    (12, 30): 'Beta',
+    (20, 30): 'BetaH', # Beta Tinggi
+    (30, 50): 'Gamma'
+}
 
-def create_band_indices(epoch_len, band_frequencies):
+def create_band_indices(epoch_len, band_frequencies, sfreq=SPECTRAL_SFREQ):
     if band_frequencies is None:
         return None
 
-    epoch_length_seconds = epoch_len / 128
+    epoch_length_seconds = epoch_len / sfreq
     band_indicies = []
     for i in range(len(band_frequencies)):
         low_f = band_frequencies[i][0]
@@ -261,59 +368,108 @@ def create_band_indices(epoch_len, band_frequencies):
     return band_indicies
 
 def make_transform_columns(channels, band_frequencies):
-    # Peta untuk menerjemahkan rentang frekuensi ke nama band yang benar
-    band_map = {
-        str([4, 8]): 'Theta',
-        str([8, 12]): 'Alpha',
-        str([12, 30]): 'Beta',
-        str([20, 30]): 'BetaH', # Beta Tinggi
-        str([30, 50]): 'Gamma'
-    }
-
     columns = []
     if band_frequencies is not None:
         for band_range in band_frequencies:
-            band_name = band_map.get(str(band_range), f"{band_range[0]}_{band_range[1]}Hz")
+            band_name = BAND_NAMES.get(tuple(band_range), f"{band_range[0]}_{band_range[1]}Hz")
             for ch in channels:
                 core_channel_name = ch.split('.')[-1]
                 new_col_name = f"POW.{core_channel_name}.{band_name}"
                 columns.append(new_col_name)
     return columns
 
+def create_band_mask(epoch_len, band_indices):
+    """
+    Membuat matriks bobot (n_freq_bins x n_bands) untuk spektrum rfft, sehingga
+    rata-rata power tiap band cukup dihitung dengan satu perkalian matriks.
+    """
+    n_freq_bins = epoch_len // 2 + 1
+    band_mask = np.zeros((n_freq_bins, len(band_indices)))
+    for j, band in enumerate(band_indices):
+        for k in band:
+            # Bin di atas Nyquist pada fft dua sisi adalah cermin dari bin N - k
+            k = k if k < n_freq_bins else epoch_len - k
+            band_mask[k, j] += 1.0 / len(band)
+    return band_mask
+
+class SpectralPlan:
+    """
+    Semua konstanta transformasi spektral yang tidak berubah antar upload:
+    window Hanning, indeks dan mask bin frekuensi per band (sudah termasuk
+    normalisasi 1/N^2 dari FFT), serta layout kolom output.
+
+    Jangan dibuat langsung; gunakan get_spectral_plan() agar plan di-memoize.
+    """
+    def __init__(self, epoch_len, epoch_step, sfreq, band_frequencies):
+        self.epoch_len = epoch_len
+        self.epoch_step = epoch_step
+        self.sfreq = sfreq
+        self.band_frequencies = band_frequencies
+        self.band_indices = create_band_indices(epoch_len, band_frequencies, sfreq)
+        self.window = np.hanning(epoch_len) * 2
+        self.band_mask = create_band_mask(epoch_len, self.band_indices) / epoch_len**2
+        self._columns = {}
+
+    @property
+    def n_bands(self):
+        return len(self.band_indices)
+
+    def columns(self, channels):
+        """Nama kolom POW.<channel>.<band> (urutan band-mayor), di-cache per daftar kanal."""
+        key = tuple(channels)
+        if key not in self._columns:
+            self._columns[key] = make_transform_columns(channels, self.band_frequencies)
+        return self._columns[key]
+
+@lru_cache(maxsize=None)
+def _build_spectral_plan(epoch_len, epoch_step, sfreq, band_frequencies):
+    return SpectralPlan(epoch_len, epoch_step, sfreq, band_frequencies)
+
+def get_spectral_plan(epoch_len, epoch_step, sfreq, band_frequencies):
+    """Mengambil SpectralPlan yang di-memoize untuk kombinasi parameter ini."""
+    band_key = tuple(tuple(band) for band in band_frequencies)
+    return _build_spectral_plan(int(epoch_len), int(epoch_step), float(sfreq), band_key)
+
+def epoch_band_power(epochs, plan):
+    """
+    Power band untuk sekumpulan epoch (n_epoch x n_channel x epoch_len).
+
+    Returns:
+        np.ndarray: (n_epoch x n_band*n_channel), urutan kolom sama dengan plan.columns().
+    """
+    block = (epochs - epochs.mean(axis=-1, keepdims=True)) * plan.window
+    fourier_transform = rfft(block, axis=-1)
+    power = fourier_transform.real**2 + fourier_transform.imag**2
+    # Rata-rata power absolut per band, tanpa konversi ke log10 (decibel)
+    band_power = power @ plan.band_mask  # (n_epoch, n_channels, n_bands)
+    return band_power.transpose(0, 2, 1).reshape(len(epochs), -1)
+
 def eeg_fast_transform(t, eeg_data, epoch_len, epoch_step, channels,
-                       band_frequencies):
-    band_indices = create_band_indices(epoch_len, band_frequencies)
-    if band_indices is None:
+                       band_frequencies, block_epochs=FFT_BLOCK_EPOCHS,
+                       sfreq=SPECTRAL_SFREQ):
+    if band_frequencies is None:
         return None
+    plan = get_spectral_plan(epoch_len, epoch_step, sfreq, band_frequencies)
 
     # PERBAIKAN: Hapus "+ 1" dari range untuk mencegah out-of-bounds error
     stop_range = t.shape[0] - epoch_len
+    epoch_starts = np.arange(0, stop_range, epoch_step)
+    if len(epoch_starts) == 0:
+        raise ValueError("Rekaman terlalu pendek untuk membentuk satu epoch.")
+
+    # View sliding window tanpa salinan: shape (n_epochs, n_channels, epoch_len)
+    epochs = sliding_window_view(eeg_data, epoch_len, axis=0)[:stop_range:epoch_step]
+
+    # FFT dihitung per blok epoch agar spektrum tidak pernah sepanjang rekaman
+    n_epochs, n_channels = epochs.shape[0], epochs.shape[1]
+    trans = np.empty((n_epochs, plan.n_bands * n_channels))
+    for block_start in range(0, n_epochs, block_epochs):
+        block = epochs[block_start:block_start + block_epochs]
+        trans[block_start:block_start + len(block)] = epoch_band_power(block, plan)
+
+    df_features = pd.DataFrame(trans, columns=plan.columns(channels))
     
-    # start transform from 2D to 3D matrix for EEG
-    ts = [[t[i], t[i+epoch_len-1]] for i in range(0, stop_range, epoch_step)] # juga ubah t[i+epoch_len] menjadi t[i+epoch_len-1] untuk konsistensi
-
-    eeg_3d = np.dstack([eeg_data[i:i+epoch_len]
-                        for i in range(0, stop_range, epoch_step)])
-                        
-    eeg_3d = eeg_3d - np.mean(eeg_3d, axis=0)
-    hanning_window = np.hanning(eeg_3d.shape[0]) * 2
-    eeg_fft_3d = (eeg_3d.T * hanning_window).T
-    fourier_transform = fft(eeg_fft_3d, axis=0)/eeg_fft_3d.shape[0]
-    eeg_fft_square_3d = np.absolute(fourier_transform)**2
-
-    trans = None
-    for band in band_indices:
-        band_power = np.sum(eeg_fft_square_3d[band, :, :], axis=0)
-        # Menghitung rata-rata power absolut, tanpa konversi ke log10 (decibel)
-        band_power = band_power / len(band) # <-- DIUBAH MENJADI INI
-        trans = band_power.T if trans is None else \
-            np.concatenate((trans, band_power.T), axis=1)
-            
-    columns = make_transform_columns(channels, band_frequencies)
-
-    df_features = pd.DataFrame(trans, columns=columns)
-    
-    # Menambahkan kolom timestamp untuk acuan
-    df_features['Timestamp'] = [ts_item[0] for ts_item in ts]
+    # Menambahkan kolom timestamp untuk acuan (awal tiap epoch)
+    df_features['Timestamp'] = t[epoch_starts]
     
     return df_features
\ No newline at end of file
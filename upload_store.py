@@ -0,0 +1,204 @@
+# filename: upload_store.py
+#
+# Upload store untuk unggahan EDF yang dapat dilanjutkan (resumable), dipecah per chunk:
+#   init   -> membuat sesi unggah (nama file, ukuran total, sha256 opsional)
+#   append -> menambahkan chunk pada offset tertentu, diverifikasi dengan sha256 chunk
+#   verify -> memverifikasi ukuran/sha256 file tanpa memindahkannya
+#   commit -> memverifikasi ukuran/sha256 file lalu memindahkan file (os.replace,
+#             tanpa salinan kedua) ke direktori upload pipeline
+#   restore -> mengembalikan file hasil commit ke sesinya jika langkah sesudah
+#             commit gagal, sehingga commit bisa diulang tanpa unggah ulang
+#
+# Offset sesi selalu dibaca dari ukuran file .part di disk, sehingga klien yang
+# koneksinya putus cukup menanyakan status lalu melanjutkan dari offset tersebut.
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+
+class UploadStoreError(Exception):
+    """Error unggah; status_code dipakai endpoint sebagai kode HTTP."""
+    status_code = 400
+
+
+class UploadNotFoundError(UploadStoreError):
+    status_code = 404
+
+
+class UploadOffsetError(UploadStoreError):
+    """Offset chunk tidak sama dengan jumlah byte yang sudah diterima."""
+    status_code = 409
+
+    def __init__(self, message, current_offset):
+        super().__init__(message)
+        self.current_offset = current_offset
+
+
+_UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class UploadStore:
+    """
+    Sesi unggah disimpan sebagai dua file di root: <id>.part (data) dan <id>.json (metadata).
+    Root sebaiknya berada di filesystem yang sama dengan direktori tujuan commit
+    agar os.replace hanya memindahkan, bukan menyalin.
+    """
+    def __init__(self, root: str, max_chunk_bytes: int, stale_seconds: float):
+        self.root = root
+        self.max_chunk_bytes = max_chunk_bytes
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, upload_id: str):
+        if not _UPLOAD_ID_PATTERN.fullmatch(upload_id or ''):
+            raise UploadNotFoundError(f"Upload '{upload_id}' tidak ditemukan.")
+        base = os.path.join(self.root, upload_id)
+        return f"{base}.part", f"{base}.json"
+
+    def _load_meta(self, upload_id: str) -> dict:
+        part_path, meta_path = self._paths(upload_id)
+        if not os.path.exists(meta_path) or not os.path.exists(part_path):
+            raise UploadNotFoundError(f"Upload '{upload_id}' tidak ditemukan.")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['offset'] = os.path.getsize(part_path)
+        return meta
+
+    def init(self, filename: str, total_size: int, sha256: str = None) -> dict:
+        """Membuat sesi unggah baru dan mengembalikan status awalnya (offset 0)."""
+        if total_size <= 0:
+            raise UploadStoreError("total_size harus lebih besar dari 0.")
+        if sha256 is not None and not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+            raise UploadStoreError("sha256 harus berupa 64 karakter heksadesimal.")
+        self.purge_stale()
+
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        meta = {
+            'upload_id': upload_id,
+            'filename': os.path.basename(filename),
+            'total_size': int(total_size),
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time(),
+        }
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        """Metadata sesi beserta offset (jumlah byte yang sudah diterima)."""
+        meta = self._load_meta(upload_id)
+        meta['max_chunk_bytes'] = self.max_chunk_bytes
+        return meta
+
+    def append(self, upload_id: str, offset: int, data: bytes, chunk_sha256: str) -> dict:
+        """
+        Menambahkan satu chunk. Chunk yang dikirim ulang (offset + panjang sudah
+        diterima dan isinya sama) dianggap sukses agar retry aman.
+        """
+        if not data:
+            raise UploadStoreError("Chunk kosong.")
+        if len(data) > self.max_chunk_bytes:
+            raise UploadStoreError(f"Chunk melebihi batas {self.max_chunk_bytes} byte.")
+        if hashlib.sha256(data).hexdigest() != (chunk_sha256 or '').lower():
+            raise UploadStoreError("Checksum chunk tidak cocok; kirim ulang chunk ini.")
+
+        part_path, _ = self._paths(upload_id)
+        with self._lock:
+            meta = self._load_meta(upload_id)
+            current = meta['offset']
+            if offset + len(data) > meta['total_size']:
+                raise UploadStoreError("Chunk melewati total_size yang dideklarasikan.")
+            if offset < current and offset + len(data) <= current:
+                with open(part_path, 'rb') as f:
+                    f.seek(offset)
+                    if f.read(len(data)) == data:
+                        return self.status(upload_id)
+            if offset != current:
+                raise UploadOffsetError(f"Offset {offset} tidak sesuai; server sudah menerima {current} byte.", current)
+            with open(part_path, 'ab') as f:
+                f.write(data)
+        return self.status(upload_id)
+
+    def _verify(self, upload_id: str, check_sha256: bool = True) -> dict:
+        part_path, _ = self._paths(upload_id)
+        meta = self._load_meta(upload_id)
+        if meta['offset'] != meta['total_size']:
+            raise UploadOffsetError(
+                f"Upload belum lengkap: {meta['offset']} dari {meta['total_size']} byte.", meta['offset'])
+        if check_sha256 and meta['sha256']:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b''):
+                    digest.update(block)
+            if digest.hexdigest() != meta['sha256']:
+                raise UploadStoreError("Checksum file tidak cocok; upload harus diulang.")
+        return meta
+
+    def verify(self, upload_id: str) -> dict:
+        """Memastikan file lengkap dan checksum-nya cocok; file tetap di upload store."""
+        with self._lock:
+            return self._verify(upload_id)
+
+    def commit(self, upload_id: str, dest_dir: str, verify: bool = True) -> str:
+        """
+        Memverifikasi file lengkap lalu memindahkannya ke dest_dir. verify=False
+        melewati hash ulang jika verify() sudah dipanggil (file lengkap tidak bisa berubah lagi).
+
+        Returns:
+            str: Path final file (nama unik + nama file asli).
+        """
+        part_path, meta_path = self._paths(upload_id)
+        with self._lock:
+            meta = self._verify(upload_id, check_sha256=verify)
+            os.makedirs(dest_dir, exist_ok=True)
+            final_path = os.path.join(dest_dir, f"{upload_id}_{meta['filename'].replace(' ', '_')}")
+            os.replace(part_path, final_path)
+            os.remove(meta_path)
+        return final_path
+
+    def restore(self, upload_id: str, committed_path: str, meta: dict):
+        """
+        Membatalkan commit: file di committed_path dikembalikan ke sesi unggah dengan
+        metadata dari status()/verify(), sehingga commit bisa diulang tanpa unggah ulang.
+        """
+        part_path, meta_path = self._paths(upload_id)
+        keys = ('upload_id', 'filename', 'total_size', 'sha256', 'created_at')
+        with self._lock:
+            os.replace(committed_path, part_path)
+            with open(meta_path, 'w') as f:
+                json.dump({key: meta[key] for key in keys}, f)
+
+    def abort(self, upload_id: str):
+        """Membatalkan sesi unggah dan menghapus datanya."""
+        part_path, meta_path = self._paths(upload_id)
+        if not os.path.exists(meta_path):
+            raise UploadNotFoundError(f"Upload '{upload_id}' tidak ditemukan.")
+        for path in (part_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def purge_stale(self):
+        """Menghapus sesi yang file .part-nya tidak bertambah lebih lama dari stale_seconds."""
+        cutoff = time.time() - self.stale_seconds
+        for name in os.listdir(self.root):
+            upload_id = name[:-len('.json')]
+            if not name.endswith('.json') or not _UPLOAD_ID_PATTERN.fullmatch(upload_id):
+                continue
+            part_path, meta_path = self._paths(upload_id)
+            try:
+                last_activity = os.path.getmtime(part_path if os.path.exists(part_path) else meta_path)
+                if last_activity < cutoff:
+                    for path in (part_path, meta_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+            except OSError:
+                pass